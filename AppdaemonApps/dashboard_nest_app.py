@@ -1,4 +1,5 @@
 import logging
+from datetime import datetime, timedelta
 from typing import Optional, Any
 import appdaemon.plugins.hass.hassapi as hass
 
@@ -13,45 +14,106 @@ class DashboardToNestHubApp(hass.Hass):
     DASHBOARD_TYPE_PC = "dashboard"
     TRANSITION_DELAY = 1
     SOUND_DELAY = 10  # 10 second delay before unmuting
+    CAST_SETTLE_TIME = 10  # Seconds a cast is left to finish before the next one
 
     def initialize(self) -> None:
         """Initialize the app and set up state listeners."""
+        # Cached states, kept current by the listeners below. Only whether the
+        # CPU sensor reports a number matters (the PC is on), not the load.
+        self.presence: Optional[str] = self.get_state(self.PRESENCE_SENSOR)
+        self.media_state: Optional[str] = self.get_state(self.MEDIA_PLAYER_ENTITY)
+        self.pc_active: bool = self.is_float(self.get_state(self.CPU_LOAD_SENSOR))
+        self.current_dashboard: Optional[str] = None
+
+        # Orchestration: the dashboard that should be shown (None = off), the
+        # one pending transition towards it and the pending unmute
+        self.target_dashboard: Optional[str] = None
+        self.transition_handle: Optional[str] = None
+        self.unmute_handle: Optional[str] = None
+        self.in_flight_until: Optional[datetime] = None  # End of the current cast's settle time
+        self.dashboard_known = False  # Nothing is known to be shown before the first transition
+
         self.listen_state(self.handle_presence_change, self.PRESENCE_SENSOR)
         self.listen_state(self.handle_cpu_load_change, self.CPU_LOAD_SENSOR)
-        self.cpu_load: Optional[str] = None
-        self.current_dashboard: Optional[str] = None
+        self.listen_state(self.handle_media_player_change, self.MEDIA_PLAYER_ENTITY)
 
     def handle_cpu_load_change(self, entity: str, attribute: str,
                                old: str, new: str, kwargs: dict) -> None:
-        """Handle changes in CPU load and trigger dashboard update if needed."""
-        self.cpu_load = new
-        if self.get_state(self.PRESENCE_SENSOR) == "on":
-            # Switch dashboard based on CPU load state
-            desired_dashboard = (self.DASHBOARD_TYPE_PC
-                                 if self.is_float(new)
-                                 else self.DASHBOARD_TYPE_DEFAULT)
-
-            if (not self.is_casting() and
-                    self.current_dashboard != desired_dashboard):
-                self.log(
-                    f"CPU load changed to {new}, switching to {desired_dashboard}")
-                self.run_in(self.activate_dashboard, self.TRANSITION_DELAY)
+        """Switch dashboard when the CPU sensor goes between numeric and unavailable."""
+        pc_active = self.is_float(new)
+        if pc_active == self.pc_active:
+            return  # Load update without an availability edge
+        self.pc_active = pc_active
+
+        if self.presence == "on":
+            self.log(f"CPU load changed to {new}, switching to {self.desired_dashboard()}")
+            self.request_dashboard(self.desired_dashboard())
+
+    def handle_media_player_change(self, entity: str, attribute: str,
+                                   old: str, new: str, kwargs: dict) -> None:
+        """Cache the media player state."""
+        self.media_state = new
 
     def handle_presence_change(self, entity: str, attribute: str,
                                old: str, new: str, kwargs: dict) -> None:
         """Handle presence sensor state changes."""
+        self.presence = new
         if new == "on":
-            self.run_in(self.activate_dashboard, self.TRANSITION_DELAY)
+            self.request_dashboard(self.desired_dashboard())
         elif new == "off":
-            self.run_in(self.deactivate_dashboard, self.TRANSITION_DELAY)
+            self.request_dashboard(None)
+
+    def request_dashboard(self, dashboard: Optional[str]) -> None:
+        """
+        Set the dashboard that should be shown and schedule the transition to it.
+
+        A transition that is still pending is replaced, so only the latest
+        request is cast. While a cast is in flight the transition waits for
+        it to settle.
+
+        Args:
+            dashboard: DASHBOARD_TYPE_PC, DASHBOARD_TYPE_DEFAULT or None for off
+        """
+        self.target_dashboard = dashboard
+        if self.transition_handle is not None:
+            self.cancel_timer(self.transition_handle)
+        delay = self.TRANSITION_DELAY
+        if self.in_flight_until is not None:
+            delay = max(delay, (self.in_flight_until - self.get_now()).total_seconds())
+        self.transition_handle = self.run_in(self.apply_target_dashboard, delay)
+
+    def apply_target_dashboard(self, kwargs: dict) -> None:
+        """Run the transition to the target dashboard unless it is already shown."""
+        self.transition_handle = None
+        target = self.target_dashboard
+        if self.dashboard_known and target == self.current_dashboard:
+            return
+        if target is None:
+            self.deactivate_dashboard()
+        else:
+            self.activate_dashboard(target)
+
+    def desired_dashboard(self) -> str:
+        """Get the dashboard to show: the PC dashboard while the PC is on."""
+        return self.DASHBOARD_TYPE_PC if self.pc_active else self.DASHBOARD_TYPE_DEFAULT
 
     def is_casting(self) -> bool:
         """Check if the media player is currently casting something."""
-        state = self.get_state(self.MEDIA_PLAYER_ENTITY)
-        return state not in ["off", "idle", None]
+        return self.media_state not in ["off", "idle", None]
+
+    def mute_player(self) -> None:
+        """Mute the media player (unless still muted from an earlier transition) and (re)schedule the unmute."""
+        if self.unmute_handle is not None:
+            self.cancel_timer(self.unmute_handle)
+        else:
+            self.call_service("media_player/volume_mute",
+                              entity_id=self.MEDIA_PLAYER_ENTITY,
+                              is_volume_muted=True)
+        self.unmute_handle = self.run_in(self.unmute_player, self.SOUND_DELAY)
 
     def unmute_player(self, kwargs: dict) -> None:
         """Unmute the media player."""
+        self.unmute_handle = None
         try:
             self.call_service("media_player/volume_mute",
                               entity_id=self.MEDIA_PLAYER_ENTITY,
@@ -59,52 +121,43 @@ class DashboardToNestHubApp(hass.Hass):
         except Exception as e:
             self.log(f"Error unmuting player: {str(e)}", level="ERROR")
 
-    def activate_dashboard(self, kwargs: dict) -> None:
-        """Activate appropriate dashboard based on CPU load state."""
+    def activate_dashboard(self, dashboard: str) -> None:
+        """Cast a dashboard (DASHBOARD_TYPE_PC or DASHBOARD_TYPE_DEFAULT)."""
         try:
-            # Skip if already casting something
-            if self.is_casting():
+            # Skip if something else is being cast
+            if self.is_casting() and self.current_dashboard is None:
                 self.log(
                     "Media player is currently casting, skipping dashboard activation")
                 return
 
-            self.call_service("media_player/volume_mute",
-                              entity_id=self.MEDIA_PLAYER_ENTITY,
-                              is_volume_muted=True)
+            self.mute_player()
 
-            if self.cpu_load and self.is_float(self.cpu_load):
-                if self.current_dashboard != self.DASHBOARD_TYPE_PC:
-                    self.call_service("media_player/turn_off",
-                                      entity_id=self.MEDIA_PLAYER_ENTITY)
-                    self.call_service("shell_command/cast_dashboard")
-                    self.current_dashboard = self.DASHBOARD_TYPE_PC
+            if dashboard == self.DASHBOARD_TYPE_PC:
+                self.call_service("media_player/turn_off",
+                                  entity_id=self.MEDIA_PLAYER_ENTITY)
+                self.call_service("shell_command/cast_dashboard")
             else:
-                if self.current_dashboard != self.DASHBOARD_TYPE_DEFAULT:
-                    self.call_service("shell_command/stop_catt")
-                    self.call_service(
-                        "script/cast_lovelace_dashboard_to_nest_hub")
-                    self.current_dashboard = self.DASHBOARD_TYPE_DEFAULT
-
-            # Schedule unmute after delay
-            self.run_in(self.unmute_player, self.SOUND_DELAY)
+                self.call_service("shell_command/stop_catt")
+                self.call_service(
+                    "script/cast_lovelace_dashboard_to_nest_hub")
+            self.current_dashboard = dashboard
+            self.dashboard_known = True
+            self.in_flight_until = self.get_now() + timedelta(seconds=self.CAST_SETTLE_TIME)
 
         except Exception as e:
             self.log(f"Error activating dashboard: {str(e)}", level="ERROR")
 
-    def deactivate_dashboard(self, kwargs: dict) -> None:
+    def deactivate_dashboard(self) -> None:
         """Turn off the display and stop casting."""
         try:
-            self.call_service("media_player/volume_mute",
-                              entity_id=self.MEDIA_PLAYER_ENTITY,
-                              is_volume_muted=True)
+            self.mute_player()
 
             self.call_service("media_player/turn_off",
                               entity_id=self.MEDIA_PLAYER_ENTITY)
             self.call_service("shell_command/stop_catt")
             self.current_dashboard = None
-
-            # Schedule unmute after delay
-            self.run_in(self.unmute_player, self.SOUND_DELAY)
+            self.dashboard_known = True
+            self.in_flight_until = self.get_now() + timedelta(seconds=self.CAST_SETTLE_TIME)
 
         except Exception as e:
             self.log(f"Error deactivating dashboard: {str(e)}", level="ERROR")
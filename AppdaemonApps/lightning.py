@@ -1,5 +1,6 @@
 import appdaemon.plugins.hass.hassapi as hass
-from datetime import datetime
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
 
 # Light settings constants
 DEFAULT_SETTINGS = {
@@ -10,12 +11,511 @@ DEFAULT_SETTINGS = {
     "focus": {"brightness": 255, "color_temp": 250}
 }
 
+# Default mode settings by time of day: (start hour, DEFAULT_SETTINGS key),
+# each applying until the next start; the last one wraps past midnight
+TIME_OF_DAY_SETTINGS = [
+    (5, "early_morning"),
+    (8, "morning"),
+    (12, "afternoon"),
+    (20, "night")
+]
+TIME_OF_DAY_HOURS = [hour for hour, _ in TIME_OF_DAY_SETTINGS]
+
+# Transition (seconds) used when the settings change at a boundary
+TIME_OF_DAY_TRANSITION = 30
+
+# Light attributes whose changes matter to the app; other attribute
+# updates (e.g. group members reporting) are ignored
+LIGHT_ATTRIBUTES = ("brightness", "color_mode", "color_temp", "rgb_color", "hs_color", "xy_color")
+
+# Quiet time (seconds) before the focus light is restored after main light changes
+FOCUS_REACTIVATE_DELAY = 1
+
+# Light mirroring: minimum seconds between updates of a mirrored light and
+# the smallest changes worth sending
+MIRROR_DEFAULTS = {
+    "interval": 2,
+    "brightness_threshold": 5,
+    "color_temp_threshold": 10,
+    "color_threshold": 10,
+    "transition": 1
+}
+
 COLORS = {
     "christmas_red": [255, 0, 0],
     "christmas_green": [0, 255, 0],
     "night_blue": [0, 0, 255]
 }
 
+# Default Christmas pattern: even/odd lights alternate red and green. Groups
+# are app args holding light lists; each step gives one color per group.
+CHRISTMAS_PATTERN = {
+    "groups": ["christmas_lights_even", "christmas_lights_odd"],
+    "steps": [["christmas_red", "christmas_green"],
+              ["christmas_green", "christmas_red"]],
+    "brightness": 150,
+    "transition": 1
+}
+
+# Input entities (app arg names) kept in the local state snapshot
+INPUT_ENTITIES = [
+    "presence_sensor",
+    "presence_mode_switch",
+    "night_mode_switch",
+    "christmas_mode_switch",
+    "focus_mode_switch",
+    "phone_state_sensor",
+    "charger_type_sensor"
+]
+
+NIGHT_LIGHT_PHONE_STATES = ["okänd", "offhook"]
+
+
+# Light states used by the mode table; "state" plus the turn_on attributes
+LIGHT_OFF = {"state": "off"}
+NIGHT_LIGHT = {"state": "on", **DEFAULT_SETTINGS["night"]}
+BEDROOM_NIGHT_LIGHT = {"state": "on", "brightness": 102, "color_temp": 454}
+FOCUS_LIGHT = {"state": "on", **DEFAULT_SETTINGS["focus"]}
+TIME_OF_DAY = "time_of_day"  # resolved through get_time_based_settings
+
+
+def presence_allows_lights(snapshot):
+    """Check whether lights may be on: presence mode disabled or presence detected."""
+    return (snapshot.get("presence_mode_switch") != "on"
+            or snapshot.get("presence_sensor") == "on")
+
+
+def night_light_wanted(snapshot):
+    """Check whether the bedroom night light should be on (phone in use or charging over USB)."""
+    return (snapshot.get("phone_state_sensor") in NIGHT_LIGHT_PHONE_STATES
+            or snapshot.get("charger_type_sensor") == "usb")
+
+
+def bedroom_light_wanted(snapshot):
+    """Bedroom night light outside night mode proper: night mode on, presence ignored."""
+    return snapshot.get("night_mode_switch") == "on" and night_light_wanted(snapshot)
+
+
+# Mode table. The mode with the highest priority whose condition holds is
+# active: "when" is the switch (app arg) that enables it, "absent" for the
+# presence check or None for always. "lights" lists (role, state[, condition])
+# entries, later entries overriding earlier ones for the same light; roles
+# are resolved to entities by the app. "enter"/"exit" name app methods run
+# on mode changes, "transitions" methods run only when changing to a given
+# mode (they return lights they have set themselves) and "keep" lists roles
+# left as they are when changing to a given mode. Lights set by a transition
+# method or kept are left alone until the next mode change or time-of-day
+# boundary.
+MODES = {
+    "off": {
+        "priority": 4,
+        "when": "absent",
+        "lights": [("main", LIGHT_OFF), ("focus", LIGHT_OFF),
+                   ("bedroom", BEDROOM_NIGHT_LIGHT, bedroom_light_wanted)],
+        "transition": 1
+    },
+    "night": {
+        "priority": 3,
+        "when": "night_mode_switch",
+        "lights": [("all", LIGHT_OFF), ("night", NIGHT_LIGHT),
+                   ("bedroom", BEDROOM_NIGHT_LIGHT, night_light_wanted)],
+        "transition": 1
+    },
+    "christmas": {
+        "priority": 2,
+        "when": "christmas_mode_switch",
+        "lights": [],
+        "enter": "_start_christmas_pattern",
+        "exit": "_cleanup_christmas_mode"
+    },
+    "focus": {
+        "priority": 1,
+        "when": "focus_mode_switch",
+        "lights": [("focus", FOCUS_LIGHT)],
+        "exit": "_exit_focus_mode",
+        "transitions": {"default": "copy_reference_light_state"},
+        "keep": {"default": ["main"]}
+    },
+    "default": {
+        "priority": 0,
+        "when": None,
+        "lights": [("main", TIME_OF_DAY)]
+    }
+}
+
+MODE_ORDER = sorted(MODES, key=lambda mode: MODES[mode]["priority"], reverse=True)
+
+
+def decide_mode(snapshot, ignore_presence=False):
+    """
+    Decide which mode to run from a state snapshot.
+
+    Args:
+        snapshot: Input entity states keyed by app arg name
+        ignore_presence: Decide as if presence mode was disabled
+
+    Returns:
+        Name of the active mode in MODES
+    """
+    for mode in MODE_ORDER:
+        when = MODES[mode]["when"]
+        if when is None:
+            return mode
+        if when == "absent":
+            if not ignore_presence and not presence_allows_lights(snapshot):
+                return mode
+        elif snapshot.get(when) == "on":
+            return mode
+    return "default"
+
+
+def get_time_based_settings(hour):
+    """Get light settings for an hour of the day."""
+    index = bisect_right(TIME_OF_DAY_HOURS, hour) - 1
+    return DEFAULT_SETTINGS[TIME_OF_DAY_SETTINGS[index][1]]
+
+
+def desired_light_states(mode, lights, snapshot, hour):
+    """
+    Compute the light states a mode asks for.
+
+    Args:
+        mode: Mode name in MODES
+        lights: Entity IDs per light role
+        snapshot: Input entity states keyed by app arg name
+        hour: Current hour, for time-of-day settings
+
+    Returns:
+        Dictionary of entity ID to state dict; lights the mode does not
+        control are left out
+    """
+    desired = {}
+    for entry in MODES[mode]["lights"]:
+        role, state = entry[0], entry[1]
+        if len(entry) > 2 and not entry[2](snapshot):
+            continue
+        if state == TIME_OF_DAY:
+            state = {"state": "on", **get_time_based_settings(hour)}
+        for light in lights[role]:
+            desired[light] = state
+    return desired
+
+
+class LightPattern:
+    """
+    Repeating multi-color sequence over groups of lights.
+
+    Only the step index is kept between steps, so a pattern can run for
+    weeks without growing. Each step is a single scene.apply call that sets
+    every group to its color at once.
+
+    Args:
+        groups: Light entity lists, one per group
+        steps: Sequence of steps, each a color (name in COLORS or RGB list) per group
+        brightness: Brightness for every light
+        transition: Transition in seconds for every step
+    """
+
+    def __init__(self, groups, steps, brightness=150, transition=1):
+        if not steps or any(len(step) != len(groups) for step in steps):
+            raise ValueError("every pattern step needs one color per group")
+        # Precompute the scene entities of every step once
+        self.scenes = []
+        for step in steps:
+            entities = {}
+            for lights, color in zip(groups, step):
+                rgb_color = list(COLORS[color] if isinstance(color, str) else color)
+                for light in lights:
+                    entities[light] = {"state": "on", "rgb_color": rgb_color,
+                                       "brightness": brightness}
+            self.scenes.append(entities)
+        self.transition = transition
+        self.index = 0
+
+    def next_step(self):
+        """Get the scene.apply data of the next step and advance the sequence."""
+        entities = self.scenes[self.index]
+        self.index = (self.index + 1) % len(self.scenes)
+        return {"entities": entities, "transition": self.transition}
+
+
+class LightBatch:
+    """
+    Light states collected during one decision cycle, sent as few calls as possible.
+
+    Lights with identical state, attributes and transition share one
+    light.turn_on/turn_off call. Where every member of a known light group
+    is in the same call, the group entity is targeted instead of its members.
+
+    Args:
+        groups: Group entity ID to member entity IDs
+    """
+
+    def __init__(self, groups=None):
+        self.groups = groups or {}
+        self.states = {}
+
+    def __len__(self):
+        return len(self.states)
+
+    def set(self, light, state, transition=None):
+        """Set the state of a light; a later set for the same light wins."""
+        self.states[light] = (state, transition)
+
+    def calls(self):
+        """
+        Get the service calls for the collected states.
+
+        Returns:
+            List of (service, data) tuples, turn_off calls first
+        """
+        buckets = {}
+        for light, (state, transition) in self.states.items():
+            key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                               for name, value in state.items()))
+            if state["state"] != "off":
+                key += (("transition", transition),)
+            buckets.setdefault(key, []).append(light)
+
+        calls = []
+        for key in sorted(buckets, key=lambda key: dict(key)["state"] != "off"):
+            data = {name: list(value) if isinstance(value, tuple) else value
+                    for name, value in key if value is not None}
+            service = "light/turn_off" if data.pop("state") == "off" else "light/turn_on"
+            data["entity_id"] = self._targets(buckets[key])
+            calls.append((service, data))
+        return calls
+
+    def _targets(self, lights):
+        targets = list(lights)
+        for group, members in self.groups.items():
+            if members and all(member in targets for member in members):
+                first = targets.index(members[0])
+                targets = [light for light in targets if light not in members]
+                targets.insert(min(first, len(targets)), group)
+        return targets[0] if len(targets) == 1 else targets
+
+    def flush(self, call_service):
+        """Send the collected states through call_service and clear the batch."""
+        calls = self.calls()
+        self.states = {}
+        for service, data in calls:
+            call_service(service, **data)
+        return len(calls)
+
+
+class Debouncer:
+    """
+    Calls a callback once triggers have been quiet for a delay.
+
+    A burst of triggers costs at most a few timers: the pending timer is
+    not cancelled per trigger, it checks on expiry whether newer triggers
+    came in and, if so, waits out the rest of the quiet time.
+
+    Args:
+        app: App used for get_now/run_in/cancel_timer
+        callback: Called without arguments after the quiet time
+        delay: Quiet time in seconds
+    """
+
+    def __init__(self, app, callback, delay):
+        self.app = app
+        self.callback = callback
+        self.delay = delay
+        self.handle = None
+        self.last_trigger = None
+
+    def trigger(self):
+        """Register a trigger, starting the quiet time over."""
+        self.last_trigger = self.app.get_now()
+        if self.handle is None:
+            self.handle = self.app.run_in(self._expire, self.delay)
+
+    def cancel(self):
+        """Drop pending triggers."""
+        if self.handle is not None:
+            self.app.cancel_timer(self.handle)
+            self.handle = None
+
+    def _expire(self, kwargs):
+        elapsed = (self.app.get_now() - self.last_trigger).total_seconds()
+        remaining = self.delay - elapsed
+        if remaining > 0:
+            self.handle = self.app.run_in(self._expire, remaining)
+            return
+        self.handle = None
+        self.callback()
+
+
+def mirrored_state(source):
+    """
+    Get the state a light needs to look like another one.
+
+    Args:
+        source: Full state dict of the light to copy (or None)
+
+    Returns:
+        State dict with brightness and the color of the source's color mode
+    """
+    if not source or source.get("state") != "on":
+        return LIGHT_OFF
+    attributes = source.get("attributes") or {}
+    state = {"state": "on"}
+
+    # Copy basic attributes (HA reports None while a light turns on or off)
+    if attributes.get("brightness") is not None:
+        state["brightness"] = attributes["brightness"]
+
+    # Handle different color modes
+    color_mode = attributes.get("color_mode")
+    if color_mode == "color_temp" and attributes.get("color_temp") is not None:
+        state["color_temp"] = attributes["color_temp"]
+    elif color_mode in ["rgb", "xy"] and attributes.get("rgb_color") is not None:
+        state["rgb_color"] = list(attributes["rgb_color"])
+    return state
+
+
+def mirror_needed(sent, state, options):
+    """
+    Check whether a mirrored state differs enough from the one last sent.
+
+    Args:
+        sent: State last sent to the mirroring light (or None)
+        state: New mirrored state
+        options: Thresholds as in MIRROR_DEFAULTS
+
+    Returns:
+        True on a state or color mode change, or a change over a threshold
+    """
+    if sent is None or sent.keys() != state.keys() or sent["state"] != state["state"]:
+        return True
+    if "brightness" in state and abs(state["brightness"] - sent["brightness"]) >= options["brightness_threshold"]:
+        return True
+    if "color_temp" in state and abs(state["color_temp"] - sent["color_temp"]) >= options["color_temp_threshold"]:
+        return True
+    if "rgb_color" in state:
+        return any(abs(new - old) >= options["color_threshold"]
+                   for new, old in zip(state["rgb_color"], sent["rgb_color"]))
+    return False
+
+
+class LightMirror:
+    """
+    Makes a target light follow a source light's brightness and color.
+
+    The source's state comes from the app's state listener; nothing is
+    fetched. Changes under the thresholds are skipped, and changes coming
+    faster than the interval are coalesced into one update when it ends.
+
+    Args:
+        app: Lightning app (clock, timers and set_light)
+        source: Light to copy
+        target: Light to update
+        modes: Modes in which the target follows continuously (None: all)
+        options: Overrides of MIRROR_DEFAULTS
+    """
+
+    def __init__(self, app, source, target, modes=None, **options):
+        self.app = app
+        self.source = source
+        self.target = target
+        self.modes = modes
+        self.options = {**MIRROR_DEFAULTS, **options}
+        self.source_state = None
+        self.sent = None
+        self.last_sent = None
+        self.handle = None
+
+    def active(self, mode):
+        return self.modes is None or mode in self.modes
+
+    def source_changed(self, state, mode):
+        """Store a new source state and follow it if the mirror is active in mode."""
+        self.source_state = state
+        if self.active(mode):
+            self.sync()
+
+    def sync(self):
+        """Update the target now, or when the rate limit allows."""
+        if self.handle is not None:
+            return  # The pending update picks up the latest state
+        if self.last_sent is not None:
+            elapsed = (self.app.get_now() - self.last_sent).total_seconds()
+            remaining = self.options["interval"] - elapsed
+            if remaining > 0:
+                self.handle = self.app.run_in(self._rate_limit_over, remaining)
+                return
+        state = mirrored_state(self.source_state)
+        if mirror_needed(self.sent, state, self.options):
+            self.app.set_light(self.target, state, self.options["transition"])
+            self.mark_sent(state)
+
+    def mark_sent(self, state):
+        """Record a state sent to the target (also when sent by someone else)."""
+        self.sent = state
+        self.last_sent = self.app.get_now()
+
+    def cancel(self):
+        """Drop a pending rate-limited update."""
+        if self.handle is not None:
+            self.app.cancel_timer(self.handle)
+            self.handle = None
+
+    def _rate_limit_over(self, kwargs):
+        self.handle = None
+        if self.active(self.app.mode):
+            self.sync()
+
+
+def light_changed(old, new, attributes=LIGHT_ATTRIBUTES):
+    """
+    Check whether a light's state or one of the given attributes changed.
+
+    Args:
+        old: Previous full state dict (or None)
+        new: New full state dict (or None)
+        attributes: Attribute names to compare
+
+    Returns:
+        True if the state or any of the attributes differ
+    """
+    old = old or {}
+    new = new or {}
+    if old.get("state") != new.get("state"):
+        return True
+    old_attributes = old.get("attributes") or {}
+    new_attributes = new.get("attributes") or {}
+    return any(old_attributes.get(name) != new_attributes.get(name) for name in attributes)
+
+
+def _normalize(value):
+    return list(value) if isinstance(value, tuple) else value
+
+
+def light_matches(state, current):
+    """
+    Check whether a light's reported state still matches a state we applied.
+
+    Args:
+        state: State dict as applied ("state" plus attributes)
+        current: Full state dict of the light (state and attributes)
+
+    Returns:
+        True if the state and every applied attribute match
+    """
+    if not current or current.get("state") != state["state"]:
+        return False
+    if state["state"] == "off":
+        return True
+    attributes = current.get("attributes") or {}
+    return all(_normalize(attributes.get(key)) == _normalize(value)
+               for key, value in state.items() if key != "state")
+
+
+def diff_light_states(desired, applied):
+    """Get the desired light states that differ from the last applied ones."""
+    return {light: state for light, state in desired.items() if applied.get(light) != state}
+
 
 class Lightning(hass.Hass):
     """App to control lighting based on presence and modes."""
@@ -25,44 +525,73 @@ class Lightning(hass.Hass):
         self.log("Lightning app initializing")
 
         # Initialize states
-        self.mode = "default"
-        self.running = False
-        self.presence_enabled = self.get_state(
-            self.args["presence_mode_switch"]) == "on"
-        self.pattern_handle = None  # Add this line
-        self.main_light_timer = None  # Add this line
-        self.pattern_handles = []  # Add this line to track all pattern timers
-
-        # Add a list of managed lights (lights that should be turned off)
-        self.managed_lights = [
-            self.args["main_light"],
-            self.args["focus_light"]
+        self.mode = None  # Set by the first check_and_set_mode
+        # Local snapshot of the input entities, kept current by _input_changed
+        self.snapshot = {key: self.get_state(self.args[key]) for key in INPUT_ENTITIES}
+        # Last state sent per light, dropped when the light reports something else
+        self.applied = {}
+        # Lights left alone until the next mode change or time-of-day boundary
+        self.kept = set()
+        self.pattern = None  # Running LightPattern, if any
+        self.pattern_handle = None  # Its repeating timer
+        self.focus_debouncer = Debouncer(
+            self, self.reactivate_focus_light, FOCUS_REACTIVATE_DELAY)
+
+        # Entities per light role of the mode table; a main light group is
+        # expanded to its members so states are tracked per light
+        main_members = self.get_state(self.args["main_light"], attribute="entity_id")
+        self.light_groups = {self.args["main_light"]: list(main_members)} if main_members else {}
+        self.lights = {
+            "main": list(main_members or [self.args["main_light"]]),
+            "focus": [self.args["focus_light"]],
+            "night": list(self.args["presence_night_lights"]),
+            "bedroom": [self.args["bedroom_night_light"]],
+            "all": list(self.args["all_lights"])
+        }
+
+        # Mirrors: the reference light feeds the focus light copy when focus
+        # mode ends; "mirrors" from the args follow their source continuously
+        self.reference_mirror = LightMirror(
+            self, self.args["reference_light"], self.args["focus_light"], modes=[])
+        self.mirrors = [self.reference_mirror] + [
+            LightMirror(self, mirror["source"], mirror["target"], mirror.get("modes"),
+                        **{key: value for key, value in mirror.items()
+                           if key in MIRROR_DEFAULTS})
+            for mirror in self.args.get("mirrors", [])
         ]
+        for mirror in self.mirrors:
+            mirror.source_state = self.get_state(mirror.source, attribute="all")
 
         # Subscribe to state changes
         self._setup_listeners()
 
+        # One daily timer per time-of-day boundary for default mode
+        for hour, _ in TIME_OF_DAY_SETTINGS:
+            self.run_daily(self.time_of_day_boundary, time(hour, 0))
+
         # Check initial state
         self.check_and_set_mode()
 
         self.log("Lightning app initialized")
 
+    @property
+    def presence_enabled(self):
+        return self.snapshot["presence_mode_switch"] == "on"
+
     def _setup_listeners(self):
         """Set up all state listeners."""
-        # Core state changes
-        self.listen_state(self.presence_change, self.args["presence_sensor"])
-        self.listen_state(self.presence_mode_change,
-                          self.args["presence_mode_switch"])
-
-        # Mode changes
-        for switch in ["night_mode_switch", "christmas_mode_switch", "focus_mode_switch"]:
-            self.listen_state(self.mode_change, self.args[switch])
-
-        # Combined phone and charger state changes for night mode
-        self.listen_state(self.check_night_conditions,
-                          self.args["phone_state_sensor"])
-        self.listen_state(self.check_night_conditions,
-                          self.args["charger_type_sensor"])
+        # Input entities: one listener each updates the snapshot, then the handler runs
+        self.input_handlers = {
+            "presence_sensor": self.presence_change,
+            "presence_mode_switch": self.presence_mode_change,
+            "night_mode_switch": self.mode_change,
+            "christmas_mode_switch": self.mode_change,
+            "focus_mode_switch": self.mode_change,
+            "phone_state_sensor": self.check_night_conditions,
+            "charger_type_sensor": self.check_night_conditions
+        }
+        for key in INPUT_ENTITIES:
+            self.listen_state(self._input_changed, self.args[key], input_key=key)
 
         # Replace multiple attribute listeners with single state listener
         self.listen_state(
@@ -71,289 +600,222 @@ class Lightning(hass.Hass):
             attribute="all"
         )
 
+        # Mirror sources, one listener per light
+        for source in sorted({mirror.source for mirror in self.mirrors}):
+            self.listen_state(self._mirror_source_changed, source, attribute="all")
+
+        # Controlled lights, to notice when they no longer match the applied state
+        controlled = set()
+        for entities in self.lights.values():
+            controlled.update(entities)
+        for light in sorted(controlled):
+            self.listen_state(self._light_changed, light, attribute="all")
+
+    def _input_changed(self, entity, attribute, old, new, kwargs):
+        """Update the snapshot with an input entity change and run its handler."""
+        key = kwargs["input_key"]
+        self.snapshot[key] = new
+        self.input_handlers[key](entity, attribute, old, new, kwargs)
+
+    def _light_changed(self, entity, attribute, old, new, kwargs):
+        """Forget the applied state of a light that was changed elsewhere."""
+        state = self.applied.get(entity)
+        if state is not None and light_changed(old, new) and not light_matches(state, new):
+            del self.applied[entity]
+
+    def _mirror_source_changed(self, entity, attribute, old, new, kwargs):
+        """Pass a mirror source's new state to the mirrors following it."""
+        if not light_changed(old, new):
+            return
+        for mirror in self.mirrors:
+            if mirror.source == entity:
+                mirror.source_changed(new, self.mode)
+
+    def set_light(self, light, state, transition=None):
+        """Send one light state outside the mode table (the light is no longer tracked as applied)."""
+        batch = LightBatch()
+        batch.set(light, state, transition)
+        batch.flush(self.call_service)
+        self.applied.pop(light, None)
+
     def handle_main_light_change(self, entity, attribute, old, new, kwargs):
         """Handle changes to main light when in focus mode with debouncing."""
-        if self.mode == "focus" and self.get_state(self.args["focus_mode_switch"]) == "on":
-            # Cancel any pending timer
-            if self.main_light_timer is not None:
-                self.cancel_timer(self.main_light_timer)
-
-            # Set new timer
-            self.main_light_timer = self.run_in(self.reactivate_focus_light, 1)
+        if self.mode != "focus" or self.snapshot["focus_mode_switch"] != "on":
+            return
+        if light_changed(old, new):
+            self.focus_debouncer.trigger()
 
-    def reactivate_focus_light(self, kwargs):
+    def reactivate_focus_light(self):
         """Reactivate focus light with proper settings."""
-        self.main_light_timer = None  # Clear the timer reference
-        self.turn_on(
-            self.args["focus_light"],
-            brightness=DEFAULT_SETTINGS["focus"]["brightness"],
-            color_temp=DEFAULT_SETTINGS["focus"]["color_temp"]
-        )
+        if self.mode != "focus":
+            return
+        # The main light change may have reached the focus light; resend it
+        self.applied.pop(self.args["focus_light"], None)
+        self.apply_mode_lights()
+
+    def _exit_focus_mode(self):
+        """Drop a pending focus light reactivation."""
+        self.focus_debouncer.cancel()
+
+    def time_of_day_boundary(self, kwargs):
+        """Move default mode to the next time-of-day settings with a smooth transition."""
+        if self.mode != "default" or not presence_allows_lights(self.snapshot):
+            return
+        self.kept = set()
+        self.apply_mode_lights(
+            transition=self.args.get("time_of_day_transition", TIME_OF_DAY_TRANSITION))
 
     def presence_change(self, entity, attribute, old, new, kwargs):
         """Handle presence changes."""
         if not self.presence_enabled:
             return  # Don't react to presence changes if presence mode is disabled
 
-        if new == "on":
-            self.check_and_set_mode()
-        elif self.presence_enabled:  # Only turn off lights if presence mode is enabled
-            self.turn_off_all()
+        self.check_and_set_mode()
 
     def presence_mode_change(self, entity, attribute, old, new, kwargs):
         """Handle presence mode toggle."""
-        self.presence_enabled = (new == "on")
         if new == "on":
             self.presence_change(self.args["presence_sensor"], None,
-                                 None, self.get_state(self.args["presence_sensor"]), None)
+                                 None, self.snapshot["presence_sensor"], None)
         else:
             # When presence mode is disabled, check modes without presence requirement
             self.check_and_set_mode(ignore_presence=True)
 
     def mode_change(self, entity, attribute, old, new, kwargs):
         """Handle mode changes."""
-        if new == "off":
-            # When any mode is disabled
-            if entity == self.args["focus_mode_switch"]:
-                self.copy_reference_light_state()
-                return
-
-            if entity == self.args["christmas_mode_switch"]:
-                self._cleanup_christmas_mode()
-
-            # Only consider presence if presence mode is enabled
-            if not self.presence_enabled or self.get_state(self.args["presence_sensor"]) == "on":
-                self.activate_default_mode()
-        else:
-            self.check_and_set_mode()
-
-    def copy_reference_light_state(self):
-        """Copy state from reference light to main light."""
-        try:
-            reference_state = self.get_state(
-                self.args["reference_light"], attribute="all")
-
-            if not reference_state or reference_state.get('state') != 'on':
-                self.turn_off(self.args["focus_light"])
-                return
-
-            attributes = reference_state.get('attributes', {})
-            settings = {}
-
-            # Copy basic attributes
-            if 'brightness' in attributes:
-                settings['brightness'] = attributes['brightness']
-
-            # Handle different color modes
-            color_mode = attributes.get('color_mode')
-            if color_mode == 'color_temp' and 'color_temp' in attributes:
-                settings['color_temp'] = attributes['color_temp']
-            elif color_mode in ['rgb', 'xy'] and 'rgb_color' in attributes:
-                settings['rgb_color'] = attributes['rgb_color']
+        self.check_and_set_mode()
 
-            # Apply settings to main light
-            self.call_service(
-                "light/turn_on",
-                entity_id=self.args["focus_light"],
-                transition=1,
-                **settings
-            )
+    def copy_reference_light_state(self, batch):
+        """
+        Copy state from reference light to the focus light.
 
-            self.log(f"Copied reference light state: {settings}")
+        Args:
+            batch: LightBatch of the current transition
 
-        except Exception as e:
-            self.log(
-                f"Failed to copy reference light state: {str(e)}", level="ERROR")
+        Returns:
+            Lights that were set
+        """
+        state = mirrored_state(self.reference_mirror.source_state)
+        batch.set(self.args["focus_light"], state, transition=1)
+        self.reference_mirror.mark_sent(state)
+        self.log(f"Copied reference light state: {state}")
+        return {self.args["focus_light"]}
 
     def check_and_set_mode(self, ignore_presence=False):
         """Check current states and set appropriate mode."""
-        # Skip presence check if presence mode is disabled
-        if self.presence_enabled and not ignore_presence:
-            if self.get_state(self.args["presence_sensor"]) != "on":
-                self.turn_off_all()
-                return
-
-        # Activate appropriate mode
-        if self.get_state(self.args["night_mode_switch"]) == "on":
-            self.activate_night_mode()
-        elif self.get_state(self.args["christmas_mode_switch"]) == "on":
-            self.activate_christmas_mode()
-        elif self.get_state(self.args["focus_mode_switch"]) == "on":
-            self.activate_focus_mode()
-        else:
-            self.activate_default_mode()
-
-    def activate_christmas_mode(self):
-        """Activate Christmas mode pattern."""
-        self.mode = "christmas"
-        self.running = True
-
-        # Cancel any existing pattern
-        if self.pattern_handle:
-            self.cancel_timer(self.pattern_handle)
+        self.set_mode(decide_mode(self.snapshot, ignore_presence))
+
+    def set_mode(self, mode):
+        """
+        Switch to a mode and apply the light states that changed.
+
+        Exit, transition and entry actions from MODES run only when the
+        mode actually changes; the light states are diffed either way,
+        leaving out the lights the last mode change kept.
+        """
+        previous = self.mode
+        if mode == previous:
+            self.apply_mode_lights()
+            return
 
-        # Start with red/green pattern
-        self._run_christmas_pattern("red")
+        batch = LightBatch(self.light_groups)
+        handled = set()
+        kept = set()
+        if previous is not None:
+            exit_action = MODES[previous].get("exit")
+            if exit_action:
+                getattr(self, exit_action)()
+            transition_action = MODES[previous].get("transitions", {}).get(mode)
+            if transition_action:
+                handled = getattr(self, transition_action)(batch) or set()
+            for role in MODES[previous].get("keep", {}).get(mode, ()):
+                kept.update(self.lights[role])
+
+        self.mode = mode
+        self.log(f"Mode: {previous} -> {mode}", level="DEBUG")
+        for mirror in self.mirrors:
+            if not mirror.active(mode):
+                mirror.cancel()
+        for light in handled:
+            self.applied.pop(light, None)
+        self.kept = kept | handled
+        self.apply_mode_lights(batch)
+
+        enter_action = MODES[mode].get("enter")
+        if enter_action:
+            getattr(self, enter_action)()
+
+    def apply_mode_lights(self, batch=None, transition=None, only=None):
+        """
+        Send the current mode's light states that differ from the applied ones.
+
+        Kept lights (see set_mode) are left out of the diff.
+
+        Args:
+            batch: LightBatch to add to (states already in it are sent too)
+            transition: Transition overriding the mode's own
+            only: Lights to limit the diff to (None: every light of the mode)
+        """
+        if batch is None:
+            batch = LightBatch(self.light_groups)
+        desired = desired_light_states(self.mode, self.lights, self.snapshot, self.get_now().hour)
+        if only is not None:
+            desired = {light: desired[light] for light in only if light in desired}
+        for light in self.kept:
+            desired.pop(light, None)
+        changes = diff_light_states(desired, self.applied)
+
+        if transition is None:
+            transition = MODES[self.mode].get("transition")
+        for light, state in changes.items():
+            batch.set(light, state, transition)
+        if batch:
+            sent = batch.flush(self.call_service)
+            self.log(f"Applied {len(changes)} light change(s) in {sent} call(s)", level="DEBUG")
+        self.applied.update(changes)
+
+    def _start_christmas_pattern(self):
+        """Start the Christmas pattern."""
+        pattern = self.args.get("christmas_pattern", CHRISTMAS_PATTERN)
+        groups = [self.args[group] if isinstance(group, str) else group
+                  for group in pattern["groups"]]
+        self.start_pattern(LightPattern(
+            groups, pattern["steps"],
+            brightness=pattern.get("brightness", 150),
+            transition=pattern.get("transition", 1)
+        ), self.args.get("christmas_delay", 5))
 
     def _cleanup_christmas_mode(self):
-        """Clean up all Christmas mode patterns and timers."""
-        self.running = False
-
-        # Cancel all scheduled pattern changes
-        if self.pattern_handle:
+        """Stop the Christmas pattern."""
+        self.stop_pattern()
+
+    def start_pattern(self, pattern, interval):
+        """Run a light pattern, one step every interval seconds, on a single repeating timer."""
+        self.stop_pattern()
+        self.pattern = pattern
+        self.call_service("scene/apply", **pattern.next_step())
+        self.pattern_handle = self.run_every(
+            self._pattern_step, self.get_now() + timedelta(seconds=interval), interval)
+
+    def stop_pattern(self):
+        """Stop the running light pattern, if any."""
+        if self.pattern_handle is not None:
             self.cancel_timer(self.pattern_handle)
             self.pattern_handle = None
+        self.pattern = None
 
-        # Cancel any other pending pattern timers
-        for handle in self.pattern_handles:
-            try:
-                self.cancel_timer(handle)
-            except:
-                pass
-        self.pattern_handles.clear()
-
-    def _run_christmas_pattern(self, current_color):
-        """Run the Christmas pattern with alternating colors."""
-        if not self.running:
+    def _pattern_step(self, kwargs):
+        """Apply the next step of the running pattern."""
+        if self.pattern is None:
             return
-
-        lights1 = self.args["christmas_lights_even"]
-        lights2 = self.args["christmas_lights_odd"]
-        delay = self.args.get("christmas_delay", 5)
-
-        # Set current pattern
-        if current_color == "red":
-            self.call_service(
-                "light/turn_on",
-                entity_id=lights1,
-                rgb_color=COLORS["christmas_red"],
-                brightness=150,
-                transition=1
-            )
-            self.call_service(
-                "light/turn_on",
-                entity_id=lights2,
-                rgb_color=COLORS["christmas_green"],
-                brightness=150,
-                transition=1
-            )
-            next_color = "green"
-        else:
-            self.call_service(
-                "light/turn_on",
-                entity_id=lights1,
-                rgb_color=COLORS["christmas_green"],
-                brightness=150,
-                transition=1
-            )
-            self.call_service(
-                "light/turn_on",
-                entity_id=lights2,
-                rgb_color=COLORS["christmas_red"],
-                brightness=150,
-                transition=1
-            )
-            next_color = "red"
-
-        # Schedule next pattern change if still running
-        if self.running:
-            handle = self.run_in(
-                lambda kwargs: self._run_christmas_pattern(next_color),
-                delay
-            )
-            self.pattern_handles.append(handle)
-            self.pattern_handle = handle  # Keep track of most recent handle
-
-    def activate_focus_mode(self):
-        """Activate focus mode lighting."""
-        self.mode = "focus"
-        self.turn_on(self.args["focus_light"], **DEFAULT_SETTINGS["focus"])
-
-    def activate_night_mode(self):
-        """Activate night mode per README criteria."""
-        self.mode = "night"
-
-        # Get list of lights to turn off (all lights except presence_night_lights)
-        night_lights = set(self.args["presence_night_lights"])
-        lights_to_turn_off = [light for light in self.args["all_lights"]
-                              if light not in night_lights]
-
-        # Skip presence check if presence mode is disabled
-        if not self.presence_enabled or self.get_state(self.args["presence_sensor"]) == "on":
-            self.call_service(
-                "light/turn_off",
-                entity_id=lights_to_turn_off
-            )
-            self.run_in(self.turn_on_night_lights, 0)
-        else:
-            self.check_night_conditions(None, None, None, None, None)
-
-    def turn_on_night_lights(self, kwargs):
-        """Callback to turn on night lights after main lights turn off."""
-        try:
-            # Turn on all presence night lights in a single call
-            self.call_service(
-                "light/turn_on",
-                entity_id=self.args["presence_night_lights"],
-                brightness=DEFAULT_SETTINGS["night"]["brightness"],
-                color_temp=DEFAULT_SETTINGS["night"]["color_temp"],
-                transition=1
-            )
-
-            # Then check phone conditions for bedroom light
-            self.check_night_conditions(None, None, None, None, None)
-        except Exception as e:
-            self.log(f"Error in turn_on_night_lights: {e}", level="ERROR")
+        self.call_service("scene/apply", **self.pattern.next_step())
 
     def check_night_conditions(self, entity, attribute, old, new, kwargs):
-        """Check all conditions for night mode bedroom light."""
-        if self.mode != "night":
-            return False
-
-        phone_state = self.get_state(self.args["phone_state_sensor"])
-        charger_type = self.get_state(self.args["charger_type_sensor"])
-
-        should_light_on = (
-            phone_state in ["okänd", "offhook"] or
-            charger_type == "usb"
-        )
-
-        if should_light_on:
-            # Single service call for bedroom light
-            self.call_service(
-                "light/turn_on",
-                entity_id=self.args["bedroom_night_light"],
-                brightness=102,
-                color_temp=454,
-                transition=1
-            )
-        return should_light_on
-
-    def activate_default_mode(self):
-        """Activate default mode with time-based settings."""
-        self.mode = "default"
-        current_time = self.get_now()
-        settings = self.get_time_based_settings(current_time)
-        self.turn_on(self.args["main_light"], **settings)
-
-    def get_time_based_settings(self, current_time):
-        """Get light settings based on time of day."""
-        hour = current_time.hour
-        if 5 <= hour < 8:
-            return DEFAULT_SETTINGS["early_morning"]
-        elif 8 <= hour < 12:
-            return DEFAULT_SETTINGS["morning"]
-        elif 12 <= hour < 20:
-            return DEFAULT_SETTINGS["afternoon"]
-        else:
-            return DEFAULT_SETTINGS["night"]
-
-    def turn_off_all(self):
-        """Turn off all managed lights."""
-        self._cleanup_christmas_mode()
-
-        # Only turn off lights that are explicitly managed
-        self.call_service(
-            "light/turn_off",
-            entity_id=self.managed_lights
-        )
+        """
+        Apply the mode's bedroom light state when the night light conditions start to hold.
+
+        When they end the bedroom light is left as it is; only the next mode
+        change turns it off.
+        """
+        if night_light_wanted(self.snapshot):
+            self.apply_mode_lights(only=self.lights["bedroom"])
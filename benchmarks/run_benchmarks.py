@@ -0,0 +1,387 @@
+"""
+App Benchmarks
+Drives Lightning, DashboardToNestHubApp and NodalinkEngine through fixed
+scenarios on FakeHass and reports, per scenario, the service calls issued,
+state-store reads, timers and the CPU time spent in app callbacks. Every
+scenario also checks the behavior it exercises, so the numbers are only
+reported as passing when the apps did what they should.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --only lightning_christmas_day \\
+        --service-latency 0.2 --api-latency 0.001 --json bench.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+APPS_DIR = os.path.join(REPO_DIR, "AppdaemonApps")
+CORE_DIR = os.path.join(REPO_DIR, "nodalink-core")
+
+# FakeHass is shared with the Nodalink trigger replay tool; the add-on root
+# is on PYTHONPATH in the add-on, for the nodalink_core package
+sys.path.insert(0, os.path.join(CORE_DIR, "tools"))
+sys.path.insert(0, CORE_DIR)
+from fake_hass import load_app  # noqa: E402
+
+START_TIME = datetime(2025, 12, 1, 7, 0)
+
+CHATTER_BURSTS = 20
+CHRISTMAS_HOURS = 24
+NEST_PC_CYCLES = 4
+
+# Same entities as the lightning app in AppdaemonApps/apps.yaml
+LIGHTNING_ARGS = {
+    "main_light": "light.all",
+    "focus_light": "light.roof_lamp_3",
+    "bedroom_night_light": "light.wall_lamp",
+    "presence_night_lights": ["light.roof_lamp_1", "light.roof_lamp_2", "light.star_light"],
+    "presence_sensor": "binary_sensor.presence_detector",
+    "presence_mode_switch": "input_boolean.presence_mode",
+    "christmas_mode_switch": "input_boolean.christmas_mode",
+    "focus_mode_switch": "input_boolean.desk_focus_lights",
+    "night_mode_switch": "input_boolean.night_mode",
+    "phone_state_sensor": "sensor.hampus_zfold_phone_state",
+    "charger_type_sensor": "sensor.hampus_zfold_charger_type",
+    "christmas_lights_even": ["light.christmas2"],
+    "christmas_lights_odd": ["light.christmas1"],
+    "christmas_delay": 5,
+    "all_lights": ["light.star_light", "light.roof_lamp_1", "light.roof_lamp_2",
+                   "light.roof_lamp_3", "light.roof_lamp_4", "light.wall_lamp",
+                   "light.yeelight_strip"],
+    "reference_light": "light.roof_lamp_1"
+}
+
+
+def lightning_states() -> Dict[str, Any]:
+    """Initial states for Lightning: everything off, presence mode on."""
+    states = {light: "off" for light in LIGHTNING_ARGS["all_lights"]}
+    states.update({light: "off" for light in ["light.christmas1", "light.christmas2"]})
+    states["light.all"] = {"state": "off",
+                           "attributes": {"entity_id": list(LIGHTNING_ARGS["all_lights"])}}
+    for key in ["presence_sensor", "christmas_mode_switch", "focus_mode_switch",
+                "night_mode_switch"]:
+        states[LIGHTNING_ARGS[key]] = "off"
+    states[LIGHTNING_ARGS["presence_mode_switch"]] = "on"
+    states[LIGHTNING_ARGS["phone_state_sensor"]] = "idle"
+    states[LIGHTNING_ARGS["charger_type_sensor"]] = "none"
+    return states
+
+
+def start_lightning(options: Dict[str, Any]):
+    app = load_app(APPS_DIR, "lightning", "Lightning", LIGHTNING_ARGS, lightning_states(),
+                   start_time=START_TIME, **options)
+    app.initialize()
+    app.advance(0)
+    app.reset_stats()
+    return app
+
+
+# Scenarios: each takes FakeHass options and returns the driven app
+
+def lightning_modes(options: Dict[str, Any]):
+    """A day of mode changes: presence, focus, night with phone use, presence flaps."""
+    app = start_lightning(options)
+    args = LIGHTNING_ARGS
+    app.set_state(args["presence_sensor"], "on")
+    app.advance(1800)
+    app.set_state(args["focus_mode_switch"], "on")
+    app.advance(3 * 3600)
+    app.set_state(args["focus_mode_switch"], "off")
+    for _ in range(5):
+        app.advance(600)
+        app.set_state(args["presence_sensor"], "off")
+        app.advance(30)
+        app.set_state(args["presence_sensor"], "on")
+    app.advance(10 * 3600)  # Through the 08:00, 12:00 and 20:00 boundaries
+    app.set_state(args["night_mode_switch"], "on")
+    for state in ["offhook", "idle", "offhook", "idle"]:
+        app.advance(300)
+        app.set_state(args["phone_state_sensor"], state)
+    app.set_state(args["charger_type_sensor"], "usb")
+    app.advance(3600)
+    app.set_state(args["night_mode_switch"], "off")
+    app.advance(60)
+    return app
+
+
+def lightning_group_chatter(options: Dict[str, Any]):
+    """Focus mode while light.all reports bursts of attribute updates."""
+    app = start_lightning(options)
+    args = LIGHTNING_ARGS
+    app.set_state(args["presence_sensor"], "on")
+    app.set_state(args["focus_mode_switch"], "on")
+    app.advance(5)
+    for burst in range(CHATTER_BURSTS):
+        for update in range(30):
+            # Brightness steps of a transition, interleaved with irrelevant attributes
+            if update % 3:
+                app.set_state("light.all", attributes={"brightness": 100 + burst + update})
+            else:
+                app.set_state("light.all", attributes={"linkquality": update})
+            app.advance(0.05)
+        app.advance(5)
+    return app
+
+
+def lightning_christmas_day(options: Dict[str, Any]):
+    """Christmas mode left on for 24 hours."""
+    app = start_lightning(options)
+    app.set_state(LIGHTNING_ARGS["presence_sensor"], "on")
+    app.set_state(LIGHTNING_ARGS["christmas_mode_switch"], "on")
+    app.advance(CHRISTMAS_HOURS * 3600)
+    app.set_state(LIGHTNING_ARGS["christmas_mode_switch"], "off")
+    app.advance(10)
+    return app
+
+
+def nest_cpu_updates(options: Dict[str, Any]):
+    """PC on and off with CPU load updates every 3 s, plus quick presence flaps."""
+    app = load_app(APPS_DIR, "dashboard_nest_app", "DashboardToNestHubApp", {}, {
+        "media_player.nesthub0445": "off",
+        "binary_sensor.presence_detector": "on",
+        "sensor.pc_cpuload": "unavailable"
+    }, start_time=START_TIME, **options)
+    app.initialize()
+    app.reset_stats()
+    for cycle in range(NEST_PC_CYCLES):
+        for update in range(500):
+            app.set_state("sensor.pc_cpuload", str(5 + (update * 7 + cycle) % 60))
+            app.advance(3)
+        app.set_state("sensor.pc_cpuload", "unavailable")
+        app.advance(60)
+    for _ in range(10):
+        app.set_state("binary_sensor.presence_detector", "off")
+        app.advance(0.5)
+        app.set_state("binary_sensor.presence_detector", "on")
+        app.advance(0.5)
+    app.advance(60)
+    return app
+
+
+def nodalink_triggers(options: Dict[str, Any]):
+    """Room sensor flips and button events across all rooms for a day."""
+    with open(os.path.join(CORE_DIR, "apps", "Nodalink", "config.json")) as f:
+        config = json.load(f)
+    rooms = {room: mapping["entity_id"] for room, mapping in config["room_mappings"].items()}
+
+    # One room-wide scenario plus one per 6-hour bucket for every room
+    scenarios = {}
+    for room in rooms:
+        scenarios[room] = [{"service": "light.turn_on", "entity_id": f"light.{room}_main"}]
+        for start in range(0, 24, 6):
+            scenarios[f"{room}|{start:02d}-{start + 6:02d}"] = [{
+                "service": "light.turn_on", "entity_id": f"light.{room}_main",
+                "data": {"brightness": 40 + start * 8}
+            }]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        scenario_file = os.path.join(work_dir, "scenarios.json")
+        with open(scenario_file, "w") as f:
+            json.dump(scenarios, f)
+
+        # Loaded like AppDaemon does: top-level module from the app_dir
+        app = load_app(os.path.join(CORE_DIR, "apps"), "scenario_engine", "NodalinkEngine", {
+            "scenario_file": scenario_file,
+            "config_file": os.path.join(CORE_DIR, "apps", "Nodalink", "config.json"),
+            "log_file": os.path.join(work_dir, "unmatched_scenarios.log")
+        }, {entity_id: "off" for entity_id in rooms.values()}, start_time=START_TIME, **options)
+        # Keep the engine off the FastAPI shared state
+        sys.modules["scenario_engine"].SHARED_STATE_AVAILABLE = False
+        app.initialize()
+        app.advance(0)
+        app.reset_stats()
+
+        room_ids = list(rooms)
+        for i in range(1000):
+            room = room_ids[i % len(room_ids)]
+            if i % 4:
+                entity_id = rooms[room]
+                current = app.states[entity_id]["state"]
+                app.set_state(entity_id, "off" if current == "on" else "on")
+            else:
+                app.fire_event("nodalink_trigger", {"room": room, "interaction_type": "single_press"})
+            app.advance(86)
+        return app
+
+
+# Checks: each takes the driven app and returns the failed expectations
+
+def calls_to(app, entity_id: str) -> List[Dict[str, Any]]:
+    """Get the recorded service calls that target an entity directly."""
+    calls = []
+    for call in app.service_calls:
+        targets = call["data"].get("entity_id")
+        if targets == entity_id or (isinstance(targets, list) and entity_id in targets):
+            calls.append(call)
+    return calls
+
+
+def check_lightning_modes(app) -> List[str]:
+    """Back in default mode after 20:00, every light has the night settings."""
+    failures = []
+    if app.mode != "default":
+        failures.append(f"ended in mode {app.mode}, expected default")
+    for light in LIGHTNING_ARGS["all_lights"]:
+        state = app.states[light]
+        attributes = state["attributes"]
+        if (state["state"], attributes.get("brightness"), attributes.get("color_temp")) != \
+                ("on", 10, 333):
+            failures.append(f"{light} is {state['state']} {attributes}, expected night settings")
+    return failures
+
+
+def check_lightning_group_chatter(app) -> List[str]:
+    """The focus light is set on entering focus mode and reactivated once per burst."""
+    focus_calls = len(calls_to(app, LIGHTNING_ARGS["focus_light"]))
+    if focus_calls != 1 + CHATTER_BURSTS:
+        return [f"{focus_calls} focus light calls, expected {1 + CHATTER_BURSTS} "
+                f"(entry plus one reactivation per burst)"]
+    return []
+
+
+def check_lightning_christmas_day(app) -> List[str]:
+    """One repeating timer drives the pattern, one step per delay, and is gone afterwards."""
+    from lightning import TIME_OF_DAY_SETTINGS
+    failures = []
+    steps = app.get_stats()["service_calls_by_service"].get("scene.apply", 0)
+    expected = 1 + CHRISTMAS_HOURS * 3600 // LIGHTNING_ARGS["christmas_delay"]
+    if steps != expected:
+        failures.append(f"{steps} pattern steps, expected {expected}")
+    timers = app.get_stats()["timers"]
+    if timers["scheduled"] != 1:
+        failures.append(f"{timers['scheduled']} timers scheduled, expected 1")
+    if app.pattern_handle is not None or timers["pending"] != len(TIME_OF_DAY_SETTINGS):
+        failures.append(f"{timers['pending']} timers pending after Christmas mode, "
+                        f"expected only the {len(TIME_OF_DAY_SETTINGS)} daily ones")
+    return failures
+
+
+def check_nest_cpu_updates(app) -> List[str]:
+    """One PC cast per PC session and one default cast after it; presence flaps cast nothing."""
+    casts = [{"shell_command.cast_dashboard": "pc",
+              "script.cast_lovelace_dashboard_to_nest_hub": "default"}[call["service"]]
+             for call in app.service_calls
+             if call["service"] in ("shell_command.cast_dashboard",
+                                    "script.cast_lovelace_dashboard_to_nest_hub")]
+    expected = ["pc", "default"] * NEST_PC_CYCLES
+    if casts != expected:
+        return [f"casts {casts}, expected {expected}"]
+    return []
+
+
+def check_nodalink_triggers(app) -> List[str]:
+    """Every trigger resolves to its room's scenario for the current 6-hour bucket."""
+    failures = []
+    triggers = sum(1 for line in app.log_lines if "Processing trigger" in line)
+    if len(app.service_calls) != triggers:
+        failures.append(f"{len(app.service_calls)} service calls for {triggers} triggers")
+    for call in app.service_calls:
+        hour = datetime.fromisoformat(call["time"]).hour
+        brightness = call["data"].get("brightness")
+        if brightness != 40 + hour // 6 * 6 * 8:
+            failures.append(f"{call['data']['entity_id']} at {call['time']} got brightness "
+                            f"{brightness}")
+            break
+    return failures
+
+
+SCENARIOS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "lightning_modes": lightning_modes,
+    "lightning_group_chatter": lightning_group_chatter,
+    "lightning_christmas_day": lightning_christmas_day,
+    "nest_cpu_updates": nest_cpu_updates,
+    "nodalink_triggers": nodalink_triggers
+}
+
+CHECKS: Dict[str, Callable[[Any], List[str]]] = {
+    "lightning_modes": check_lightning_modes,
+    "lightning_group_chatter": check_lightning_group_chatter,
+    "lightning_christmas_day": check_lightning_christmas_day,
+    "nest_cpu_updates": check_nest_cpu_updates,
+    "nodalink_triggers": check_nodalink_triggers
+}
+
+
+def run_scenario(name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run one scenario.
+
+    Args:
+        name: Scenario name in SCENARIOS
+        options: FakeHass options
+
+    Returns:
+        FakeHass stats plus the wall time of the scenario and its failed checks
+    """
+    started = time.perf_counter()
+    app = SCENARIOS[name](options)
+    wall_ms = (time.perf_counter() - started) * 1000
+    stats = app.get_stats()
+    stats["wall_ms"] = wall_ms
+    stats["failed_checks"] = CHECKS[name](app)
+    return stats
+
+
+def format_table(results: Dict[str, Dict[str, Any]]) -> str:
+    """Format the headline numbers of every scenario as a text table."""
+    columns = ["service calls", "get_state", "timers", "pending", "callback cpu ms",
+               "wall ms", "errors", "checks"]
+    rows = []
+    for name, stats in results.items():
+        rows.append([name,
+                     str(stats["service_calls"]),
+                     str(stats["api_calls"].get("get_state", 0)),
+                     str(stats["timers"]["scheduled"]),
+                     str(stats["timers"]["pending"]),
+                     f"{stats['callback_cpu_ms']:.1f}",
+                     f"{stats['wall_ms']:.1f}",
+                     str(stats["errors"]),
+                     f"{len(stats['failed_checks'])} failed" if stats["failed_checks"] else "ok"])
+    widths = [max(len(row[i]) for row in rows + [["scenario"] + columns])
+              for i in range(len(columns) + 1)]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(["scenario"] + columns, widths))]
+    lines += ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the AppDaemon apps on FakeHass")
+    parser.add_argument("--only", action="append", choices=sorted(SCENARIOS),
+                        help="Run only this scenario (repeatable)")
+    parser.add_argument("--service-latency", type=float, default=0.0,
+                        help="Virtual seconds before a service call changes states")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="Real seconds added to every get_state/call_service")
+    parser.add_argument("--json", help="Write the full results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Print app log lines")
+    options = parser.parse_args(argv)
+
+    hass_options = {
+        "service_latency": options.service_latency,
+        "api_latency": options.api_latency,
+        "verbose": options.verbose
+    }
+    results = {name: run_scenario(name, hass_options) for name in options.only or SCENARIOS}
+
+    print(format_table(results))
+    for name, stats in results.items():
+        for failure in stats["failed_checks"]:
+            print(f"FAILED {name}: {failure}")
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = any(stats["errors"] or stats["failed_checks"] for stats in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,206 +4,33 @@ REST API backend for the Vue.js node editor frontend.
 Combined with AppDaemon engine for shared in-memory access.
 """
 
-from scenario_utils import (
+import json
+import os
+import asyncio
+from datetime import datetime
+import logging
+
+from nodalink_core.scenario_utils import (
     validate_scenario_id,
-    parse_scenario_id,
     build_scenario_id,
     validate_scenarios_file,
     get_scenario_suggestions,
-    create_default_scenarios
+    create_default_scenarios,
+    simulate_batch,
+    analyze_coverage
 )
+from nodalink_core.execution_journal import ExecutionJournal
+from nodalink_core.shared_state import get_shared_state
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, List, Any, Optional
-import json
-import os
-import sys
-import asyncio
-from datetime import datetime
-import logging
-import threading
 
 # Get CORS origins from environment
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 
-# Shared state between AppDaemon and FastAPI
-class SharedState:
-    """Shared state container for AppDaemon and FastAPI communication"""
-    def __init__(self):
-        self.scenarios = {}
-        self.config = {}
-        self.engine_instance = None
-        self.lock = threading.RLock()
-        self.stats = {
-            "total_scenarios": 0,
-            "total_actions": 0,
-            "rooms": [],
-            "time_buckets": [],
-            "interaction_types": []
-        }
-        self.engine_status = {
-            "running": False,
-            "scenarios_loaded": 0,
-            "last_execution": None,
-            "last_config_update": None
-        }
-        self.logs = []
-        self.unmatched_scenarios = []
-        self.websocket_connections = set()
-    
-    def set_engine_instance(self, engine):
-        """Set reference to AppDaemon engine instance for direct access"""
-        with self.lock:
-            self.engine_instance = engine
-            self.engine_status["running"] = True
-            self.engine_status["scenarios_loaded"] = len(getattr(engine, 'scenarios', {}))
-    
-    def update_scenarios(self, scenarios):
-        """Update scenarios and notify WebSocket clients"""
-        with self.lock:
-            self.scenarios = scenarios
-            self._update_stats()
-            self._notify_websocket_clients("scenarios_update", scenarios)
-    
-    def update_config(self, config):
-        """Update configuration and notify WebSocket clients"""
-        with self.lock:
-            self.config = config
-            self.engine_status["last_config_update"] = datetime.now().isoformat()
-            self._notify_websocket_clients("config_update", config)
-    
-    def update_engine_status(self, status):
-        """Update engine status"""
-        with self.lock:
-            self.engine_status.update(status)
-            self._notify_websocket_clients("status_update", self.engine_status)
-    
-    def add_log_entry(self, level, message, data=None):
-        """Add log entry and notify WebSocket clients"""
-        with self.lock:
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "level": level,
-                "message": message,
-                "data": data
-            }
-            self.logs.append(log_entry)
-            # Keep only last 1000 entries
-            if len(self.logs) > 1000:
-                self.logs = self.logs[-1000:]
-            self._notify_websocket_clients("log_update", log_entry)
-    
-    def add_unmatched_scenario(self, scenario_data):
-        """Add unmatched scenario and notify WebSocket clients"""
-        with self.lock:
-            self.unmatched_scenarios.append(scenario_data)
-            # Keep only last 500 entries
-            if len(self.unmatched_scenarios) > 500:
-                self.unmatched_scenarios = self.unmatched_scenarios[-500:]
-            self._notify_websocket_clients("unmatched_scenario", scenario_data)
-    
-    def reload_engine_data(self):
-        """Reload data from engine instance if available"""
-        if self.engine_instance:
-            with self.lock:
-                try:
-                    # Force reload from engine
-                    self.engine_instance.reload_scenarios()
-                    self.engine_instance.reload_config()
-                    
-                    # Update shared state
-                    self.scenarios = getattr(self.engine_instance, 'scenarios', {})
-                    self.config = getattr(self.engine_instance, 'config', {})
-                    self._update_stats()
-                    
-                    # Notify clients
-                    self._notify_websocket_clients("engine_reload", {
-                        "scenarios": self.scenarios,
-                        "config": self.config,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    return True
-                except Exception as e:
-                    logging.error(f"Failed to reload engine data: {e}")
-                    return False
-        return False
-    
-    def execute_scenario_test(self, room: str, interaction_type: str = "manual"):
-        """Execute a test scenario through the engine"""
-        if self.engine_instance and hasattr(self.engine_instance, 'simulate_scenario'):
-            try:
-                result = self.engine_instance.simulate_scenario(room, interaction_type)
-                self._notify_websocket_clients("scenario_test", result)
-                return result
-            except Exception as e:
-                logging.error(f"Failed to execute scenario test: {e}")
-                return {"error": str(e)}
-        return {"error": "Engine not available"}
-    
-    def add_websocket_connection(self, websocket):
-        """Add WebSocket connection"""
-        self.websocket_connections.add(websocket)
-    
-    def remove_websocket_connection(self, websocket):
-        """Remove WebSocket connection"""
-        self.websocket_connections.discard(websocket)
-    
-    def _notify_websocket_clients(self, event_type: str, data: Any):
-        """Notify all connected WebSocket clients"""
-        if not self.websocket_connections:
-            return
-        
-        message = {
-            "type": event_type,
-            "data": data,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Send to all connected clients (in background to avoid blocking)
-        disconnected = set()
-        for websocket in self.websocket_connections.copy():
-            try:
-                asyncio.create_task(websocket.send_json(message))
-            except Exception:
-                disconnected.add(websocket)
-        
-        # Remove disconnected clients
-        for websocket in disconnected:
-            self.websocket_connections.discard(websocket)
-    
-    def _update_stats(self):
-        """Update statistics based on current scenarios"""
-        rooms = set()
-        time_buckets = set()
-        interaction_types = set()
-        total_actions = 0
-        
-        for scenario_group in self.scenarios.values():
-            for scenario in scenario_group:
-                if isinstance(scenario, dict):
-                    scenario_id = scenario.get("scenario_id", "")
-                    parts = scenario_id.split("|")
-                    if len(parts) > 0 and parts[0]:
-                        rooms.add(parts[0])
-                    if len(parts) > 1 and parts[1]:
-                        time_buckets.add(parts[1])
-                    if len(parts) > 4 and parts[4]:
-                        interaction_types.add(parts[4])
-                    
-                    actions = scenario.get("actions", [])
-                    total_actions += len(actions)
-        
-        self.stats.update({
-            "total_scenarios": sum(len(group) for group in self.scenarios.values()),
-            "total_actions": total_actions,
-            "rooms": sorted(list(rooms)),
-            "time_buckets": sorted(list(time_buckets)),
-            "interaction_types": sorted(list(interaction_types))
-        })
-
 # Global shared state instance
-shared_state = SharedState()
+shared_state = get_shared_state()
 
 app = FastAPI(title="Nodalink Core API", version="1.0.0")
 
@@ -223,6 +50,11 @@ UNMATCHED_LOG_FILE = os.getenv(
     "LOG_FILE", "/config/appdaemon/apps/Nodalink/logs/unmatched_scenarios.log")
 CONFIG_FILE = os.getenv(
     "CONFIG_FILE", "/config/appdaemon/apps/Nodalink/config.json")
+JOURNAL_FILE = os.getenv(
+    "JOURNAL_FILE", "/config/appdaemon/apps/Nodalink/logs/executions.db")
+
+# Read side of the execution journal written by the AppDaemon engine
+execution_journal = ExecutionJournal(JOURNAL_FILE)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -264,6 +96,8 @@ class ScenarioAction(BaseModel):
     service: str
     entity_id: str
     data: Dict[str, Any] = {}
+    delay: Optional[float] = None
+    at: Optional[str] = None
 
 class ScenarioRequest(BaseModel):
     room: str
@@ -308,6 +142,11 @@ class SystemSettings(BaseModel):
     test_mode: bool = False
     auto_reload_config: bool = True
     allowed_domains: List[str] = []
+    suppress_noop_actions: bool = False
+    execution_mode: str = "sync"
+    execution_policy: str = "replace"
+    room_execution_policies: Dict[str, str] = {}
+    log_pipeline: Dict[str, Any] = {}
 
 class ConfigRequest(BaseModel):
     room_mappings: List[RoomMapping] = []
@@ -319,6 +158,8 @@ class EngineStatus(BaseModel):
     scenarios_loaded: int
     last_execution: Optional[str] = None
     last_config_update: Optional[str] = None
+    startup_profile: Optional[Dict[str, Any]] = None
+    action_suppression: Optional[Dict[str, Any]] = None
 
 class StatsResponse(BaseModel):
     total_scenarios: int
@@ -337,6 +178,21 @@ class ScenarioTestRequest(BaseModel):
     room: str
     interaction_type: str = "manual"
 
+class SimulationContext(BaseModel):
+    room: str
+    interaction_type: str = ""
+    timestamp: Optional[str] = None
+    optional_flags: List[str] = []
+    time_bucket: Optional[str] = None
+    day_type: Optional[str] = None
+    weekday: Optional[str] = None
+
+class SimulationBatchRequest(BaseModel):
+    contexts: List[SimulationContext]
+    fallback_enabled: Optional[bool] = None
+    time_bucket_minutes: Optional[int] = None
+    include_results: bool = True
+
 # Utility functions
 
 
@@ -429,7 +285,7 @@ async def create_scenario(scenario: ScenarioRequest):
         )
 
         # Convert actions to dict format
-        actions = [action.dict() for action in scenario.actions]
+        actions = [action.dict(exclude_none=True) for action in scenario.actions]
 
         # Store scenario
         scenarios[scenario_id] = {
@@ -484,7 +340,7 @@ async def update_scenario(scenario_id: str, scenario: ScenarioRequest):
             raise HTTPException(status_code=404, detail="Scenario not found")
 
         # Convert actions to dict format
-        actions = [action.dict() for action in scenario.actions]
+        actions = [action.dict(exclude_none=True) for action in scenario.actions]
 
         # Update scenario
         scenarios[scenario_id].update({
@@ -670,6 +526,103 @@ async def test_scenario(test_request: ScenarioTestRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/engine/simulate-batch")
+async def simulate_scenario_batch(batch_request: SimulationBatchRequest):
+    """Resolve a batch of trigger contexts without executing any actions."""
+    try:
+        if not shared_state.scenarios:
+            shared_state.update_scenarios(load_scenarios())
+
+        system_settings = shared_state.config.get("system_settings", {})
+        bucket_minutes = (batch_request.time_bucket_minutes
+                          or system_settings.get("time_bucket_minutes", 60))
+        fallback_enabled = (batch_request.fallback_enabled
+                            if batch_request.fallback_enabled is not None
+                            else system_settings.get("fallback_enabled", True))
+
+        simulation = simulate_batch(
+            shared_state.get_scenario_index(),
+            [context.dict(exclude_none=True) for context in batch_request.contexts],
+            bucket_minutes,
+            fallback_enabled
+        )
+        if not batch_request.include_results:
+            simulation.pop("results")
+        return simulation
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _config_keys(section: Any) -> List[str]:
+    """Get the IDs of a config section stored either as a dict or a list."""
+    if isinstance(section, dict):
+        return list(section.keys())
+    keys = []
+    for item in section or []:
+        if isinstance(item, dict):
+            key = item.get("id") or item.get("label", "").strip().lower().replace(" ", "_")
+            if key:
+                keys.append(key)
+    return keys
+
+
+@app.get("/analytics/coverage")
+async def get_coverage(interaction_types: Optional[str] = None,
+                       include_matrix: bool = True):
+    """Get which contexts resolve to which fallback level or to no scenario."""
+    try:
+        if not shared_state.scenarios:
+            shared_state.update_scenarios(load_scenarios())
+        if not shared_state.config:
+            shared_state.update_config(load_config())
+
+        index = shared_state.get_scenario_index()
+        config = shared_state.config
+        system_settings = config.get("system_settings", {})
+
+        rooms = _config_keys(config.get("room_mappings", {}))
+        rooms += [room for room in index.rooms if room not in rooms]
+        interactions = ["presence_detected"] + index.interaction_types
+        if interaction_types:
+            interactions = [item.strip() for item in interaction_types.split(",") if item.strip()]
+
+        coverage = analyze_coverage(
+            index,
+            rooms,
+            _config_keys(config.get("conditional_entities", {})),
+            interactions,
+            system_settings.get("time_bucket_minutes", 60),
+            system_settings.get("fallback_enabled", True)
+        )
+        if not include_matrix:
+            coverage.pop("matrix")
+        return coverage
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/executions")
+async def get_executions(room: Optional[str] = None, scenario_id: Optional[str] = None,
+                         hour: Optional[int] = None, since_day: Optional[str] = None,
+                         until_day: Optional[str] = None, group_by: str = "scenario_id",
+                         errors_only: bool = False, status: Optional[str] = None,
+                         limit: int = 100):
+    """Get execution rollups and the most recent executions from the journal."""
+    try:
+        since = datetime.fromisoformat(since_day).timestamp() if since_day else None
+        groups = [group.strip() for group in group_by.split(",") if group.strip()]
+        return {
+            "rollups": execution_journal.query_rollups(
+                groups, room, scenario_id, hour, since_day, until_day),
+            "executions": execution_journal.query_executions(
+                room, scenario_id, hour, since, errors_only=errors_only, status=status,
+                limit=limit)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Statistics endpoints
 @app.get("/stats", response_model=StatsResponse)
 async def get_stats():
@@ -685,6 +638,11 @@ async def get_logs(limit: int = 100):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/logs/pipeline")
+async def get_log_pipeline_stats():
+    """Get log pipeline sampling, rate-limit and aggregation counters."""
+    return shared_state.log_pipeline.get_stats()
+
 @app.delete("/logs")
 async def clear_logs():
     """Clear all log entries."""
@@ -777,6 +735,13 @@ async def validate_config(config: ConfigRequest):
         # Validate system settings
         if config.system_settings.time_bucket_minutes <= 0:
             errors.append("Time bucket minutes must be positive")
+        if config.system_settings.execution_mode not in ("sync", "async"):
+            errors.append("Execution mode must be 'sync' or 'async'")
+        policies = [config.system_settings.execution_policy,
+                    *config.system_settings.room_execution_policies.values()]
+        for policy in policies:
+            if policy not in ("replace", "queue", "ignore"):
+                errors.append(f"Execution policy must be 'replace', 'queue' or 'ignore': {policy}")
         
         return ValidationResponse(
             valid=len(errors) == 0,
@@ -856,6 +821,7 @@ async def websocket_endpoint(websocket: WebSocket):
 async def startup_event():
     """Initialize shared state on startup."""
     logger.info("Initializing Nodalink Core API...")
+    shared_state.attach_event_loop(asyncio.get_running_loop())
     
     # Load initial data
     scenarios = load_scenarios()
@@ -875,11 +841,6 @@ async def startup_event():
     shared_state.add_log_entry("INFO", "Nodalink Core API started successfully")
     logger.info("Nodalink Core API initialized successfully")
 
-# Function to be called by AppDaemon engine
-def get_shared_state():
-    """Get shared state instance for AppDaemon integration."""
-    return shared_state
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
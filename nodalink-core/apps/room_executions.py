@@ -0,0 +1,174 @@
+"""
+Nodalink Room Executions
+Per-room handles for running scenario executions, so a newer trigger in a
+room can supersede, wait for or be dropped in favour of the execution that
+is still in progress there.
+
+An execution runs until its immediate actions have been sent and its
+deferred ("delay"/"at") actions have run or been cancelled.
+
+Policies:
+    replace  -> cancel the running execution's pending actions (default)
+    queue    -> start after the running execution has finished
+    ignore   -> drop the new execution while one is running
+
+In sync execution mode triggers are handled on AppDaemon's worker threads
+and deferred actions on the timer thread, so the policy decision and the
+finishing of executions run under one lock. Waiters are called after it
+is released, as they may start the next execution.
+"""
+
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+EXECUTION_POLICIES = ("replace", "queue", "ignore")
+
+
+class Execution:
+    """Handle of one scenario execution in a room."""
+
+    __slots__ = ("room", "scenario_id", "seq", "cancelled", "finished", "task", "timers",
+                 "deferred", "_waiters", "_lock")
+
+    def __init__(self, room: str, scenario_id: str, seq: int,
+                 lock: Optional[threading.Lock] = None):
+        self.room = room
+        self.scenario_id = scenario_id
+        self.seq = seq
+        self.cancelled = False
+        self.finished = False
+        self.task: Optional[asyncio.Future] = None   # async dispatch, if any
+        self.timers: List[Any] = []                  # timer wheel entries of deferred actions
+        self.deferred = 0                            # deferred actions still to run
+        self._waiters: List[Callable[[], None]] = []
+        self._lock = lock or threading.Lock()  # Shared with RoomExecutions
+
+    def cancel(self):
+        """Stop sending the remaining actions of this execution."""
+        self.cancelled = True
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        for entry in self.timers:
+            entry.cancel()
+        self.timers = []
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        """Call callback once the execution has finished (immediately if it has)."""
+        with self._lock:
+            if not self.finished:
+                self._waiters.append(callback)
+                return
+        callback()
+
+    async def wait(self):
+        """Wait on the event loop until the execution has finished."""
+        if self.finished:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def release():
+            if not future.done():
+                future.set_result(None)
+
+        # Deferred actions finish executions from the timer thread
+        self.add_done_callback(lambda: loop.call_soon_threadsafe(release))
+        await future
+
+
+class RoomExecutions:
+    """Tracks the latest execution per room and applies the execution policy."""
+
+    def __init__(self, policy: str = "replace", room_policies: Optional[Dict[str, str]] = None):
+        self.policy = policy
+        self.room_policies = dict(room_policies or {})
+        self.running: Dict[str, Execution] = {}
+        self.stats = {"started": 0, "finished": 0, "replaced": 0, "queued": 0, "ignored": 0}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def configure(self, policy: str, room_policies: Optional[Dict[str, str]] = None):
+        """Change the default and per-room policies (applies to new executions)."""
+        self.policy = policy
+        self.room_policies = dict(room_policies or {})
+
+    def policy_for(self, room: str) -> str:
+        """Get the execution policy of a room."""
+        return self.room_policies.get(room, self.policy)
+
+    def begin(self, room: str, scenario_id: str) -> Tuple[Optional[Execution], Optional[Execution]]:
+        """
+        Start an execution in a room, applying the room's policy.
+
+        Args:
+            room: Room of the trigger
+            scenario_id: Scenario being executed
+
+        Returns:
+            (execution, previous) tuple: execution is None when the policy
+            drops it; previous is the execution to wait for (queue policy)
+        """
+        waiters = []
+        with self._lock:
+            previous = self.running.get(room)
+            if previous is not None and previous.finished:
+                previous = None
+
+            if previous is not None:
+                policy = self.policy_for(room)
+                if policy == "ignore":
+                    self.stats["ignored"] += 1
+                    return None, None
+                if policy == "queue":
+                    self.stats["queued"] += 1
+                else:
+                    previous.cancel()
+                    waiters = self._finish(previous)
+                    self.stats["replaced"] += 1
+                    previous = None
+
+            self._seq += 1
+            execution = Execution(room, scenario_id, self._seq, self._lock)
+            self.running[room] = execution
+            self.stats["started"] += 1
+        for callback in waiters:
+            callback()
+        return execution, previous
+
+    def settle(self, execution: Execution):
+        """Finish an execution unless deferred actions of it are still to run."""
+        with self._lock:
+            if execution.deferred and not execution.cancelled:
+                return
+            waiters = self._finish(execution)
+        for callback in waiters:
+            callback()
+
+    def finish(self, execution: Execution):
+        """Mark an execution as finished and release anything waiting on it."""
+        with self._lock:
+            waiters = self._finish(execution)
+        for callback in waiters:
+            callback()
+
+    def _finish(self, execution: Execution) -> List[Callable[[], None]]:
+        """Mark an execution as finished (lock held) and get the callbacks waiting on it."""
+        if execution.finished:
+            return []
+        execution.finished = True
+        self.stats["finished"] += 1
+        if self.running.get(execution.room) is execution:
+            del self.running[execution.room]
+        waiters, execution._waiters = execution._waiters, []
+        return waiters
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get policy counters and the executions currently running per room."""
+        with self._lock:
+            return {
+                **self.stats,
+                "policy": self.policy,
+                "running": {room: execution.scenario_id
+                            for room, execution in self.running.items()}
+            }
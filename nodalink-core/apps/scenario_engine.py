@@ -2,87 +2,196 @@
 Nodalink Scenario Engine
 A context-aware automation engine for Home Assistant using AppDaemon.
 Integrated with FastAPI for shared in-memory access.
+
+Every trigger (button event, presence sensor, Nodalink event) runs through one
+staged pipeline (see trigger_pipeline.py):
+
+    ingest   -> raw HA event/state change to a Trigger (room + interaction)
+    context  -> time bucket, day type and active flags
+    match    -> scenario resolution with fallback
+    plan     -> service calls compiled at load time (see action_plans.py)
+    diff     -> optional suppression of no-op calls (see state_diff.py)
+    dispatch -> service calls (or test mode logging)
+
+With system_settings.execution_mode "async" the listeners are coroutine
+callbacks that run the pipeline on AppDaemon's event loop: flag reads and
+service calls are awaited instead of blocking a worker thread, so
+simultaneous triggers in many rooms proceed together. The calls of one
+scenario are still sent one at a time, in order.
 """
 
+import asyncio
+import inspect
 import json
 import os
-import sys
-import socket
 import threading
-import traceback
-from datetime import datetime
-from typing import Dict, List, Any, Optional, Union
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
 import appdaemon.plugins.hass.hassapi as hass
-from .scenario_utils import (
-    get_time_bucket,
-    get_day_type,
-    build_scenario_id,
-    validate_service_call,
-    evaluate_conditions,
-    sanitize_entity_id
-)
-
-# Import shared state from FastAPI app
-try:
-    # Add the api directory to Python path
-    api_path = os.path.join(os.path.dirname(__file__), '..', 'api')
-    sys.path.insert(0, api_path)
-    from main import get_shared_state
-    SHARED_STATE_AVAILABLE = True
-except ImportError as e:
-    print(f"Warning: Shared state not available: {e}")
-    SHARED_STATE_AVAILABLE = False
+
+from nodalink_core.startup_profiler import StartupProfiler
+
+# Import-time breakdown of this module, reported with the startup profile
+IMPORT_PROFILE = StartupProfiler()
+
+with IMPORT_PROFILE.measure_import("nodalink_core.scenario_utils"):
+    from nodalink_core.scenario_utils import (
+        get_time_bucket,
+        get_day_type,
+        simulate_batch,
+        ScenarioIndex,
+        ScenarioKey,
+        FLAGS
+    )
+with IMPORT_PROFILE.measure_import("nodalink_core.action_plans"):
+    from nodalink_core.action_plans import CompiledAction, ScenarioPlan, compile_scenario_plans
+with IMPORT_PROFILE.measure_import("nodalink_core.shared_state"):
+    from nodalink_core.shared_state import get_shared_state
+with IMPORT_PROFILE.measure_import("nodalink_core.execution_journal"):
+    from nodalink_core.execution_journal import ExecutionJournal
+with IMPORT_PROFILE.measure_import("trigger_pipeline"):
+    from trigger_pipeline import (
+        Trigger,
+        TriggerContext,
+        MatchResult,
+        ActionPlan,
+        DispatchResult,
+        PipelineRun,
+        TriggerPipeline
+    )
+with IMPORT_PROFILE.measure_import("state_diff"):
+    from state_diff import StateDiff
+with IMPORT_PROFILE.measure_import("room_executions"):
+    from room_executions import EXECUTION_POLICIES, Execution, RoomExecutions
+with IMPORT_PROFILE.measure_import("timer_wheel"):
+    from timer_wheel import TimerWheel
+
+# Offline tools (tools/replay_triggers.py) switch this off to run detached
+SHARED_STATE_AVAILABLE = True
+
+DEFAULT_ALLOWED_DOMAINS = [
+    "light", "switch", "scene", "script", "automation",
+    "media_player", "climate", "cover", "fan", "vacuum"
+]
+
+# Button commands (ZHA command names and deCONZ event codes) to interaction types
+BUTTON_COMMANDS = {
+    "single": "single_press",
+    "on": "single_press",
+    "toggle": "single_press",
+    "1002": "single_press",
+    "double": "double_press",
+    "1004": "double_press",
+    "hold": "long_press",
+    "long": "long_press",
+    "move": "long_press",
+    "1001": "long_press"
+}
+
+ACTIVE_FLAG_STATES = ("on", "true", "active", "home")
+
+EXECUTION_MODES = ("sync", "async")
+
+
+async def _resolve(value: Any) -> Any:
+    """Await an AppDaemon API result (a coroutine inside the event loop, a value elsewhere)."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
 
 
 class NodalinkEngine(hass.Hass):
     """Main Nodalink automation engine."""
 
     def initialize(self):
-        """Initialize the Nodalink engine."""
+        """
+        Initialize the Nodalink engine.
+
+        Only cheap setup runs here; config and scenario files are parsed in
+        _complete_startup, scheduled right after initialize returns so an
+        AppDaemon (re)load is not blocked on file I/O.
+        """
+        self.profiler = StartupProfiler(imports=IMPORT_PROFILE.imports)
         self.log("🔗 Nodalink Engine initializing...")
 
-        # Load basic file paths from args
-        self.scenario_file = self.args.get(
-            "scenario_file", "/config/appdaemon/apps/Nodalink/scenarios.json")
-        self.log_file = self.args.get(
-            "log_file", "/config/appdaemon/apps/Nodalink/logs/unmatched_scenarios.log")
-        self.config_file = self.args.get(
-            "config_file", "/config/appdaemon/apps/Nodalink/config.json")
-
-        # Initialize shared state integration
-        self.shared_state = None
-        if SHARED_STATE_AVAILABLE:
-            try:
-                self.shared_state = get_shared_state()
-                self.shared_state.set_engine_instance(self)
-                self.log("🔗 Connected to shared state for FastAPI integration")
-            except Exception as e:
-                self.log(f"⚠️ Failed to connect to shared state: {e}")
-                self.shared_state = None
-
-        # Load UI-managed configuration
-        self.config = self._load_config()
+        with self.profiler.phase("initialize"):
+            # Load basic file paths from args
+            self.scenario_file = self.args.get(
+                "scenario_file", "/config/appdaemon/apps/Nodalink/scenarios.json")
+            self.log_file = self.args.get(
+                "log_file", "/config/appdaemon/apps/Nodalink/logs/unmatched_scenarios.log")
+            self.config_file = self.args.get(
+                "config_file", "/config/appdaemon/apps/Nodalink/config.json")
+            self.journal_file = self.args.get(
+                "journal_file", "/config/appdaemon/apps/Nodalink/logs/executions.db")
+
+            # Execution journal (written in the background, read by /analytics/executions)
+            self.journal = None
+            if self.journal_file:
+                self.journal = ExecutionJournal(self.journal_file)
+
+            # Initialize shared state integration
+            self.shared_state = None
+            if SHARED_STATE_AVAILABLE:
+                try:
+                    self.shared_state = get_shared_state()
+                    self.shared_state.set_engine_instance(self)
+                    self.log("🔗 Connected to shared state for FastAPI integration")
+                except Exception as e:
+                    self.log(f"⚠️ Failed to connect to shared state: {e}")
+                    self.shared_state = None
+
+            self.pipeline = TriggerPipeline({
+                "ingest": self._ingest_trigger,
+                "context": self._build_context,
+                "match": self._match_context,
+                "plan": self._plan_actions,
+                "diff": self._diff_plan,
+                "dispatch": self._dispatch_plan
+            }, on_complete=self._on_pipeline_complete, async_stages={
+                "context": self._build_context_async,
+                "match": self._match_context_async,
+                "diff": self._diff_plan_async,
+                "dispatch": self._dispatch_plan_async
+            })
+            self.listener_handles: List[Any] = []
+            self.state_diff = StateDiff(lambda entity_id: self.get_state(entity_id, attribute="all"))
+            self.state_cache_handles: List[Any] = []
+            self.executions = RoomExecutions()
+            self.timer_wheel = TimerWheel(self.get_now().timestamp())
+            self.timer_tick_handle = None
+
+            # Empty defaults until _complete_startup has loaded the files
+            self._apply_config({})
+            self.scenarios: Dict[str, Any] = {}
+            self.scenario_index = ScenarioIndex(self.scenarios)
+            self.action_plans: Dict[str, ScenarioPlan] = {}
+            self.ready = False
+
+        self.run_in(self._complete_startup, 0)
+
+    def _complete_startup(self, kwargs: Dict[str, Any]):
+        """Load config and scenarios, then start listening for triggers."""
+        try:
+            with self.profiler.phase("load_config"):
+                self._apply_config(self._load_config())
+            with self.profiler.phase("load_scenarios"):
+                self.scenarios = self._load_scenarios()
+            with self.profiler.phase("build_index"):
+                self.scenario_index = self._build_scenario_index(self.scenarios)
+            with self.profiler.phase("compile_actions"):
+                self.action_plans = self._compile_action_plans(self.scenarios)
+            with self.profiler.phase("setup_listeners"):
+                self._setup_listeners()
+                self._setup_state_cache()
+                self._setup_timer_tick()
+        except Exception as e:
+            self.log(f"❌ Error completing engine startup: {e}")
+            return
 
-        # Extract configuration values
-        self.room_mappings = self._extract_room_mappings()
-        self.conditional_entities = self._extract_conditional_entities()
-        self.time_bucket_minutes = self.config.get(
-            "system_settings", {}).get("time_bucket_minutes", 60)
-        self.test_mode = self.config.get(
-            "system_settings", {}).get("test_mode", False)
-        self.fallback_enabled = self.config.get(
-            "system_settings", {}).get("fallback_enabled", True)
-        self.allowed_domains = self.config.get("system_settings", {}).get("allowed_domains", [
-            "light", "switch", "scene", "script", "automation",
-            "media_player", "climate", "cover", "fan", "vacuum"
-        ])
-
-        # Set up config file watcher for live reloading
-        if self.config.get("system_settings", {}).get("auto_reload_config", True):
-            self._setup_config_watcher()
-
-        # Load scenarios
-        self.scenarios = self._load_scenarios()
+        self.ready = True
+        self.profiler.finish()
+        profile = self.profiler.to_dict()
 
         # Update shared state with initial data
         if self.shared_state:
@@ -90,196 +199,62 @@ class NodalinkEngine(hass.Hass):
             self.shared_state.update_config(self.config)
             self.shared_state.update_engine_status({
                 "running": True,
-                "scenarios_loaded": len(self.scenarios),
+                "scenarios_loaded": len(self.scenario_index),
                 "last_execution": None,
-                "last_config_update": datetime.now().isoformat()
+                "last_config_update": datetime.now().isoformat(),
+                "startup_profile": profile
             })
 
         self.log(
-            f"✅ Nodalink Engine initialized with {len(self.scenarios)} scenarios")
+            f"✅ Nodalink Engine initialized with {len(self.scenario_index)} scenarios")
+        phases = ", ".join(f"{name} {ms:.1f}ms" for name, ms in profile["phases"].items())
+        self.log(f"⏱️ Startup took {profile['total_ms']:.1f}ms "
+                 f"(imports {profile['import_ms']:.1f}ms; {phases})")
         if self.test_mode:
             self.log(
                 "🧪 Test mode enabled - scenarios will be logged but not executed")
 
-        # Register state change listeners for room sensors
-        self._setup_listeners()
+    def terminate(self):
+        """Flush pending journal records when the app stops."""
+        if self.journal:
+            self.journal.stop()
 
-    def _setup_listeners(self):
-        """Set up listeners for room sensor state changes."""
-        if not self.room_mappings:
-            self.log("⚠️ No room mappings configured, skipping listener setup")
-            return
+    # Configuration
 
-        for room_id, entity_id in self.room_mappings.items():
-            if entity_id:
-                self.listen_state(self._handle_room_sensor_change, entity_id,
-                                room_id=room_id, entity_id=entity_id)
-                self.log(f"👂 Listening for changes on {entity_id} (room: {room_id})")
-
-    def _handle_room_sensor_change(self, entity, attribute, old, new, kwargs):
-        """Handle room sensor state changes."""
-        room_id = kwargs.get("room_id")
-        entity_id = kwargs.get("entity_id")
-        
-        if new == "on" and old != "on":
-            self.log(f"🚶 Motion detected in {room_id} ({entity_id})")
-            self._process_room_interaction(room_id, "motion")
-        
-        # Update shared state with sensor activity
-        if self.shared_state:
-            self.shared_state.add_log_entry("INFO", 
-                f"Sensor state change: {entity_id} -> {new}", 
-                {"room_id": room_id, "old_state": old, "new_state": new})
-
-    def _process_room_interaction(self, room_id: str, interaction_type: str = "motion"):
-        """Process a room interaction and execute matching scenarios."""
-        try:
-            # Get current time bucket and day type
-            time_bucket = get_time_bucket(datetime.now(), self.time_bucket_minutes)
-            day_type = get_day_type(datetime.now())
+    def _apply_config(self, config: Dict[str, Any]):
+        """Set engine settings from a loaded configuration."""
+        self.config = config
+        settings = config.get("system_settings", {})
 
-            # Get active conditional flags
-            conditional_flags = self._get_active_conditional_flags()
-
-            # Build scenario ID
-            scenario_id = build_scenario_id(
-                room_id, time_bucket, day_type, conditional_flags, interaction_type
-            )
-
-            self.log(f"🔍 Looking for scenario: {scenario_id}")
-
-            # Try to find matching scenario (with fallback logic)
-            scenario = self._find_matching_scenario(
-                room_id, time_bucket, day_type, conditional_flags, interaction_type
-            )
-
-            if scenario:
-                self.log(f"✅ Found matching scenario: {scenario.get('scenario_id', 'Unknown')}")
-                self._execute_scenario(scenario)
-                
-                # Update shared state
-                if self.shared_state:
-                    self.shared_state.update_engine_status({
-                        "last_execution": datetime.now().isoformat()
-                    })
-            else:
-                self.log(f"❌ No matching scenario found for: {scenario_id}")
-                self._log_unmatched_scenario(scenario_id, room_id, time_bucket, 
-                                           day_type, conditional_flags, interaction_type)
-
-        except Exception as e:
-            self.log(f"❌ Error processing room interaction: {e}")
-            self.log(f"Traceback: {traceback.format_exc()}")
-
-    def _get_active_conditional_flags(self) -> List[str]:
-        """Get list of currently active conditional flags."""
-        active_flags = []
-        
-        for flag_id, entity_id in self.conditional_entities.items():
-            if entity_id:
-                try:
-                    state = self.get_state(entity_id)
-                    if state and state.lower() in ["on", "true", "active", "home"]:
-                        active_flags.append(flag_id)
-                except Exception as e:
-                    self.log(f"⚠️ Error checking conditional entity {entity_id}: {e}")
-        
-        return active_flags
-
-    def _log_unmatched_scenario(self, scenario_id: str, room_id: str, time_bucket: str,
-                               day_type: str, conditional_flags: List[str], interaction_type: str):
-        """Log unmatched scenario for analysis."""
-        try:
-            unmatched_data = {
-                "timestamp": datetime.now().isoformat(),
-                "scenario_id": scenario_id,
-                "room_id": room_id,
-                "time_bucket": time_bucket,
-                "day_type": day_type,
-                "conditional_flags": conditional_flags,
-                "interaction_type": interaction_type
-            }
-            
-            # Log to file
-            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
-            with open(self.log_file, 'a') as f:
-                f.write(json.dumps(unmatched_data) + '\n')
-            
-            # Update shared state
-            if self.shared_state:
-                self.shared_state.add_unmatched_scenario(unmatched_data)
-                
-        except Exception as e:
-            self.log(f"❌ Error logging unmatched scenario: {e}")
-
-    def is_port_open(self, port: int, host: str = "localhost") -> bool:
-        """Check if a port is already in use."""
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(1)
-                result = sock.connect_ex((host, port))
-                return result == 0
-        except Exception as e:
-            self.log(f"⚠️ Error checking port {port}: {e}")
-            return False
-
-    def launch_ui_server(self):
-        """Launch the FastAPI UI server if not already running."""
-        ui_port = 8002
-
-        if self.is_port_open(ui_port):
-            self.log(f"🌐 FastAPI UI server already running on port {ui_port}")
-            return
-
-        try:
-            self.log(f"🚀 Starting FastAPI UI server on port {ui_port}...")
-
-            def run_server():
-                try:
-                    # Check if FastAPI modules are available
-                    import uvicorn
-                    # Try to import the FastAPI app
-                    from .ui.fastapi_vue.main import app
-
-                    uvicorn.run(
-                        app,
-                        host="0.0.0.0",
-                        port=ui_port,
-                        log_level="info",
-                        access_log=False
-                    )
-                except ImportError as e:
-                    self.log(f"⚠️ FastAPI dependencies not available: {e}")
-                    self.log(
-                        "FastAPI UI server disabled - install fastapi and uvicorn to enable")
-                except Exception as e:
-                    self.log(f"❌ Error starting FastAPI server: {e}")
-
-            # Start server in daemon thread to avoid blocking AppDaemon
-            server_thread = threading.Thread(target=run_server, daemon=True)
-            server_thread.start()
-
-            self.log(
-                f"✅ FastAPI UI server started on http://0.0.0.0:{ui_port}")
-
-        except Exception as e:
-            self.log(f"❌ Failed to start FastAPI UI server: {e}")
+        self.room_mappings = self._extract_room_mappings()
+        self.conditional_entities = self._extract_conditional_entities()
+        self.flag_bits = {flag_id: FLAGS.bit(flag_id) for flag_id in self.conditional_entities}
+        self.device_rooms = self._extract_device_rooms()
+        self.entity_rooms = {entity_id: room_id
+                             for room_id, entity_id in self.room_mappings.items() if entity_id}
+        self.time_bucket_minutes = settings.get("time_bucket_minutes", 60)
+        self.test_mode = settings.get("test_mode", False)
+        self.fallback_enabled = settings.get("fallback_enabled", True)
+        self.allowed_domains = settings.get("allowed_domains", DEFAULT_ALLOWED_DOMAINS)
+        self.suppress_noop_actions = settings.get("suppress_noop_actions", False)
+        self.execution_mode = settings.get("execution_mode", "sync")
+        if self.execution_mode not in EXECUTION_MODES:
+            self.log(f"⚠️ Unknown execution_mode '{self.execution_mode}', using sync")
+            self.execution_mode = "sync"
+        self.execution_policy = settings.get("execution_policy", "replace")
+        if self.execution_policy not in EXECUTION_POLICIES:
+            self.log(f"⚠️ Unknown execution_policy '{self.execution_policy}', using replace")
+            self.execution_policy = "replace"
+        self.room_execution_policies = {
+            room: policy
+            for room, policy in settings.get("room_execution_policies", {}).items()
+            if policy in EXECUTION_POLICIES
+        }
+        self.executions.configure(self.execution_policy, self.room_execution_policies)
 
-    def _load_scenarios(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Load scenarios from JSON file."""
-        try:
-            if os.path.exists(self.scenario_file):
-                with open(self.scenario_file, 'r') as f:
-                    scenarios = json.load(f)
-                    self.log(
-                        f"📖 Loaded {len(scenarios)} scenario groups from {self.scenario_file}")
-                    return scenarios
-            else:
-                self.log(f"⚠️ Scenario file not found: {self.scenario_file}")
-                return {}
-        except Exception as e:
-            self.log(f"❌ Error loading scenarios: {e}")
-            return {}
+        # Apply log pipeline limits (rate limit, sampling) from config
+        if self.shared_state:
+            self.shared_state.log_pipeline.configure(**settings.get("log_pipeline", {}))
 
     def _load_config(self) -> Dict[str, Any]:
         """Load configuration from UI-managed config.json file."""
@@ -287,8 +262,8 @@ class NodalinkEngine(hass.Hass):
             if os.path.exists(self.config_file):
                 with open(self.config_file, 'r') as f:
                     config = json.load(f)
-                    self.log(f"📖 Loaded configuration from {self.config_file}")
-                    return config
+                self.log(f"📖 Loaded configuration from {self.config_file}")
+                return config
             else:
                 self.log(
                     f"⚠️ Config file not found: {self.config_file}, creating default")
@@ -314,10 +289,10 @@ class NodalinkEngine(hass.Hass):
                 "fallback_enabled": True,
                 "test_mode": False,
                 "auto_reload_config": True,
-                "allowed_domains": [
-                    "light", "switch", "scene", "script", "automation",
-                    "media_player", "climate", "cover", "fan", "vacuum"
-                ]
+                "allowed_domains": list(DEFAULT_ALLOWED_DOMAINS),
+                "suppress_noop_actions": False,
+                "execution_mode": "sync",
+                "execution_policy": "replace"
             }
         }
 
@@ -332,109 +307,33 @@ class NodalinkEngine(hass.Hass):
             self.log(f"❌ Error saving config: {e}")
 
     def _extract_room_mappings(self) -> Dict[str, str]:
-        """Extract room mappings from config."""
+        """Extract room sensor mappings from config (dict or plain string entries)."""
         room_mappings = {}
-        for room_key, room_data in self.config.get("room_mappings", {}).items():
-            if isinstance(room_data, dict) and "entity_id" in room_data:
-                room_mappings[room_key] = room_data["entity_id"]
+        for room_id, room_data in self.config.get("room_mappings", {}).items():
+            if isinstance(room_data, dict):
+                room_mappings[room_id] = room_data.get("entity_id", "")
+            else:
+                room_mappings[room_id] = room_data
         return room_mappings
 
     def _extract_conditional_entities(self) -> Dict[str, str]:
-        """Extract conditional entities from config."""
+        """Extract conditional flag entities from config (dict or plain string entries)."""
         conditional_entities = {}
-        for flag_key, flag_data in self.config.get("conditional_entities", {}).items():
-            if isinstance(flag_data, dict) and "entity_id" in flag_data:
-                conditional_entities[flag_key] = flag_data["entity_id"]
+        for flag_id, flag_data in self.config.get("conditional_entities", {}).items():
+            if isinstance(flag_data, dict):
+                conditional_entities[flag_id] = flag_data.get("entity_id", "")
+            else:
+                conditional_entities[flag_id] = flag_data
         return conditional_entities
 
-    def reload_scenarios(self):
-        """Reload scenarios from file."""
-        self.log("🔄 Reloading scenarios...")
-        self.scenarios = self._load_scenarios()
-        self.log(f"✅ Reloaded {len(self.scenarios)} scenario groups")
-
-    def reload_config(self):
-        """Reload configuration from file."""
-        self.log("🔄 Reloading configuration...")
-        self.config = self._load_config()
-        self.room_mappings = self._extract_room_mappings()
-        self.conditional_entities = self._extract_conditional_entities()
-        self.log("✅ Configuration reloaded")
-
-    def get_scenario_stats(self) -> Dict[str, Any]:
-        """Get statistics about loaded scenarios."""
-        total_scenarios = sum(len(scenarios)
-                              for scenarios in self.scenarios.values())
-        return {
-            "scenario_groups": len(self.scenarios),
-            "total_scenarios": total_scenarios,
-            "room_mappings": len(self.room_mappings),
-            "conditional_entities": len(self.conditional_entities),
-            "test_mode": self.test_mode
-        }
-
-    def simulate_scenario(self, room: str, interaction_type: str = "manual") -> Dict[str, Any]:
-        """Simulate a scenario execution without actually executing it."""
-        self.log(
-            f"🎭 Simulating scenario for room: {room}, interaction: {interaction_type}")
-
-        # Build a simple scenario ID for simulation
-        time_bucket = f"{datetime.now().hour:02d}-{(datetime.now().hour + 1) % 24:02d}"
-        scenario_id = f"{room}|{time_bucket}|{interaction_type}"
-
-        return {
-            "scenario_id": scenario_id,
-            "room": room,
-            "interaction_type": interaction_type,
-            "time_bucket": time_bucket,
-            "simulated": True,
-            "timestamp": datetime.now().isoformat()
-        }
-
-    def is_port_open(self, port: int, host: str = "localhost") -> bool:
-        """Check if a port is already in use."""
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(1)
-                result = sock.connect_ex((host, port))
-                return result == 0
-        except Exception as e:
-            self.log(f"⚠️ Error checking port {port}: {e}")
-            return False
-
-    def launch_ui_server(self):
-        """Launch the FastAPI UI server if not already running."""
-        ui_port = 8002
-
-        if self.is_port_open(ui_port):
-            self.log(f"🌐 FastAPI UI server already running on port {ui_port}")
-            return
-
-        try:
-            self.log(f"🚀 Starting FastAPI UI server on port {ui_port}...")
-
-            def run_server():
-                try:
-                    import uvicorn
-                    uvicorn.run(
-                        "apps.Nodalink.ui.fastapi_vue.main:app",
-                        host="0.0.0.0",
-                        port=ui_port,
-                        log_level="info",
-                        access_log=False
-                    )
-                except Exception as e:
-                    self.log(f"❌ Error starting FastAPI server: {e}")
-
-            # Start server in daemon thread to avoid blocking AppDaemon
-            server_thread = threading.Thread(target=run_server, daemon=True)
-            server_thread.start()
-
-            self.log(
-                f"✅ FastAPI UI server started on http://0.0.0.0:{ui_port}")
-
-        except Exception as e:
-            self.log(f"❌ Failed to start FastAPI UI server: {e}")
+    def _extract_device_rooms(self) -> Dict[str, str]:
+        """Extract button device to room mappings (optional "device_ids" per room)."""
+        device_rooms = {}
+        for room_id, room_data in self.config.get("room_mappings", {}).items():
+            if isinstance(room_data, dict):
+                for device_id in room_data.get("device_ids", []):
+                    device_rooms[device_id] = room_id
+        return device_rooms
 
     def _load_scenarios(self) -> Dict[str, List[Dict[str, Any]]]:
         """Load scenarios from JSON file."""
@@ -443,7 +342,7 @@ class NodalinkEngine(hass.Hass):
                 with open(self.scenario_file, 'r') as f:
                     scenarios = json.load(f)
                 self.log(
-                    f"📁 Loaded {len(scenarios)} scenarios from {self.scenario_file}")
+                    f"📖 Loaded {len(scenarios)} scenario groups from {self.scenario_file}")
                 return scenarios
             else:
                 self.log(f"⚠️ Scenario file not found: {self.scenario_file}")
@@ -452,420 +351,641 @@ class NodalinkEngine(hass.Hass):
             self.log(f"❌ Error loading scenarios: {e}")
             return {}
 
-    def _load_config(self) -> Dict[str, Any]:
-        """Load configuration from UI-managed config.json file."""
-        try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                self.log(f"🔧 Loaded configuration from {self.config_file}")
-                return config
-            else:
-                self.log(f"⚠️ Config file not found: {self.config_file}")
-                return self._create_default_config()
-        except Exception as e:
-            self.log(f"❌ Error loading config: {e}")
-            return self._create_default_config()
+    def _build_scenario_index(self, scenarios: Dict[str, Any]) -> ScenarioIndex:
+        """Compile scenarios into a ScenarioIndex, reporting invalid IDs once."""
+        index = ScenarioIndex(scenarios)
+        for scenario_id, error in index.errors.items():
+            self.log(f"⚠️ Ignoring invalid scenario '{scenario_id}': {error}")
+        return index
+
+    def _compile_action_plans(self, scenarios: Dict[str, Any]) -> Dict[str, ScenarioPlan]:
+        """Compile scenario actions into service calls, reporting rejected actions once."""
+        plans = compile_scenario_plans(scenarios, self.allowed_domains)
+        for scenario_id, plan in plans.items():
+            for reason in plan.rejected:
+                self.log(f"⚠️ {scenario_id} - {reason} (skipped)")
+        return plans
 
-    def _create_default_config(self) -> Dict[str, Any]:
-        """Create default configuration structure."""
-        default_config = {
-            "_metadata": {
-                "version": "1.0.0",
-                "created": datetime.now().isoformat(),
-                "description": "Nodalink system configuration"
-            },
-            "room_mappings": {},
-            "conditional_entities": {},
-            "system_settings": {
-                "time_bucket_minutes": 60,
-                "fallback_enabled": True,
-                "test_mode": False,
-                "auto_reload_config": True,
-                "allowed_domains": [
-                    "light", "switch", "scene", "script", "automation",
-                    "media_player", "climate", "cover", "fan", "vacuum"
-                ]
-            }
-        }
-
-        # Save default config
-        try:
-            with open(self.config_file, 'w') as f:
-                json.dump(default_config, f, indent=2)
-            self.log(f"📝 Created default config file: {self.config_file}")
-        except Exception as e:
-            self.log(f"❌ Error creating default config: {e}")
-
-        return default_config
-
-    def _extract_room_mappings(self) -> Dict[str, str]:
-        """Extract simple room mappings from config for backward compatibility."""
-        room_mappings = {}
-        config_rooms = self.config.get("room_mappings", {})
-
-        for room_id, room_config in config_rooms.items():
-            if isinstance(room_config, dict):
-                room_mappings[room_id] = room_config.get("entity_id", "")
-            else:
-                # Backward compatibility with simple string mappings
-                room_mappings[room_id] = room_config
-
-        return room_mappings
-
-    def _extract_conditional_entities(self) -> Dict[str, str]:
-        """Extract simple conditional entity mappings from config for backward compatibility."""
-        conditional_entities = {}
-        config_flags = self.config.get("conditional_entities", {})
-
-        for flag_id, flag_config in config_flags.items():
-            if isinstance(flag_config, dict):
-                conditional_entities[flag_id] = flag_config.get(
-                    "entity_id", "")
-            else:
-                # Backward compatibility with simple string mappings
-                conditional_entities[flag_id] = flag_config
+    def reload_scenarios(self):
+        """Reload scenarios from file and update shared state."""
+        self.log("🔄 Reloading scenarios...")
+        old_count = len(self.scenario_index)
+        self.scenarios = self._load_scenarios()
+        self.scenario_index = self._build_scenario_index(self.scenarios)
+        self.action_plans = self._compile_action_plans(self.scenarios)
+        self._setup_state_cache()
+        self._setup_timer_tick()
+        new_count = len(self.scenario_index)
 
-        return conditional_entities
+        if self.shared_state:
+            self.shared_state.update_scenarios(self.scenarios)
+            self.shared_state.update_engine_status({
+                "scenarios_loaded": new_count,
+                "last_config_update": datetime.now().isoformat()
+            })
+            self.shared_state.add_log_entry("INFO",
+                f"Scenarios reloaded: {old_count} -> {new_count}")
 
-    def _setup_config_watcher(self):
-        """Set up file watcher for config changes (simplified approach)."""
-        # For now, we'll implement a manual reload method
-        # In production, this could watch file modification times
-        self.log("🔄 Config auto-reload enabled (manual reload available)")
+        self.log(f"✅ Reloaded scenarios: {old_count} -> {new_count}")
 
     def reload_config(self):
-        """Manually reload configuration from file."""
+        """Reload configuration from file, re-register listeners and update shared state."""
         self.log("🔄 Reloading configuration...")
+        old_room_mappings = self.room_mappings
+        old_execution_mode = self.execution_mode
+        old_allowed_domains = self.allowed_domains
+        self._apply_config(self._load_config())
 
-        # Store old mappings for comparison
-        old_room_mappings = self.room_mappings.copy()
-        old_conditional_entities = self.conditional_entities.copy()
+        if old_allowed_domains != self.allowed_domains:
+            self.log("🎯 Allowed domains changed, recompiling actions...")
+            self.action_plans = self._compile_action_plans(self.scenarios)
 
-        # Reload config
-        self.config = self._load_config()
-        self.room_mappings = self._extract_room_mappings()
-        self.conditional_entities = self._extract_conditional_entities()
-        self.time_bucket_minutes = self.config.get(
-            "system_settings", {}).get("time_bucket_minutes", 60)
-        self.test_mode = self.config.get(
-            "system_settings", {}).get("test_mode", False)
-        self.fallback_enabled = self.config.get(
-            "system_settings", {}).get("fallback_enabled", True)
-        self.allowed_domains = self.config.get("system_settings", {}).get("allowed_domains", [
-            "light", "switch", "scene", "script", "automation",
-            "media_player", "climate", "cover", "fan", "vacuum"
-        ])
-
-        # Check if we need to update listeners
         if old_room_mappings != self.room_mappings:
             self.log("🎯 Room mappings changed, updating listeners...")
-            # Remove old listeners
-            # Note: AppDaemon doesn't have a direct way to remove specific listeners
-            # In a full implementation, you'd track listener handles and remove them
+            self._setup_listeners()
+        elif old_execution_mode != self.execution_mode:
+            self.log(f"🎯 Execution mode changed to {self.execution_mode}, updating listeners...")
+            self._setup_listeners()
+        self._setup_state_cache()
+        self._setup_timer_tick()
+
+        if self.shared_state:
+            self.shared_state.update_config(self.config)
+            self.shared_state.add_log_entry("INFO", "Configuration reloaded")
 
-            # Setup new listeners
-            for entity_id in self.room_mappings.values():
-                if entity_id.startswith("binary_sensor."):
-                    self.listen_state(self._handle_presence_change, entity_id)
+        self.log("✅ Configuration reloaded")
 
-        self.log("✅ Configuration reloaded successfully")
+    # Listeners
 
     def _setup_listeners(self):
-        """Setup event listeners for triggers."""
-        # Listen to button events
-        self.listen_event(self._handle_button_event, "zha_event")
-        self.listen_event(self._handle_button_event, "deconz_event")
+        """Register trigger listeners, replacing any registered earlier."""
+        for kind, handle in self.listener_handles:
+            try:
+                if kind == "event":
+                    self.cancel_listen_event(handle)
+                else:
+                    self.cancel_listen_state(handle)
+            except Exception as e:
+                self.log(f"⚠️ Error cancelling listener: {e}")
+        self.listener_handles = []
 
-        # Listen to presence/motion sensors
-        for entity_id in self.room_mappings.values():
-            if entity_id.startswith("binary_sensor."):
-                self.listen_state(self._handle_presence_change, entity_id)
+        if self.execution_mode == "async":
+            handle_event = self._handle_event_async
+            handle_room_sensor_change = self._handle_room_sensor_change_async
+        else:
+            handle_event = self._handle_event
+            handle_room_sensor_change = self._handle_room_sensor_change
 
-        # Listen to custom Nodalink triggers
-        self.listen_event(self._handle_nodalink_event, "nodalink_trigger")
+        for event_name in ("zha_event", "deconz_event", "nodalink_trigger"):
+            self.listener_handles.append(
+                ("event", self.listen_event(handle_event, event_name)))
 
-        self.log("🎯 Event listeners configured")
+        if not self.room_mappings:
+            self.log("⚠️ No room mappings configured, skipping sensor listeners")
+        for room_id, entity_id in self.room_mappings.items():
+            if entity_id:
+                self.listener_handles.append(("state", self.listen_state(
+                    handle_room_sensor_change, entity_id, room_id=room_id)))
+                self.log(f"👂 Listening for changes on {entity_id} (room: {room_id})")
 
-    def _handle_button_event(self, event_name: str, data: Dict[str, Any], kwargs: Dict[str, Any]):
-        """Handle button press events."""
-        try:
-            device_id = data.get("device_id")
-            command = data.get("command", "")
+        self.log(f"🎯 Event listeners configured ({self.execution_mode} mode)")
 
-            # Map device to room
-            room = self._get_room_from_device(device_id)
-            if not room:
-                self.log(f"🔍 Unknown device: {device_id}")
-                return
-
-            # Determine interaction type
-            interaction_type = self._map_button_command(command)
-
-            # Process scenario
-            self._process_scenario_trigger(
-                room=room,
-                interaction_type=interaction_type,
-                trigger_type="button_press",
-                source_entity=device_id
-            )
+    def _setup_state_cache(self):
+        """Subscribe to the states of diffable action targets (suppress_noop_actions)."""
+        for handle in self.state_cache_handles:
+            try:
+                self.cancel_listen_state(handle)
+            except Exception as e:
+                self.log(f"⚠️ Error cancelling listener: {e}")
+        self.state_cache_handles = []
+        if not self.suppress_noop_actions:
+            return
 
-        except Exception as e:
-            self.log(f"❌ Error handling button event: {e}")
-            self.log(traceback.format_exc())
+        entities = self.state_diff.prepare(self.action_plans)
+        for entity_id in entities:
+            self.state_diff.cache.update(entity_id, self.get_state(entity_id, attribute="all"))
+            self.state_cache_handles.append(self.listen_state(
+                self._handle_target_state_change, entity_id, attribute="all"))
+        self.log(f"👂 Caching state of {len(entities)} action targets for no-op suppression")
 
-    def _handle_presence_change(self, entity: str, attribute: str, old: str, new: str, kwargs: Dict[str, Any]):
-        """Handle presence/motion sensor changes."""
-        try:
-            if new != "on":
-                return
+    def _handle_event(self, event_name: str, data: Dict[str, Any], kwargs: Dict[str, Any]):
+        """Handle button and Nodalink trigger events."""
+        self.pipeline.run({"source": "event", "event": event_name, "data": data or {}})
 
-            # Map entity to room
-            room = self._get_room_from_entity(entity)
-            if not room:
-                return
-
-            # Process scenario
-            self._process_scenario_trigger(
-                room=room,
-                interaction_type="presence_detected",
-                trigger_type="presence",
-                source_entity=entity
-            )
+    def _handle_room_sensor_change(self, entity: str, attribute: str, old: Any, new: Any,
+                                   kwargs: Dict[str, Any]):
+        """Handle room sensor state changes."""
+        self.pipeline.run({"source": "state", "entity": entity, "old": old, "new": new})
 
-        except Exception as e:
-            self.log(f"❌ Error handling presence change: {e}")
-            self.log(traceback.format_exc())
+        self._log_sensor_change(entity, old, new, kwargs)
 
-    def _handle_nodalink_event(self, event_name: str, data: Dict[str, Any], kwargs: Dict[str, Any]):
-        """Handle custom Nodalink trigger events."""
-        try:
-            room = data.get("room", "unknown")
-            interaction_type = data.get("interaction_type", "custom")
-            trigger_type = data.get("trigger_type", "manual")
-
-            self._process_scenario_trigger(
-                room=room,
-                interaction_type=interaction_type,
-                trigger_type=trigger_type,
-                source_entity="nodalink_manual"
-            )
+    async def _handle_event_async(self, event_name: str, data: Dict[str, Any],
+                                  kwargs: Dict[str, Any]):
+        """Handle button and Nodalink trigger events on the event loop (async mode)."""
+        await self.pipeline.run_async({"source": "event", "event": event_name, "data": data or {}})
 
-        except Exception as e:
-            self.log(f"❌ Error handling Nodalink event: {e}")
+    async def _handle_room_sensor_change_async(self, entity: str, attribute: str, old: Any,
+                                               new: Any, kwargs: Dict[str, Any]):
+        """Handle room sensor state changes on the event loop (async mode)."""
+        await self.pipeline.run_async({"source": "state", "entity": entity, "old": old, "new": new})
+        self._log_sensor_change(entity, old, new, kwargs)
 
-    def _process_scenario_trigger(self, room: str, interaction_type: str, trigger_type: str, source_entity: str):
-        """Process a scenario trigger and execute matching actions."""
-        try:
-            # Get current context
-            current_time = datetime.now()
-            time_bucket = get_time_bucket(
-                current_time, self.time_bucket_minutes)
-            day_type = get_day_type(current_time)
-
-            # Evaluate conditional flags
-            optional_flags = self._evaluate_optional_flags()
-
-            # Build scenario ID
-            scenario_id = build_scenario_id(
-                room=room,
-                time_bucket=time_bucket,
-                day_type=day_type,
-                optional_flags=optional_flags,
-                interaction_type=interaction_type
+    def _log_sensor_change(self, entity: str, old: Any, new: Any, kwargs: Dict[str, Any]):
+        """Update shared state with sensor activity (sampled/rate-limited per sensor)."""
+        if self.shared_state:
+            self.shared_state.add_log_entry("INFO",
+                f"Sensor state change: {entity} -> {new}",
+                {"room_id": kwargs.get("room_id"), "old_state": old, "new_state": new},
+                source=entity)
+
+    def _handle_target_state_change(self, entity: str, attribute: str, old: Any, new: Any,
+                                    kwargs: Dict[str, Any]):
+        """Keep the cached state of action targets current."""
+        self.state_diff.cache.update(entity, new)
+
+    # Pipeline stages
+
+    def _ingest_trigger(self, raw: Dict[str, Any]) -> Optional[Trigger]:
+        """Normalize a raw event or state change into a Trigger (None to ignore it)."""
+        if raw["source"] == "state":
+            if raw["new"] != "on" or raw["old"] == "on":
+                return None
+            room = self.entity_rooms.get(raw["entity"])
+            if not room:
+                return None
+            self.log(f"🚶 Presence detected in {room} ({raw['entity']})")
+            return Trigger(room, "presence_detected", "presence", raw["entity"])
+
+        data = raw["data"]
+        if raw["event"] == "nodalink_trigger":
+            return Trigger(
+                room=data.get("room", "unknown"),
+                interaction_type=data.get("interaction_type", "custom"),
+                trigger_type=data.get("trigger_type", "manual"),
+                source_entity="nodalink_manual",
+                data=data
             )
 
-            self.log(f"🎯 Processing trigger: {scenario_id}")
+        device_id = data.get("device_id")
+        room = self.device_rooms.get(device_id)
+        if not room:
+            self.log(f"🔍 Unknown device: {device_id}")
+            return None
+        command = str(data.get("command", data.get("event", "")))
+        return Trigger(room, BUTTON_COMMANDS.get(command, command), "button_press",
+                       device_id, data)
+
+    def _build_context(self, trigger: Trigger) -> TriggerContext:
+        """Evaluate time bucket, day type and active flags for a trigger."""
+        return self._make_context(trigger, self.get_now(), self._get_active_flag_mask())
+
+    async def _build_context_async(self, trigger: Trigger) -> TriggerContext:
+        """Async variant of _build_context; flag states are read concurrently."""
+        current_time, flag_mask = await asyncio.gather(
+            _resolve(self.get_now()), self._get_active_flag_mask_async())
+        return self._make_context(trigger, current_time, flag_mask)
+
+    def _make_context(self, trigger: Trigger, current_time: datetime,
+                      flag_mask: int) -> TriggerContext:
+        time_bucket = get_time_bucket(current_time, self.time_bucket_minutes)
+        day_type = get_day_type(current_time)
+        key = ScenarioKey.of(trigger.room, time_bucket, day_type,
+                             flag_mask, trigger.interaction_type)
+
+        self.log(f"🎯 Processing trigger: {key.scenario_id}")
+        return TriggerContext(trigger, current_time, time_bucket, day_type, key)
+
+    def _match_context(self, context: TriggerContext) -> Optional[MatchResult]:
+        """Resolve the scenario for a context (None when nothing matches)."""
+        match = self._resolve_match(context)
+        if match is None:
+            self._log_unmatched_scenario(context)
+        return match
+
+    async def _match_context_async(self, context: TriggerContext) -> Optional[MatchResult]:
+        """Async variant of _match_context; unmatched contexts are logged in the executor."""
+        match = self._resolve_match(context)
+        if match is None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._log_unmatched_scenario, context)
+        return match
+
+    def _resolve_match(self, context: TriggerContext) -> Optional[MatchResult]:
+        resolved = self.scenario_index.resolve_key(
+            context.key, self.fallback_enabled, context.current_time.weekday())
+
+        if resolved is None:
+            self.log(f"❌ No matching scenario found for: {context.scenario_id}")
+            return None
 
-            # Find and execute matching scenario
-            actions = self._find_matching_scenario(scenario_id)
+        scenario_id, fallback_level = resolved
+        if fallback_level:
+            self.log(f"🔄 Using fallback scenario: {scenario_id} for {context.scenario_id}")
+        return MatchResult(context, scenario_id, fallback_level)
+
+    def _plan_actions(self, match: MatchResult) -> ActionPlan:
+        """Look up the service calls compiled for the matched scenario."""
+        scenario_plan = self.action_plans.get(match.scenario_id)
+        if scenario_plan is None:
+            return ActionPlan(match, ())
+        self.log(f"✅ Found {len(scenario_plan.actions)} actions for scenario: {match.scenario_id}")
+        return ActionPlan(match, scenario_plan.actions, scenario_plan.rejected)
+
+    def _diff_plan(self, plan: ActionPlan, load: bool = True) -> ActionPlan:
+        """Drop calls whose targets are already in the requested state."""
+        if not self.suppress_noop_actions:
+            return plan
+        actions = []
+        for action in plan.actions:
+            changed = self.state_diff.diff(action, load)
+            if changed is not None:
+                actions.append(changed)
+        suppressed = len(plan.actions) - len(actions)
+        if suppressed:
+            self.log(f"⏭️ Suppressed {suppressed} no-op actions for scenario: {plan.match.scenario_id}")
+        return ActionPlan(plan.match, tuple(actions), plan.rejected, suppressed)
+
+    async def _diff_plan_async(self, plan: ActionPlan) -> ActionPlan:
+        """Async variant of _diff_plan; expired targets are re-read before diffing."""
+        if not self.suppress_noop_actions:
+            return plan
+        cache = self.state_diff.cache
+        entity_ids = cache.expired({entity_id for action in plan.actions
+                                    for entity_id in action.entity_ids})
+        states = await asyncio.gather(
+            *(_resolve(self.get_state(entity_id, attribute="all")) for entity_id in entity_ids))
+        for entity_id, state in zip(entity_ids, states):
+            cache.update(entity_id, state)
+        return self._diff_plan(plan, load=False)
+
+    def _dispatch_plan(self, plan: ActionPlan) -> DispatchResult:
+        """Execute the planned service calls (logged only in test mode)."""
+        result = DispatchResult(plan)
+        scenario_id = plan.match.scenario_id
 
-            if actions:
-                self.log(
-                    f"✅ Found {len(actions)} actions for scenario: {scenario_id}")
-                self._execute_actions(actions, scenario_id)
-            else:
-                # Log unmatched scenario
-                self._log_unmatched_scenario(scenario_id, {
-                    "room": room,
-                    "time_bucket": time_bucket,
-                    "day_type": day_type,
-                    "optional_flags": optional_flags,
-                    "interaction_type": interaction_type,
-                    "trigger_type": trigger_type,
-                    "source_entity": source_entity,
-                    "timestamp": current_time.isoformat()
-                })
+        if self.test_mode:
+            self.log(f"🧪 TEST MODE - Would execute {len(plan.actions)} actions for {scenario_id}")
+            for i, action in enumerate(plan.actions, 1):
+                self.log(f"  Action {i}: {action.describe()}")
+            return result
+
+        execution, previous = self._begin_execution(plan, result)
+        if execution is None:
+            return result
+        if previous is not None:
+            # Runs from whichever callback finishes the previous execution
+            result.status = "queued"
+            previous.add_done_callback(
+                lambda: self._send_actions(plan, execution, DispatchResult(plan)))
+            return result
+        self._send_actions(plan, execution, result)
+        return result
 
-        except Exception as e:
-            self.log(f"❌ Error processing scenario trigger: {e}")
-            self.log(traceback.format_exc())
+    def _begin_execution(self, plan: ActionPlan,
+                         result: DispatchResult) -> Tuple[Optional[Execution], Optional[Execution]]:
+        """Register the execution of a plan with its room's execution policy."""
+        room = plan.match.context.trigger.room
+        execution, previous = self.executions.begin(room, plan.match.scenario_id)
+        if execution is None:
+            result.status = "ignored"
+            self.log(f"⏭️ Ignoring {plan.match.scenario_id}: an execution is still running in {room}")
+        elif previous is not None:
+            self.log(f"⏳ Queueing {plan.match.scenario_id} behind {previous.scenario_id} in {room}")
+        return execution, previous
+
+    def _send_actions(self, plan: ActionPlan, execution: Execution, result: DispatchResult):
+        """Send the service calls of a plan in order until the execution is cancelled."""
+        scenario_id = plan.match.scenario_id
+        self.log(f"🚀 Executing {len(plan.actions)} actions for scenario: {scenario_id}")
+        try:
+            for i, action in enumerate(plan.actions, 1):
+                if execution.cancelled:
+                    result.status = "cancelled"
+                    self.log(f"🛑 {scenario_id} superseded, skipping "
+                             f"{len(plan.actions) - i + 1} remaining actions")
+                    break
+                if action.deferred:
+                    self._schedule_action(plan, execution, i, action, result)
+                    continue
+                try:
+                    self.call_service(action.call, **action.data)
+                    self._action_sent(action, result)
+                except Exception as e:
+                    result.errors.append(f"Action {i}: {e}")
+                    self.log(f"❌ Action {i}: Service call failed: {e}")
+        finally:
+            self.executions.settle(execution)
+
+    async def _dispatch_plan_async(self, plan: ActionPlan) -> DispatchResult:
+        """Async variant of _dispatch_plan; runs of different rooms proceed concurrently."""
+        if self.test_mode or not plan.actions:
+            return self._dispatch_plan(plan)
+
+        result = DispatchResult(plan)
+        execution, previous = self._begin_execution(plan, result)
+        if execution is None:
+            return result
+        try:
+            if previous is not None:
+                await previous.wait()
+                if execution.cancelled:
+                    # Superseded while waiting in the queue
+                    result.status = "cancelled"
+                    self.log(f"🛑 {plan.match.scenario_id} superseded before it started")
+                    return result
+            execution.task = asyncio.ensure_future(
+                self._send_actions_async(plan, execution, result))
+            await execution.task
+        except asyncio.CancelledError:
+            if not execution.cancelled:
+                raise
+            result.status = "cancelled"
+            self.log(f"🛑 {plan.match.scenario_id} superseded by a newer trigger")
+        finally:
+            self.executions.settle(execution)
+        return result
 
-    def _find_matching_scenario(self, scenario_id: str) -> Optional[List[Dict[str, Any]]]:
-        """Find matching scenario with fallback logic."""
-        # Try exact match first
-        if scenario_id in self.scenarios:
-            return self.scenarios[scenario_id]
+    async def _send_actions_async(self, plan: ActionPlan, execution: Execution,
+                                  result: DispatchResult):
+        """Send the service calls of a plan in order, awaiting each, and schedule deferred ones."""
+        self.log(f"🚀 Executing {len(plan.actions)} actions for scenario: {plan.match.scenario_id}")
+        for i, action in enumerate(plan.actions, 1):
+            if execution.cancelled:
+                result.status = "cancelled"
+                self.log(f"🛑 {plan.match.scenario_id} superseded, skipping "
+                         f"{len(plan.actions) - i + 1} remaining actions")
+                break
+            if action.deferred:
+                self._schedule_action(plan, execution, i, action, result)
+                continue
+            try:
+                await _resolve(self.call_service(action.call, **action.data))
+                self._action_sent(action, result)
+            except Exception as e:
+                result.errors.append(f"Action {i}: {e}")
+                self.log(f"❌ Action {i}: Service call failed: {e}")
+
+    def _action_sent(self, action: CompiledAction, result: Optional[DispatchResult] = None):
+        if result is not None:
+            result.executed += 1
+        if self.suppress_noop_actions:
+            self.state_diff.cache.invalidate(action.entity_ids)
+
+    # Deferred actions
+
+    def _schedule_action(self, plan: ActionPlan, execution: Execution, index: int,
+                         action: CompiledAction, result: DispatchResult):
+        """Put a deferred ("delay"/"at") action on the timer wheel."""
+        current_time = plan.match.context.current_time
+        if action.at is not None:
+            hour, minute, second = action.at
+            due_time = current_time.replace(hour=hour, minute=minute, second=second, microsecond=0)
+            if due_time <= current_time:
+                due_time += timedelta(days=1)
+            due = due_time.timestamp()
+        else:
+            due = current_time.timestamp() + action.delay
+
+        execution.deferred += 1
+        execution.timers.append(self.timer_wheel.schedule(
+            due, self._run_deferred_action, plan, execution, index, action))
+        result.scheduled += 1
+        self.log(f"⏰ Scheduled action {index} of {plan.match.scenario_id}: {action.describe()}")
+
+    def _setup_timer_tick(self):
+        """Drive the timer wheel while scenarios have deferred actions (or timers are pending)."""
+        needed = len(self.timer_wheel) > 0 or any(
+            action.deferred for plan in self.action_plans.values() for action in plan.actions)
+        if needed and self.timer_tick_handle is None:
+            self.timer_tick_handle = self.run_every(
+                self._tick_timer_wheel, self.get_now() + timedelta(seconds=1), 1)
+        elif not needed and self.timer_tick_handle is not None:
+            self.cancel_timer(self.timer_tick_handle)
+            self.timer_tick_handle = None
+
+    def _tick_timer_wheel(self, kwargs: Dict[str, Any]):
+        """Run the deferred actions that fell due (single repeating timer)."""
+        for entry in self.timer_wheel.advance(self.get_now().timestamp()):
+            try:
+                entry.run()
+            except Exception as e:
+                self.log(f"❌ Error running deferred action: {e}")
 
-        if not self.fallback_enabled:
-            return None
+    def _run_deferred_action(self, plan: ActionPlan, execution: Execution, index: int,
+                             action: CompiledAction):
+        """Send a deferred action unless its execution was superseded."""
+        execution.deferred -= 1
+        if not execution.cancelled:
+            try:
+                self.call_service(action.call, **action.data)
+                self._action_sent(action)
+            except Exception as e:
+                self.log(f"❌ Deferred action {index} of {plan.match.scenario_id} failed: {e}")
+        self.executions.settle(execution)
+
+    def _on_pipeline_complete(self, run: PipelineRun):
+        """Report a finished run to the journal and shared state."""
+        if run.error:
+            self.log(f"❌ Error processing scenario trigger: {run.error}")
+        context = run.context
+        if context is None:
+            # Ignored raw events are not executions
+            if run.error and self.shared_state:
+                self.shared_state.add_log_entry("ERROR", f"Trigger failed: {run.error}")
+            return
 
-        # Parse scenario ID for fallback matching
-        parts = scenario_id.split("|")
-        if len(parts) < 2:
-            return None
+        match = run.match
+        plan = run.outputs.get("plan")
+        dispatch = run.dispatch
+        errors = list(plan.rejected) if plan else []
+        if dispatch:
+            errors.extend(dispatch.errors)
+        if run.error:
+            errors.append(run.error)
+
+        if dispatch and self.shared_state:
+            status = {"last_execution": datetime.now().isoformat()}
+            if self.suppress_noop_actions:
+                status["action_suppression"] = self.state_diff.get_stats()
+            self.shared_state.update_engine_status(status)
+            if dispatch.errors:
+                self.shared_state.add_log_entry("ERROR",
+                    f"Failed actions in scenario {match.scenario_id}: {'; '.join(dispatch.errors)}")
+
+        if not self.journal:
+            return
+        current_time = context.current_time
+        trigger = context.trigger
+        self.journal.record({
+            "ts": current_time.timestamp(),
+            "day": current_time.date().isoformat(),
+            "hour": current_time.hour,
+            "room": trigger.room,
+            "scenario_id": match.scenario_id if match else None,
+            "requested_id": context.scenario_id,
+            "fallback_level": match.fallback_level if match else None,
+            "day_type": context.day_type,
+            "interaction_type": trigger.interaction_type,
+            "optional_flags": context.optional_flags,
+            "trigger_type": trigger.trigger_type,
+            "action_count": len(plan.actions) if plan else 0,
+            "latency_ms": run.latency_ms,
+            "errors": errors,
+            "status": dispatch.status if dispatch else ("completed" if match else "unmatched")
+        })
+
+    # Helpers
+
+    async def _get_active_flag_mask_async(self) -> int:
+        """Async variant of _get_active_flag_mask; the flag entities are read concurrently."""
+        flags = [(flag_id, entity_id) for flag_id, entity_id in self.conditional_entities.items()
+                 if entity_id]
+        states = await asyncio.gather(
+            *(_resolve(self.get_state(entity_id)) for _, entity_id in flags),
+            return_exceptions=True)
+        mask = 0
+        for (flag_id, entity_id), state in zip(flags, states):
+            if isinstance(state, Exception):
+                self.log(f"⚠️ Error checking conditional entity {entity_id}: {state}")
+            elif state and str(state).lower() in ACTIVE_FLAG_STATES:
+                mask |= self.flag_bits[flag_id]
+        return mask
+
+    def _get_active_flag_mask(self) -> int:
+        """Get the bitmask of currently active conditional flags."""
+        mask = 0
+        for flag_id, entity_id in self.conditional_entities.items():
+            if entity_id:
+                try:
+                    state = self.get_state(entity_id)
+                    if state and str(state).lower() in ACTIVE_FLAG_STATES:
+                        mask |= self.flag_bits[flag_id]
+                except Exception as e:
+                    self.log(f"⚠️ Error checking conditional entity {entity_id}: {e}")
+        return mask
 
-        room = parts[0]
-        time_bucket = parts[1]
-        day_type = parts[2] if len(parts) > 2 else ""
-        optional_flags = parts[3] if len(parts) > 3 else ""
-        interaction_type = parts[4] if len(parts) > 4 else ""
+    def _log_unmatched_scenario(self, context: TriggerContext):
+        """Log unmatched scenario for analysis (blocking file I/O)."""
+        trigger = context.trigger
+        try:
+            unmatched_data = {
+                "scenario_id": context.scenario_id,
+                "room": trigger.room,
+                "time_bucket": context.time_bucket,
+                "day_type": context.day_type,
+                "optional_flags": list(context.optional_flags),
+                "interaction_type": trigger.interaction_type,
+                "trigger_type": trigger.trigger_type,
+                "source_entity": trigger.source_entity,
+                "timestamp": context.current_time.isoformat()
+            }
 
-        # Fallback hierarchy
-        fallback_patterns = []
+            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+            with open(self.log_file, 'a') as f:
+                f.write(json.dumps(unmatched_data) + '\n')
 
-        # Remove interaction type
-        if interaction_type:
-            fallback_id = f"{room}|{time_bucket}|{day_type}|{optional_flags}"
-            fallback_patterns.append(fallback_id.rstrip("|"))
+            if self.shared_state:
+                self.shared_state.add_unmatched_scenario(unmatched_data)
 
-        # Remove optional flags
-        if optional_flags:
-            fallback_id = f"{room}|{time_bucket}|{day_type}"
-            fallback_patterns.append(fallback_id.rstrip("|"))
+        except Exception as e:
+            self.log(f"❌ Error logging unmatched scenario: {e}")
 
-        # Remove day type
-        if day_type:
-            fallback_id = f"{room}|{time_bucket}"
-            fallback_patterns.append(fallback_id)
+    def simulate_scenario(self, room: str, interaction_type: str = "manual") -> Dict[str, Any]:
+        """Simulate a scenario execution for testing (nothing is executed)."""
+        trigger = Trigger(room, interaction_type, "simulation", "nodalink_simulation")
+        run = self.pipeline.run(trigger, start="context", stop_after="plan")
+        context = run.context
+        if context is None:
+            return {"room": room, "interaction_type": interaction_type,
+                    "scenario_found": False, "error": run.error}
+
+        result = simulate_batch(
+            self.scenario_index,
+            [{
+                "room": room,
+                "interaction_type": interaction_type,
+                "timestamp": context.current_time,
+                "optional_flags": context.optional_flags
+            }],
+            self.time_bucket_minutes,
+            self.fallback_enabled
+        )["results"][0]
+
+        plan = run.outputs.get("plan")
+        result.update({
+            "conditional_flags": list(context.optional_flags),
+            "timestamp": context.current_time.isoformat(),
+            "scenario_found": run.match is not None
+        })
+        if plan:
+            result["actions"] = [action.to_dict() for action in plan.actions]
+            result["rejected_actions"] = list(plan.rejected)
+            self.log(f"🎭 Simulation successful for {room}: {plan.match.scenario_id} "
+                     f"({result['fallback']}, {len(plan.actions)} actions)")
+        else:
+            self.log(f"🎭 Simulation for {room}: No matching scenario found")
 
-        # Room only
-        fallback_patterns.append(room)
+        return result
 
-        # Try fallback patterns
-        for pattern in fallback_patterns:
-            if pattern in self.scenarios:
-                self.log(
-                    f"🔄 Using fallback scenario: {pattern} for {scenario_id}")
-                return self.scenarios[pattern]
+    def get_scenario_stats(self) -> Dict[str, Any]:
+        """Get statistics about loaded scenarios and pipeline stage timings."""
+        return {
+            "scenario_groups": len(self.scenarios),
+            "total_scenarios": len(self.scenario_index),
+            "room_mappings": len(self.room_mappings),
+            "conditional_entities": len(self.conditional_entities),
+            "test_mode": self.test_mode,
+            "pipeline": self.pipeline.get_stats(),
+            "action_suppression": self.state_diff.get_stats() if self.suppress_noop_actions else None,
+            "executions": self.executions.get_stats(),
+            "timer_wheel": self.timer_wheel.get_stats(),
+            "startup_profile": self.profiler.to_dict()
+        }
+
+    def is_port_open(self, port: int, host: str = "localhost") -> bool:
+        """Check if a port is already in use."""
+        import socket
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.settimeout(1)
+                result = sock.connect_ex((host, port))
+                return result == 0
+        except Exception as e:
+            self.log(f"⚠️ Error checking port {port}: {e}")
+            return False
 
-        return None
+    def launch_ui_server(self):
+        """Launch the FastAPI UI server if not already running."""
+        ui_port = 8002
 
-    def _execute_scenario(self, scenario: Dict[str, Any]):
-        """Execute a scenario's actions."""
-        if not scenario:
-            return
-            
-        actions = scenario.get("actions", [])
-        scenario_id = scenario.get("scenario_id", "Unknown")
-        
-        if self.test_mode:
-            self.log(f"🧪 TEST MODE - Would execute {len(actions)} actions for {scenario_id}")
-            for i, action in enumerate(actions):
-                self.log(f"  Action {i+1}: {action.get('service', 'unknown')} -> {action.get('entity_id', 'unknown')}")
-            return
-        
-        self.log(f"🚀 Executing {len(actions)} actions for scenario: {scenario_id}")
-        
-        for i, action in enumerate(actions):
-            try:
-                self._execute_action(action, i+1)
-            except Exception as e:
-                self.log(f"❌ Error executing action {i+1}: {e}")
-                if self.shared_state:
-                    self.shared_state.add_log_entry("ERROR", 
-                        f"Failed to execute action {i+1} in scenario {scenario_id}: {e}")
-
-    def _execute_action(self, action: Dict[str, Any], action_num: int):
-        """Execute a single action."""
-        service = action.get("service", "")
-        entity_id = action.get("entity_id", "")
-        data = action.get("data", {})
-        
-        if not service or not entity_id:
-            self.log(f"❌ Action {action_num}: Missing service or entity_id")
-            return
-        
-        # Validate service call
-        if not validate_service_call(service, entity_id, self.allowed_domains):
-            self.log(f"❌ Action {action_num}: Service call not allowed: {service}")
+        if self.is_port_open(ui_port):
+            self.log(f"🌐 FastAPI UI server already running on port {ui_port}")
             return
-        
+
         try:
-            # Split service into domain and action
-            if "." in service:
-                domain, action_name = service.split(".", 1)
-                self.call_service(service, entity_id=entity_id, **data)
-                self.log(f"✅ Action {action_num}: {service} -> {entity_id}")
-            else:
-                self.log(f"❌ Action {action_num}: Invalid service format: {service}")
-                
-        except Exception as e:
-            self.log(f"❌ Action {action_num}: Service call failed: {e}")
-            raise
+            self.log(f"🚀 Starting FastAPI UI server on port {ui_port}...")
 
-    def reload_scenarios(self):
-        """Reload scenarios from file and update shared state."""
-        self.log("🔄 Reloading scenarios...")
-        old_count = len(self.scenarios)
-        self.scenarios = self._load_scenarios()
-        new_count = len(self.scenarios)
-        
-        # Update shared state
-        if self.shared_state:
-            self.shared_state.update_scenarios(self.scenarios)
-            self.shared_state.update_engine_status({
-                "scenarios_loaded": new_count,
-                "last_config_update": datetime.now().isoformat()
-            })
-            self.shared_state.add_log_entry("INFO", 
-                f"Scenarios reloaded: {old_count} -> {new_count}")
-        
-        self.log(f"✅ Reloaded scenarios: {old_count} -> {new_count}")
+            def run_server():
+                try:
+                    import uvicorn
+                    uvicorn.run(
+                        "apps.Nodalink.ui.fastapi_vue.main:app",
+                        host="0.0.0.0",
+                        port=ui_port,
+                        log_level="info",
+                        access_log=False
+                    )
+                except ImportError as e:
+                    self.log(f"⚠️ FastAPI dependencies not available: {e}")
+                except Exception as e:
+                    self.log(f"❌ Error starting FastAPI server: {e}")
 
-    def reload_config(self):
-        """Reload configuration from file and update shared state."""
-        self.log("🔄 Reloading configuration...")
-        self.config = self._load_config()
-        self.room_mappings = self._extract_room_mappings()
-        self.conditional_entities = self._extract_conditional_entities()
-        
-        # Update shared state
-        if self.shared_state:
-            self.shared_state.update_config(self.config)
-            self.shared_state.add_log_entry("INFO", "Configuration reloaded")
-        
-        self.log("✅ Configuration reloaded")
+            # Start server in daemon thread to avoid blocking AppDaemon
+            server_thread = threading.Thread(target=run_server, daemon=True)
+            server_thread.start()
 
-    def simulate_scenario(self, room: str, interaction_type: str = "manual") -> Dict[str, Any]:
-        """Simulate a scenario execution for testing."""
-        current_time = datetime.now()
-        time_bucket = get_time_bucket(current_time, self.time_bucket_minutes)
-        day_type = get_day_type(current_time)
-        conditional_flags = self._get_active_conditional_flags()
-        
-        scenario = self._find_matching_scenario(
-            room, time_bucket, day_type, conditional_flags, interaction_type
-        )
-        
-        result = {
-            "room": room,
-            "interaction_type": interaction_type,
-            "time_bucket": time_bucket,
-            "day_type": day_type,
-            "conditional_flags": conditional_flags,
-            "timestamp": current_time.isoformat(),
-            "scenario_found": scenario is not None
-        }
-        
-        if scenario:
-            result.update({
-                "scenario_id": scenario.get("scenario_id", "Unknown"),
-                "actions": scenario.get("actions", []),
-                "action_count": len(scenario.get("actions", []))
-            })
-            self.log(f"🎭 Simulation successful for {room}: {len(scenario.get('actions', []))} actions found")
-        else:
-            self.log(f"🎭 Simulation for {room}: No matching scenario found")
-        
-        return result
+            self.log(
+                f"✅ FastAPI UI server started on http://0.0.0.0:{ui_port}")
+
+        except Exception as e:
+            self.log(f"❌ Failed to start FastAPI UI server: {e}")
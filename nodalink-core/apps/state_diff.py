@@ -0,0 +1,215 @@
+"""
+Nodalink State Diff
+Optional stage between plan and dispatch that drops service calls which
+would not change anything: a local cache of the target entities' states,
+kept current by state subscriptions, is compared with the state each
+compiled action asks for.
+
+Only calls with a well-defined end state are considered (turn_on/turn_off
+of lights, switches, fans and input booleans with comparable data); every
+other call is always dispatched.
+"""
+
+import time
+from dataclasses import replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from nodalink_core.action_plans import CompiledAction, ScenarioPlan
+
+SUPPRESSIBLE_DOMAINS = ("light", "switch", "fan", "input_boolean")
+
+SERVICE_STATES = {"turn_on": "on", "turn_off": "off"}
+
+# Service data that describes the end state and can be compared with entity
+# attributes; "transition" only affects how that state is reached
+COMPARABLE_ATTRIBUTES = {
+    "brightness", "color_temp", "color_temp_kelvin", "rgb_color", "rgbw_color",
+    "rgbww_color", "hs_color", "xy_color", "effect"
+}
+IGNORED_DATA = {"entity_id", "transition"}
+
+
+def _normalize(value: Any) -> Any:
+    return list(value) if isinstance(value, tuple) else value
+
+
+def desired_state(action: CompiledAction) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Get the state and attributes a call leaves its targets in.
+
+    Args:
+        action: Compiled action
+
+    Returns:
+        (state, attributes) tuple, or None if the call cannot be diffed
+    """
+    state = SERVICE_STATES.get(action.service)
+    if state is None or action.domain not in SUPPRESSIBLE_DOMAINS or not action.entity_ids:
+        return None
+    if action.deferred:
+        # Compared with the state at trigger time, not when it runs
+        return None
+
+    attributes = {}
+    for key, value in action.data.items():
+        if key in IGNORED_DATA:
+            continue
+        if state == "off":
+            return None
+        if key == "brightness_pct" and isinstance(value, (int, float)):
+            attributes["brightness"] = round(value * 255 / 100)
+        elif key in COMPARABLE_ATTRIBUTES:
+            attributes[key] = _normalize(value)
+        else:
+            return None
+    return state, attributes
+
+
+class EntityStateCache:
+    """
+    Local copy of entity states and attributes.
+
+    Entries of entities a call was just sent to are marked stale until the
+    next state update arrives; stale entries never suppress and are
+    re-read through the loader once they are older than refresh_after
+    seconds (the call may not have changed anything). Async callers
+    re-read expired entries themselves and call get() with load=False, so
+    the synchronous loader never runs on the event loop.
+    """
+
+    def __init__(self, loader: Callable[[str], Any], refresh_after: float = 5.0):
+        self.loader = loader
+        self.refresh_after = refresh_after
+        self.states: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+        self.stale: Dict[str, float] = {}
+
+    def update(self, entity_id: str, state: Any):
+        """Store a state (a full state dict or a bare state value)."""
+        self.stale.pop(entity_id, None)
+        if state is None:
+            self.states.pop(entity_id, None)
+        elif isinstance(state, dict):
+            self.states[entity_id] = (state.get("state"), state.get("attributes") or {})
+        else:
+            self.states[entity_id] = (state, {})
+
+    def invalidate(self, entity_ids: Tuple[str, ...]):
+        """Mark entities as stale after a call was sent to them."""
+        now = time.monotonic()
+        for entity_id in entity_ids:
+            self.stale[entity_id] = now
+
+    def expired(self, entity_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """Get the stale entities (of entity_ids, if given) that are due to be re-read."""
+        now = time.monotonic()
+        stale = self.stale
+        if entity_ids is None:
+            entity_ids = list(stale)
+        return [entity_id for entity_id in entity_ids
+                if entity_id in stale and now - stale[entity_id] >= self.refresh_after]
+
+    def get(self, entity_id: str, load: bool = True) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        """
+        Get (state, attributes) of an entity, or None if unknown or stale.
+
+        Args:
+            entity_id: Entity ID
+            load: Re-read expired entries through the loader; when False
+                they count as unknown
+        """
+        stale_since = self.stale.get(entity_id)
+        if stale_since is not None:
+            if not load or time.monotonic() - stale_since < self.refresh_after:
+                return None
+            self.update(entity_id, self.loader(entity_id))
+        return self.states.get(entity_id)
+
+
+class StateDiff:
+    """Suppresses and trims no-op calls and keeps per-action suppression stats."""
+
+    def __init__(self, loader: Callable[[str], Any], refresh_after: float = 5.0):
+        self.cache = EntityStateCache(loader, refresh_after)
+        self.targets: Dict[int, Tuple[str, Tuple[str, Dict[str, Any]]]] = {}
+        self.stats = {"checked": 0, "suppressed": 0, "trimmed": 0}
+        self.action_stats: Dict[str, Dict[str, int]] = {}
+        self._plans: Dict[str, ScenarioPlan] = {}
+
+    def prepare(self, plans: Dict[str, ScenarioPlan]) -> List[str]:
+        """
+        Precompute the desired state of every diffable action.
+
+        Args:
+            plans: Compiled scenario plans
+
+        Returns:
+            Entity IDs whose state has to be cached
+        """
+        # Actions are looked up by identity, so keep the plans alive
+        self._plans = plans
+        self.targets = {}
+        entities = set()
+        for scenario_id, plan in plans.items():
+            for i, action in enumerate(plan.actions, 1):
+                desired = desired_state(action)
+                if desired is not None:
+                    self.targets[id(action)] = (f"{scenario_id}#{i}", desired)
+                    entities.update(action.entity_ids)
+        return sorted(entities)
+
+    def _satisfied(self, entity_id: str, state: str, attributes: Dict[str, Any],
+                   load: bool = True) -> bool:
+        current = self.cache.get(entity_id, load)
+        if current is None or current[0] != state:
+            return False
+        current_attributes = current[1]
+        return all(_normalize(current_attributes.get(key)) == value
+                   for key, value in attributes.items())
+
+    def diff(self, action: CompiledAction, load: bool = True) -> Optional[CompiledAction]:
+        """
+        Drop the targets of a call that are already in the requested state.
+
+        Args:
+            action: Compiled action
+            load: Re-read expired cache entries through the synchronous
+                loader (see EntityStateCache.get)
+
+        Returns:
+            The action (trimmed to the targets it changes), or None if it
+            would not change anything
+        """
+        target = self.targets.get(id(action))
+        if target is None:
+            return action
+        action_key, (state, attributes) = target
+
+        stats = self.action_stats.get(action_key)
+        if stats is None:
+            stats = self.action_stats[action_key] = {"checked": 0, "suppressed": 0, "trimmed": 0}
+        stats["checked"] += 1
+        self.stats["checked"] += 1
+
+        remaining = tuple(entity_id for entity_id in action.entity_ids
+                          if not self._satisfied(entity_id, state, attributes, load))
+        if not remaining:
+            stats["suppressed"] += 1
+            self.stats["suppressed"] += 1
+            return None
+        if len(remaining) == len(action.entity_ids):
+            return action
+
+        stats["trimmed"] += 1
+        self.stats["trimmed"] += 1
+        data = dict(action.data)
+        data["entity_id"] = remaining[0] if len(remaining) == 1 else remaining
+        return replace(action, entity_ids=remaining, data=MappingProxyType(data))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get suppression totals and per-action ("scenario_id#n") counts."""
+        return {
+            **self.stats,
+            "cached_entities": len(self.cache.states),
+            "by_action": {key: dict(stats) for key, stats in self.action_stats.items()}
+        }
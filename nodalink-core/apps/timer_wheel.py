@@ -0,0 +1,177 @@
+"""
+Nodalink Timer Wheel
+Hierarchical timing wheel for delayed scenario actions.
+
+Timers are kept in LEVELS wheels of SLOTS slots each; level n slots span
+SLOTS**n ticks. Scheduling and cancelling are O(1) (a dict insert/delete in
+the slot the timer falls in); advancing by one tick fires one level 0 slot
+and, every SLOTS ticks, redistributes one slot of the level above. The
+engine drives the wheel from a single repeating AppDaemon timer instead of
+one run_in per action. Empty stretches of the wheel are skipped, so
+advancing over a long gap costs per occupied slot rather than per tick.
+
+The wheel is locked internally: timers may be scheduled and cancelled from
+the event loop (async execution mode) while a worker thread advances it.
+advance() only collects the due timers; they run outside the lock.
+"""
+
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 4
+
+
+class TimerEntry:
+    """Handle of a scheduled timer; cancel() removes it from the wheel."""
+
+    __slots__ = ("wheel", "expires", "callback", "args", "bucket")
+
+    def __init__(self, wheel: "TimerWheel", expires: int, callback: Callable[..., Any],
+                 args: Tuple[Any, ...]):
+        self.wheel = wheel
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.bucket: Optional[Dict["TimerEntry", None]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.bucket is not None
+
+    def cancel(self) -> bool:
+        """Cancel the timer; returns False if it already fell due or was cancelled."""
+        wheel = self.wheel
+        with wheel.lock:
+            if self.bucket is None:
+                return False
+            del self.bucket[self]
+            self.bucket = None
+            wheel.pending -= 1
+            wheel.stats["cancelled"] += 1
+            return True
+
+    def run(self) -> Any:
+        """Run the timer's callback."""
+        return self.callback(*self.args)
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel keyed by absolute time in seconds.
+
+    Args:
+        now: Current time (seconds, e.g. a POSIX timestamp)
+        resolution: Seconds per tick; due times are rounded up to a tick
+    """
+
+    def __init__(self, now: float, resolution: float = 1.0):
+        self.resolution = resolution
+        self.lock = threading.Lock()
+        self.tick = math.floor(now / resolution)
+        self.wheels: List[List[Dict[TimerEntry, None]]] = [
+            [{} for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.overflow: Dict[TimerEntry, None] = {}
+        self.ready: Dict[TimerEntry, None] = {}
+        self.pending = 0
+        self.stats = {"scheduled": 0, "fired": 0, "cancelled": 0}
+
+    def __len__(self) -> int:
+        return self.pending
+
+    def schedule(self, due: float, callback: Callable[..., Any], *args: Any) -> TimerEntry:
+        """
+        Schedule callback(*args) to run once the wheel has advanced to due.
+
+        Args:
+            due: Due time in seconds (same clock as advance())
+            callback: Function to call
+            args: Arguments for the callback
+
+        Returns:
+            TimerEntry handle
+        """
+        entry = TimerEntry(self, math.ceil(due / self.resolution), callback, args)
+        with self.lock:
+            self._place(entry, cascading=False)
+            self.pending += 1
+            self.stats["scheduled"] += 1
+        return entry
+
+    def _place(self, entry: TimerEntry, cascading: bool):
+        delta = entry.expires - self.tick
+        if delta < 0 or (delta == 0 and not cascading):
+            # Already due: fires on the next advance
+            bucket = self.ready
+        else:
+            bucket = self.overflow
+            for level in range(LEVELS):
+                if delta < 1 << (SLOT_BITS * (level + 1)):
+                    bucket = self.wheels[level][(entry.expires >> (SLOT_BITS * level)) & SLOT_MASK]
+                    break
+        bucket[entry] = None
+        entry.bucket = bucket
+
+    def _cascade(self, level: int):
+        """Redistribute the current slot of a level into the levels below."""
+        if level == LEVELS:
+            entries, self.overflow = self.overflow, {}
+        else:
+            index = (self.tick >> (SLOT_BITS * level)) & SLOT_MASK
+            entries = self.wheels[level][index]
+            self.wheels[level][index] = {}
+        for entry in entries:
+            self._place(entry, cascading=True)
+
+    def _collect(self, bucket: Dict[TimerEntry, None], due: List[TimerEntry]):
+        for entry in bucket:
+            entry.bucket = None
+            due.append(entry)
+        bucket.clear()
+
+    def advance(self, now: float) -> List[TimerEntry]:
+        """
+        Advance the wheel to now and collect the timers that fell due.
+
+        Returns:
+            Due timers in tick order; call run() on each
+        """
+        with self.lock:
+            return self._advance(math.floor(now / self.resolution))
+
+    def _advance(self, target: int) -> List[TimerEntry]:
+        due: List[TimerEntry] = []
+        self._collect(self.ready, due)
+
+        if not self.pending:
+            self.tick = max(self.tick, target)
+        while self.tick < target and self.pending > len(due):
+            # Nothing fires before the next boundary of the lowest non-empty level
+            level = 0
+            while level < LEVELS and not any(self.wheels[level]):
+                level += 1
+            if level:
+                boundary = ((self.tick >> (SLOT_BITS * level)) + 1) << (SLOT_BITS * level)
+                if boundary > target:
+                    break
+                self.tick = boundary - 1
+
+            self.tick += 1
+            level = 1
+            while level <= LEVELS and self.tick & ((1 << (SLOT_BITS * level)) - 1) == 0:
+                self._cascade(level)
+                level += 1
+            self._collect(self.wheels[0][self.tick & SLOT_MASK], due)
+        self.tick = max(self.tick, target)
+
+        self.pending -= len(due)
+        self.stats["fired"] += len(due)
+        return due
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduling counters and the number of pending timers."""
+        with self.lock:
+            return {**self.stats, "pending": self.pending}
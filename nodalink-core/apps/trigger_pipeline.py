@@ -0,0 +1,237 @@
+"""
+Nodalink Trigger Pipeline
+Staged trigger processing: ingest -> context -> match -> plan -> diff -> dispatch.
+
+Each stage is a plain callable taking the previous stage's output and
+returning its own output, or None to stop the run (e.g. an ignored event
+or an unmatched context). Stages can be replaced individually and are
+timed individually, so they can be benchmarked in isolation.
+
+run_async() runs the same stages from an event loop; stages with an entry
+in async_stages use that coroutine function instead, and any stage may
+return an awaitable. on_complete is a plain callback; run_async() calls it
+in the loop's default executor so reporting I/O stays off the event loop.
+"""
+
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from nodalink_core.action_plans import CompiledAction
+from nodalink_core.scenario_utils import ScenarioKey
+
+STAGES = ("ingest", "context", "match", "plan", "diff", "dispatch")
+
+
+@dataclass
+class Trigger:
+    """Normalized trigger produced by the ingest stage."""
+    room: str
+    interaction_type: str
+    trigger_type: str
+    source_entity: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class TriggerContext:
+    """Evaluation context produced by the context stage."""
+    trigger: Trigger
+    current_time: datetime
+    time_bucket: str
+    day_type: str
+    key: ScenarioKey
+
+    @property
+    def optional_flags(self) -> Tuple[str, ...]:
+        return self.key.optional_flags
+
+    @property
+    def scenario_id(self) -> str:
+        return self.key.scenario_id
+
+
+@dataclass
+class MatchResult:
+    """Resolved scenario produced by the match stage."""
+    context: TriggerContext
+    scenario_id: str
+    fallback_level: int
+
+
+@dataclass
+class ActionPlan:
+    """Compiled actions produced by the plan stage (and trimmed by the diff stage)."""
+    match: MatchResult
+    actions: Tuple[CompiledAction, ...]
+    rejected: Tuple[str, ...] = ()
+    suppressed: int = 0
+
+
+@dataclass
+class DispatchResult:
+    """Outcome of the dispatch stage."""
+    plan: ActionPlan
+    status: str = "completed"   # completed, queued, cancelled or ignored (room execution policy)
+    executed: int = 0
+    scheduled: int = 0          # deferred actions put on the timer wheel
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PipelineRun:
+    """Record of a single pipeline run."""
+    outputs: Dict[str, Any] = field(default_factory=dict)
+    stopped_at: Optional[str] = None
+    error: Optional[str] = None
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def trigger(self) -> Optional[Trigger]:
+        return self.outputs.get("ingest")
+
+    @property
+    def context(self) -> Optional[TriggerContext]:
+        return self.outputs.get("context")
+
+    @property
+    def match(self) -> Optional[MatchResult]:
+        return self.outputs.get("match")
+
+    @property
+    def dispatch(self) -> Optional[DispatchResult]:
+        return self.outputs.get("dispatch")
+
+    @property
+    def latency_ms(self) -> float:
+        return sum(self.timings_ms.values())
+
+
+class TriggerPipeline:
+    """Runs the trigger stages in order and keeps per-stage timing stats."""
+
+    def __init__(self, stages: Dict[str, Callable[[Any], Any]],
+                 on_complete: Optional[Callable[[PipelineRun], None]] = None,
+                 async_stages: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        missing = [name for name in STAGES if name not in stages]
+        if missing:
+            raise ValueError(f"Missing pipeline stages: {', '.join(missing)}")
+        unknown = [name for name in (async_stages or {}) if name not in STAGES]
+        if unknown:
+            raise ValueError(f"Unknown pipeline stages: {', '.join(unknown)}")
+        self.stages = {name: stages[name] for name in STAGES}
+        self.async_stages = dict(async_stages or {})
+        self.on_complete = on_complete
+        self.stats = {name: [0, 0.0, 0.0] for name in STAGES}  # count, total_ms, max_ms
+
+    def replace_stage(self, name: str, stage: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        """Swap a stage implementation (for both run modes); returns the previous one."""
+        if name not in self.stages:
+            raise ValueError(f"Unknown pipeline stage: {name}")
+        previous = self.async_stages.pop(name, None) or self.stages[name]
+        self.stages[name] = stage
+        return previous
+
+    def _stage_names(self, start: str, stop_after: Optional[str]) -> Tuple[str, ...]:
+        names = STAGES[STAGES.index(start):]
+        if stop_after:
+            names = names[:names.index(stop_after) + 1]
+        return names
+
+    def _record(self, run: PipelineRun, name: str, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        run.timings_ms[name] = elapsed_ms
+        stat = self.stats[name]
+        stat[0] += 1
+        stat[1] += elapsed_ms
+        stat[2] = max(stat[2], elapsed_ms)
+
+    def run(self, payload: Any, start: str = "ingest", stop_after: Optional[str] = None) -> PipelineRun:
+        """
+        Run the pipeline.
+
+        Args:
+            payload: Input of the first stage to run
+            start: Stage to start from (e.g. "context" with a Trigger)
+            stop_after: Last stage to run (e.g. "plan" for a dry run)
+
+        Returns:
+            PipelineRun with every stage output and its timing
+        """
+        run = PipelineRun()
+        value = payload
+        for name in self._stage_names(start, stop_after):
+            started = time.perf_counter()
+            try:
+                value = self.stages[name](value)
+            except Exception as e:
+                run.error = f"{name}: {e}"
+                run.stopped_at = name
+                value = None
+            finally:
+                self._record(run, name, started)
+
+            if value is None:
+                run.stopped_at = run.stopped_at or name
+                break
+            run.outputs[name] = value
+
+        # Dry runs (stop_after) are not reported
+        if self.on_complete and stop_after is None:
+            self.on_complete(run)
+        return run
+
+    async def run_async(self, payload: Any, start: str = "ingest",
+                        stop_after: Optional[str] = None) -> PipelineRun:
+        """
+        Run the pipeline from an event loop.
+
+        Stage timings include time spent waiting on awaited calls, during
+        which other runs proceed.
+
+        Args:
+            payload: Input of the first stage to run
+            start: Stage to start from
+            stop_after: Last stage to run
+
+        Returns:
+            PipelineRun with every stage output and its timing
+        """
+        run = PipelineRun()
+        value = payload
+        for name in self._stage_names(start, stop_after):
+            stage = self.async_stages.get(name) or self.stages[name]
+            started = time.perf_counter()
+            try:
+                value = stage(value)
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as e:
+                run.error = f"{name}: {e}"
+                run.stopped_at = name
+                value = None
+            finally:
+                self._record(run, name, started)
+
+            if value is None:
+                run.stopped_at = run.stopped_at or name
+                break
+            run.outputs[name] = value
+
+        if self.on_complete and stop_after is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.on_complete, run)
+        return run
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get count, mean and max time per stage in milliseconds."""
+        return {
+            name: {
+                "count": count,
+                "mean_ms": total / count if count else 0.0,
+                "max_ms": maximum
+            }
+            for name, (count, total, maximum) in self.stats.items()
+        }
@@ -0,0 +1,92 @@
+"""
+Nodalink Trigger Recorder
+Records the Home Assistant trigger traffic the Nodalink engine reacts to
+(button events, Nodalink triggers, presence and flag state changes) to a
+compact NDJSON file that tools/replay_triggers.py can replay offline.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, List
+import appdaemon.plugins.hass.hassapi as hass
+
+DEFAULT_EVENTS = ["zha_event", "deconz_event", "nodalink_trigger"]
+
+
+class TriggerRecorder(hass.Hass):
+    """Append-only recorder for Nodalink trigger events."""
+
+    def initialize(self):
+        """Initialize the recorder."""
+        self.record_file = self.args.get(
+            "record_file", "/config/appdaemon/apps/Nodalink/recordings/triggers.ndjson")
+        self.config_file = self.args.get(
+            "config_file", "/config/appdaemon/apps/Nodalink/config.json")
+        self.flush_interval = self.args.get("flush_interval", 5)
+        self.buffer: List[str] = []
+
+        entities = self._load_tracked_entities()
+        entities.extend(self.args.get("extra_entities", []))
+        self.entities = sorted(set(entities))
+
+        os.makedirs(os.path.dirname(self.record_file), exist_ok=True)
+
+        # Snapshot of current states so the replay starts from the same flags
+        self._record({
+            "k": "snapshot",
+            "states": {entity_id: self.get_state(entity_id) for entity_id in self.entities}
+        })
+
+        for event_name in self.args.get("events", DEFAULT_EVENTS):
+            self.listen_event(self._handle_event, event_name)
+        for entity_id in self.entities:
+            self.listen_state(self._handle_state_change, entity_id)
+
+        self.run_every(self._flush, "now+5", self.flush_interval)
+        self.log(f"🎙️ Recording {len(self.entities)} entities to {self.record_file}")
+
+    def terminate(self):
+        """Flush pending records on app shutdown."""
+        self._flush({})
+
+    def _load_tracked_entities(self) -> List[str]:
+        """Get room sensors and conditional flag entities from the Nodalink config."""
+        try:
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+        except Exception as e:
+            self.log(f"⚠️ Could not read Nodalink config {self.config_file}: {e}")
+            return []
+
+        entities = []
+        for section in ("room_mappings", "conditional_entities"):
+            for item in config.get(section, {}).values():
+                entity_id = item.get("entity_id") if isinstance(item, dict) else item
+                if entity_id:
+                    entities.append(entity_id)
+        return entities
+
+    def _handle_event(self, event_name: str, data: Dict[str, Any], kwargs: Dict[str, Any]):
+        """Record a trigger event."""
+        self._record({"k": "event", "n": event_name, "d": data})
+
+    def _handle_state_change(self, entity: str, attribute: str, old: Any, new: Any,
+                             kwargs: Dict[str, Any]):
+        """Record a state change."""
+        self._record({"k": "state", "e": entity, "o": old, "s": new})
+
+    def _record(self, record: Dict[str, Any]):
+        record["t"] = round(time.time(), 3)
+        self.buffer.append(json.dumps(record, separators=(",", ":"), default=str))
+
+    def _flush(self, kwargs: Dict[str, Any]):
+        """Write buffered records to the recording file."""
+        if not self.buffer:
+            return
+        lines, self.buffer = self.buffer, []
+        try:
+            with open(self.record_file, 'a') as f:
+                f.write("\n".join(lines) + "\n")
+        except Exception as e:
+            self.log(f"❌ Error writing trigger recording: {e}")
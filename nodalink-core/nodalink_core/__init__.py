@@ -0,0 +1,21 @@
+"""
+Nodalink Core
+Shared code for the AppDaemon engine (apps/) and the FastAPI backend (api/):
+scenario ID codec, time buckets, validation, the scenario match index, action plans,
+the shared state, the log pipeline and the execution journal.
+
+Only depends on the standard library, so importing it from the engine does
+not pull in FastAPI or pydantic.
+"""
+
+from .scenario_utils import (
+    get_time_bucket,
+    get_day_type,
+    build_scenario_id,
+    parse_scenario_id,
+    validate_scenario_id,
+    validate_service_call,
+    sanitize_entity_id,
+    ScenarioIndex,
+    ScenarioKey
+)
@@ -0,0 +1,179 @@
+"""
+Nodalink Action Plans
+Scenario actions compiled once at load time into immutable, pre-validated
+service calls, so the engine only dispatches plans per trigger.
+
+Actions may be deferred with "delay" (seconds after the trigger) or "at"
+("HH:MM" or "HH:MM:SS", the next occurrence of that local time).
+"""
+
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .scenario_utils import get_scenario_actions, sanitize_entity_id, validate_service_call
+
+_AT_RE = re.compile(r'^(\d{1,2}):(\d{2})(?::(\d{2}))?$')
+
+
+@dataclass(frozen=True)
+class CompiledAction:
+    """A validated Home Assistant service call ready for dispatch."""
+    domain: str
+    service: str
+    call: str                    # "domain/service" as passed to call_service
+    entity_ids: Tuple[str, ...]
+    data: Mapping[str, Any]      # service data with the entity_id target merged in
+    delay: float = 0.0           # seconds after the trigger
+    at: Optional[Tuple[int, int, int]] = None  # (hour, minute, second) local time
+
+    @property
+    def deferred(self) -> bool:
+        return self.delay > 0 or self.at is not None
+
+    def describe(self) -> str:
+        """Get a short "domain.service -> targets" description for logs."""
+        description = f"{self.domain}.{self.service} -> {', '.join(self.entity_ids) or '-'}"
+        if self.at is not None:
+            description += " at %02d:%02d:%02d" % self.at
+        elif self.delay:
+            description += f" in {self.delay:g}s"
+        return description
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the action as a JSON-serializable dict."""
+        action = {
+            "service": f"{self.domain}.{self.service}",
+            "entity_id": list(self.entity_ids),
+            "data": {key: value for key, value in self.data.items() if key != "entity_id"}
+        }
+        if self.delay:
+            action["delay"] = self.delay
+        if self.at is not None:
+            action["at"] = "%02d:%02d:%02d" % self.at
+        return action
+
+
+@dataclass(frozen=True)
+class ScenarioPlan:
+    """Compiled actions of one scenario and the actions rejected at load time."""
+    scenario_id: str
+    actions: Tuple[CompiledAction, ...]
+    rejected: Tuple[str, ...] = ()
+
+
+def _entity_targets(entity_id: Any) -> List[str]:
+    """Split an entity_id field (string, comma-separated string or list) into entries."""
+    if not entity_id:
+        return []
+    if isinstance(entity_id, str):
+        return [item.strip() for item in entity_id.split(",")]
+    if isinstance(entity_id, (list, tuple)):
+        return [str(item).strip() for item in entity_id]
+    raise ValueError("invalid entity_id")
+
+
+def _parse_schedule(action: Dict[str, Any]) -> Tuple[float, Optional[Tuple[int, int, int]]]:
+    """Parse the "delay" and "at" fields of an action."""
+    delay = action.get("delay", 0) or 0
+    if isinstance(delay, bool) or not isinstance(delay, (int, float)) or delay < 0:
+        raise ValueError(f"invalid delay: {delay}")
+
+    at = action.get("at")
+    if at is None:
+        return float(delay), None
+    if delay:
+        raise ValueError("use either delay or at")
+    match = _AT_RE.match(str(at))
+    if not match:
+        raise ValueError(f"invalid at time: {at}")
+    hour, minute, second = (int(part or 0) for part in match.groups())
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError(f"invalid at time: {at}")
+    return 0.0, (hour, minute, second)
+
+
+def compile_action(action: Dict[str, Any], allowed_domains: Iterable[str]) -> CompiledAction:
+    """
+    Compile a scenario action into a service call.
+
+    Args:
+        action: Action dictionary ("service" or "domain"/"action", optional
+            "entity_id", "data" and "delay" or "at")
+        allowed_domains: Domains the engine may call services in
+
+    Returns:
+        CompiledAction
+
+    Raises:
+        ValueError: With the reason if the action is invalid or not allowed
+    """
+    if not validate_service_call(action):
+        raise ValueError("invalid service call")
+    service = action.get("service") or f"{action.get('domain')}.{action.get('action')}"
+    domain, service_name = service.split(".", 1)
+    if domain not in allowed_domains:
+        raise ValueError(f"domain not allowed: {domain}")
+
+    entity_ids = []
+    for entity_id in _entity_targets(action.get("entity_id")):
+        sanitized = sanitize_entity_id(entity_id)
+        if not sanitized:
+            raise ValueError(f"invalid entity_id: {entity_id}")
+        entity_ids.append(sanitized)
+
+    delay, at = _parse_schedule(action)
+
+    data = action.get("data") or {}
+    if not isinstance(data, dict):
+        raise ValueError("data must be an object")
+    data = dict(data)
+    if entity_ids:
+        data["entity_id"] = entity_ids[0] if len(entity_ids) == 1 else tuple(entity_ids)
+
+    return CompiledAction(domain, service_name, f"{domain}/{service_name}",
+                          tuple(entity_ids), MappingProxyType(data), delay, at)
+
+
+def compile_scenario_plan(scenario_id: str, scenario: Any,
+                          allowed_domains: Iterable[str]) -> ScenarioPlan:
+    """
+    Compile the actions of one scenario.
+
+    Args:
+        scenario_id: Scenario ID
+        scenario: Scenario value (list of actions or dict with "actions")
+        allowed_domains: Domains the engine may call services in
+
+    Returns:
+        ScenarioPlan with the valid actions and a reason per rejected one
+    """
+    actions = []
+    rejected = []
+    for i, action in enumerate(get_scenario_actions(scenario), 1):
+        try:
+            actions.append(compile_action(action, allowed_domains))
+        except ValueError as e:
+            rejected.append(f"Action {i}: {e}")
+    return ScenarioPlan(scenario_id, tuple(actions), tuple(rejected))
+
+
+def compile_scenario_plans(scenarios: Dict[str, Any],
+                           allowed_domains: Iterable[str]) -> Dict[str, ScenarioPlan]:
+    """
+    Compile the actions of every scenario.
+
+    Args:
+        scenarios: Scenarios as loaded from scenarios.json
+        allowed_domains: Domains the engine may call services in
+
+    Returns:
+        Dictionary of scenario ID to ScenarioPlan
+    """
+    allowed = frozenset(allowed_domains)
+    return {
+        scenario_id: compile_scenario_plan(scenario_id, scenario, allowed)
+        for scenario_id, scenario in scenarios.items()
+        if not scenario_id.startswith("_")
+    }
@@ -0,0 +1,342 @@
+"""
+Nodalink Execution Journal
+Append-only SQLite (WAL) journal of scenario executions with hourly rollups
+maintained at write time, shared by the AppDaemon engine (writer) and the
+FastAPI backend (reader).
+
+Runs the room execution policy cancelled or ignored are journaled with that
+status; rollups count them separately from executions. Both tables are
+pruned to the retention period.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS executions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    room TEXT NOT NULL,
+    scenario_id TEXT NOT NULL,
+    requested_id TEXT NOT NULL,
+    fallback_level INTEGER,
+    day_type TEXT,
+    interaction_type TEXT,
+    optional_flags TEXT,
+    trigger_type TEXT,
+    action_count INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    error_count INTEGER NOT NULL,
+    errors TEXT,
+    status TEXT NOT NULL DEFAULT 'completed'
+);
+CREATE INDEX IF NOT EXISTS idx_executions_ts ON executions (ts);
+CREATE INDEX IF NOT EXISTS idx_executions_room_ts ON executions (room, ts);
+CREATE INDEX IF NOT EXISTS idx_executions_scenario_ts ON executions (scenario_id, ts);
+CREATE INDEX IF NOT EXISTS idx_executions_hour ON executions (hour);
+
+CREATE TABLE IF NOT EXISTS execution_rollups (
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    room TEXT NOT NULL,
+    scenario_id TEXT NOT NULL,
+    executions INTEGER NOT NULL,
+    fallbacks INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    actions INTEGER NOT NULL,
+    total_latency_ms REAL NOT NULL,
+    max_latency_ms REAL NOT NULL,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    ignored INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, hour, room, scenario_id)
+);
+CREATE INDEX IF NOT EXISTS idx_rollups_scenario ON execution_rollups (scenario_id, day);
+CREATE INDEX IF NOT EXISTS idx_rollups_room ON execution_rollups (room, day);
+CREATE INDEX IF NOT EXISTS idx_rollups_day ON execution_rollups (day);
+"""
+
+# Columns added after the first release, created on journals that lack them
+MIGRATIONS = (
+    ("executions", "status", "TEXT NOT NULL DEFAULT 'completed'"),
+    ("execution_rollups", "cancelled", "INTEGER NOT NULL DEFAULT 0"),
+    ("execution_rollups", "ignored", "INTEGER NOT NULL DEFAULT 0")
+)
+
+ROLLUP_UPSERT = """
+INSERT INTO execution_rollups
+    (day, hour, room, scenario_id, executions, fallbacks, errors, actions,
+     total_latency_ms, max_latency_ms, cancelled, ignored)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, hour, room, scenario_id) DO UPDATE SET
+    executions = executions + excluded.executions,
+    fallbacks = fallbacks + excluded.fallbacks,
+    errors = errors + excluded.errors,
+    actions = actions + excluded.actions,
+    total_latency_ms = total_latency_ms + excluded.total_latency_ms,
+    max_latency_ms = MAX(max_latency_ms, excluded.max_latency_ms),
+    cancelled = cancelled + excluded.cancelled,
+    ignored = ignored + excluded.ignored
+"""
+
+ROLLUP_GROUPS = ("day", "hour", "room", "scenario_id")
+
+# Run statuses counted separately from executions in the rollups
+NOT_EXECUTED = ("cancelled", "ignored")
+
+# Scenario ID stored for triggers that matched nothing
+UNMATCHED = ""
+
+
+def _connect(path: str, check_same_thread: bool = True) -> "sqlite3.Connection":
+    # sqlite3 is imported on first use so loading the journal stays cheap
+    import sqlite3
+    connection = sqlite3.connect(path, timeout=5, check_same_thread=check_same_thread)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+class ExecutionJournal:
+    """
+    Execution journal writer and query helper.
+
+    record() only queues the execution; a daemon writer thread inserts
+    queued records and updates the rollup table in one transaction per
+    flush, so the trigger path never waits on disk I/O.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, retention_days: int = 30):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._writer = None
+        self._last_prune = 0.0
+
+    # Writing
+
+    def record(self, execution: Dict[str, Any]):
+        """
+        Queue an execution record.
+
+        Args:
+            execution: Dict with ts (epoch seconds), day, hour, room,
+                scenario_id, requested_id, fallback_level, day_type,
+                interaction_type, optional_flags, trigger_type,
+                action_count, latency_ms, errors (list of strings) and
+                status (completed, queued, cancelled, ignored or unmatched)
+        """
+        self._queue.append(execution)
+        self._ensure_started()
+
+    def flush(self):
+        """Write the records queued so far and their rollups."""
+        batch = []
+        # Bounded by the queue length at entry, as in LogPipeline.flush
+        for _ in range(len(self._queue)):
+            try:
+                batch.append(self._queue.popleft())
+            except IndexError:
+                break
+        if not batch:
+            return
+
+        rows = []
+        rollups = {}
+        for execution in batch:
+            errors = execution.get("errors") or []
+            scenario_id = execution.get("scenario_id") or UNMATCHED
+            fallback_level = execution.get("fallback_level")
+            action_count = execution.get("action_count", 0)
+            latency_ms = execution.get("latency_ms", 0.0)
+            status = execution.get("status") or "completed"
+
+            rows.append((
+                execution["ts"], execution["day"], execution["hour"],
+                execution.get("room", ""), scenario_id,
+                execution.get("requested_id", ""), fallback_level,
+                execution.get("day_type", ""), execution.get("interaction_type", ""),
+                "+".join(execution.get("optional_flags") or []),
+                execution.get("trigger_type", ""), action_count, latency_ms,
+                len(errors), json.dumps(errors) if errors else None, status
+            ))
+
+            key = (execution["day"], execution["hour"], execution.get("room", ""), scenario_id)
+            rollup = rollups.setdefault(key, [0, 0, 0, 0, 0.0, 0.0, 0, 0])
+            if status in NOT_EXECUTED:
+                rollup[6 if status == "cancelled" else 7] += 1
+                continue
+            rollup[0] += 1
+            rollup[1] += 1 if fallback_level else 0
+            rollup[2] += 1 if errors else 0
+            rollup[3] += action_count
+            rollup[4] += latency_ms
+            rollup[5] = max(rollup[5], latency_ms)
+
+        connection = self._writer_connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO executions (ts, day, hour, room, scenario_id, requested_id, "
+                "fallback_level, day_type, interaction_type, optional_flags, trigger_type, "
+                "action_count, latency_ms, error_count, errors, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.executemany(
+                ROLLUP_UPSERT, [key + tuple(values) for key, values in rollups.items()])
+
+        self._prune(connection)
+
+    def stop(self):
+        """Stop the writer thread after a final flush."""
+        thread = self._thread
+        self._thread = None
+        self._wakeup.set()
+        if thread and thread.is_alive():
+            thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._wakeup.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="nodalink-execution-journal", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        current = threading.current_thread()
+        while self._thread is current:
+            self._wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Keep journaling best-effort; records of a failed batch are lost
+                pass
+
+    def _writer_connection(self) -> "sqlite3.Connection":
+        connection = self._writer
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = _connect(self.path, check_same_thread=False)
+            connection.executescript(SCHEMA)
+            self._migrate(connection)
+            self._writer = connection
+        return connection
+
+    def _migrate(self, connection: "sqlite3.Connection"):
+        for table, column, definition in MIGRATIONS:
+            columns = {row["name"] for row in connection.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                with connection:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        # Created here: on older journals the column only exists after the migration
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_executions_status ON executions (status)")
+
+    def _prune(self, connection: "sqlite3.Connection"):
+        now = time.time()
+        if not self.retention_days or now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        cutoff = now - self.retention_days * 86400
+        with connection:
+            connection.execute("DELETE FROM executions WHERE ts < ?", (cutoff,))
+            # Rollup days are local dates, like the "day" of the records
+            connection.execute("DELETE FROM execution_rollups WHERE day < ?",
+                               (time.strftime("%Y-%m-%d", time.localtime(cutoff)),))
+
+    # Querying
+
+    def query_executions(self, room: Optional[str] = None, scenario_id: Optional[str] = None,
+                         hour: Optional[int] = None, since: Optional[float] = None,
+                         until: Optional[float] = None, errors_only: bool = False,
+                         status: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get the most recent executions matching the filters."""
+        clauses, params = self._filters(room=room, scenario_id=scenario_id, hour=hour,
+                                        status=status)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        if errors_only:
+            clauses.append("error_count > 0")
+
+        sql = "SELECT * FROM executions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+
+        rows = self._read(sql, params)
+        for row in rows:
+            row["errors"] = json.loads(row["errors"]) if row["errors"] else []
+            row["optional_flags"] = row["optional_flags"].split("+") if row["optional_flags"] else []
+        return rows
+
+    def query_rollups(self, group_by: Optional[List[str]] = None, room: Optional[str] = None,
+                      scenario_id: Optional[str] = None, hour: Optional[int] = None,
+                      since_day: Optional[str] = None, until_day: Optional[str] = None,
+                      limit: int = 500) -> List[Dict[str, Any]]:
+        """Get pre-aggregated execution statistics grouped by the given columns."""
+        groups = [group for group in (group_by or ["scenario_id"]) if group in ROLLUP_GROUPS]
+        clauses, params = self._filters(room=room, scenario_id=scenario_id, hour=hour)
+        if since_day:
+            clauses.append("day >= ?")
+            params.append(since_day)
+        if until_day:
+            clauses.append("day <= ?")
+            params.append(until_day)
+
+        select = ", ".join(groups + [
+            "SUM(executions) AS executions",
+            "SUM(fallbacks) AS fallbacks",
+            "SUM(errors) AS errors",
+            "SUM(actions) AS actions",
+            "SUM(total_latency_ms) / SUM(executions) AS avg_latency_ms",
+            "MAX(max_latency_ms) AS max_latency_ms",
+            "SUM(cancelled) AS cancelled",
+            "SUM(ignored) AS ignored"
+        ])
+        sql = f"SELECT {select} FROM execution_rollups"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if groups:
+            sql += " GROUP BY " + ", ".join(groups)
+        sql += " ORDER BY executions DESC LIMIT ?"
+        params.append(limit)
+        return self._read(sql, params)
+
+    def _filters(self, **filters) -> tuple:
+        clauses, params = [], []
+        for column, value in filters.items():
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return clauses, params
+
+    def _read(self, sql: str, params: List[Any]) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return []
+        connection = _connect(self.path)
+        try:
+            return [dict(row) for row in connection.execute(sql, params)]
+        except connection.OperationalError:
+            # Journal exists but the writer has not created the schema yet
+            return []
+        finally:
+            connection.close()
@@ -0,0 +1,218 @@
+"""
+Nodalink Log Pipeline
+Non-blocking log ingestion with per-source rate limiting, sampling and
+aggregation of repeated messages, flushed to the shared state in batches.
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Levels that are never sampled away (still subject to rate limiting)
+UNSAMPLED_LEVELS = {"WARNING", "ERROR", "CRITICAL"}
+
+DEFAULT_SETTINGS = {
+    "flush_interval": 1.0,     # Seconds between background flushes
+    "rate_limit": 20,          # Entries per source per rate window
+    "rate_window": 10.0,       # Seconds per rate window
+    "sample_rates": {},        # source/level -> keep every Nth entry
+    "max_queue": 10000         # Pending entries before new ones are dropped
+}
+
+
+class _SourceWindow:
+    """Rate-limit and aggregation state for a single log source."""
+
+    __slots__ = ("started", "emitted", "suppressed", "seen", "last_message", "last_data")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.emitted = 0
+        self.suppressed = 0
+        self.seen = 0
+        self.last_message = ""
+        self.last_data = None
+
+
+class LogPipeline:
+    """
+    Decouples log producers from the shared state lock and WebSocket fan-out.
+
+    Producers call submit(), which only appends to a bounded deque. A daemon
+    flusher thread drains the queue, applies sampling and per-source rate
+    limits, replaces suppressed bursts with a single summary entry and hands
+    the resulting batch to the sink.
+    """
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], None], **settings):
+        self.sink = sink
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings)
+        self._queue = deque()
+        self._windows: Dict[str, _SourceWindow] = {}
+        self._sample_counters: Dict[str, int] = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "emitted": 0,
+            "sampled_out": 0,
+            "rate_limited": 0,
+            "dropped": 0,
+            "aggregated": 0,
+            "flushes": 0
+        }
+
+    def configure(self, **settings):
+        """Update pipeline settings at runtime."""
+        self.settings.update(
+            {key: value for key, value in settings.items() if key in DEFAULT_SETTINGS})
+
+    def submit(self, level: str, message: str, data: Optional[Dict[str, Any]] = None,
+               source: Optional[str] = None):
+        """Queue a log entry without taking any lock or touching the network."""
+        if len(self._queue) >= self.settings["max_queue"]:
+            self.stats["dropped"] += 1
+            return
+
+        self._queue.append((time.monotonic(), datetime.now().isoformat(),
+                            level, message, data, source))
+        self.stats["submitted"] += 1
+        self._ensure_started()
+
+    def flush(self):
+        """Drain the entries queued so far and deliver one batch to the sink."""
+        now = time.monotonic()
+        batch = []
+
+        # Bounded by the queue length at entry so steady submitters can't
+        # keep a flush from ever completing
+        for _ in range(len(self._queue)):
+            try:
+                entry = self._queue.popleft()
+            except IndexError:
+                break
+            log_entry = self._process(*entry)
+            if log_entry:
+                batch.append(log_entry)
+
+        batch.extend(self._close_expired_windows(now))
+
+        if batch:
+            self.stats["emitted"] += len(batch)
+            self.sink(batch)
+        self.stats["flushes"] += 1
+
+    def stop(self):
+        """Stop the flusher thread after a final flush."""
+        thread = self._thread
+        self._thread = None
+        self._wakeup.set()
+        if thread and thread.is_alive():
+            thread.join(timeout=self.settings["flush_interval"] * 2)
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pipeline counters and current settings."""
+        return {
+            **self.stats,
+            "queued": len(self._queue),
+            "active_sources": len(self._windows),
+            "settings": dict(self.settings)
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._wakeup.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="nodalink-log-flusher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        current = threading.current_thread()
+        while self._thread is current:
+            self._wakeup.wait(self.settings["flush_interval"])
+            try:
+                self.flush()
+            except Exception:
+                # Never let a bad sink kill the flusher
+                pass
+
+    def _process(self, monotonic_ts, timestamp, level, message, data, source):
+        key = source or f"{level}:{message}"
+
+        # Deterministic sampling: keep every Nth entry per source or level
+        if level not in UNSAMPLED_LEVELS:
+            rates = self.settings["sample_rates"]
+            rate = rates.get(key) or rates.get(level) or 1
+            if rate > 1:
+                count = self._sample_counters.get(key, 0)
+                self._sample_counters[key] = count + 1
+                if count % rate:
+                    self.stats["sampled_out"] += 1
+                    return None
+
+        window = self._windows.get(key)
+        if window is None or monotonic_ts - window.started >= self.settings["rate_window"]:
+            summary = self._summarize(key, window) if window else None
+            window = _SourceWindow(monotonic_ts)
+            self._windows[key] = window
+            if summary:
+                # Emit the previous window's summary ahead of the new entry
+                self._queue.appendleft((monotonic_ts, timestamp, level, message, data, source))
+                return summary
+
+        window.seen += 1
+        window.last_message = message
+        window.last_data = data
+
+        if window.emitted >= self.settings["rate_limit"]:
+            window.suppressed += 1
+            self.stats["rate_limited"] += 1
+            return None
+
+        window.emitted += 1
+        return {
+            "timestamp": timestamp,
+            "level": level,
+            "message": message,
+            "data": data,
+            "source": source
+        }
+
+    def _close_expired_windows(self, now: float) -> List[Dict[str, Any]]:
+        summaries = []
+        for key, window in list(self._windows.items()):
+            if now - window.started >= self.settings["rate_window"]:
+                del self._windows[key]
+                summary = self._summarize(key, window)
+                if summary:
+                    summaries.append(summary)
+        return summaries
+
+    def _summarize(self, key: str, window: _SourceWindow) -> Optional[Dict[str, Any]]:
+        if not window.suppressed:
+            return None
+
+        self.stats["aggregated"] += 1
+        seconds = self.settings["rate_window"]
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "level": "INFO",
+            "message": f"{key}: {window.seen} messages in {seconds:g}s "
+                       f"({window.suppressed} suppressed, last: {window.last_message})",
+            "data": {
+                "source": key,
+                "count": window.seen,
+                "suppressed": window.suppressed,
+                "window_seconds": seconds,
+                "last_data": window.last_data
+            },
+            "source": key
+        }
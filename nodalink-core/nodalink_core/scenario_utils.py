@@ -0,0 +1,1294 @@
+"""
+Nodalink Scenario Utilities
+Utility functions for context parsing, ID building, and validation.
+"""
+
+import re
+import json
+from bisect import bisect_right
+from datetime import datetime, time
+from typing import List, Dict, Any, Optional, Tuple, Union
+import calendar
+
+# Validation patterns, compiled once
+_IDENTIFIER_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+_TIME_BUCKET_RE = re.compile(r'^\d{2}[-:]\d{2}(-\d{2}[-:]\d{2})?$')
+_DOMAIN_RE = re.compile(r'^[a-z_][a-z0-9_]*$')
+_ENTITY_CHARS_RE = re.compile(r'[^a-zA-Z0-9_.]')
+_OBJECT_ID_RE = re.compile(r'^[a-zA-Z0-9_]+$')
+
+def get_time_bucket(current_time: datetime, bucket_minutes: int = 60) -> str:
+    """
+    Convert current time to a time bucket string.
+
+    Bucket strings come from a per-size table built by generate_time_buckets,
+    so no new string is formatted per call.
+
+    Args:
+        current_time: Current datetime
+        bucket_minutes: Minutes per bucket (default 60)
+
+    Returns:
+        Time bucket string like "08-09" or "14-15"
+    """
+    buckets = _BUCKET_TABLES.get(bucket_minutes)
+    if buckets is None:
+        if bucket_minutes <= 0:
+            raise ValueError(f"Invalid time bucket size: {bucket_minutes}")
+        buckets = _BUCKET_TABLES[bucket_minutes] = generate_time_buckets(bucket_minutes)
+    return buckets[(current_time.hour * 60 + current_time.minute) // bucket_minutes]
+
+
+# Time bucket strings per bucket size (see get_time_bucket)
+_BUCKET_TABLES: Dict[int, List[str]] = {}
+
+
+def get_day_type(current_time: datetime) -> str:
+    """
+    Determine day type (weekday/weekend).
+
+    Args:
+        current_time: Current datetime
+
+    Returns:
+        "weekday" or "weekend"
+    """
+    weekday = current_time.weekday()  # Monday = 0, Sunday = 6
+    return "weekend" if weekday >= 5 else "weekday"
+
+
+def build_scenario_id(
+    room: str,
+    time_bucket: str,
+    day_type: str = "",
+    optional_flags: Optional[List[str]] = None,
+    interaction_type: str = ""
+) -> str:
+    """
+    Build a scenario ID from components.
+
+    Args:
+        room: Room name
+        time_bucket: Time bucket string
+        day_type: Day type (weekday/weekend)
+        optional_flags: List of optional flags
+        interaction_type: Type of interaction
+
+    Returns:
+        Scenario ID string like "kitchen|08-09|weekday|christmas_mode|single_press"
+    """
+    components = [room, time_bucket]
+
+    if day_type:
+        components.append(day_type)
+
+    if optional_flags:
+        flags_str = "+".join(sorted(optional_flags))
+        components.append(flags_str)
+
+    if interaction_type:
+        components.append(interaction_type)
+
+    return "|".join(components)
+
+
+def parse_scenario_id(scenario_id: str) -> Dict[str, Any]:
+    """
+    Parse a scenario ID into its components.
+
+    Args:
+        scenario_id: Scenario ID string
+
+    Returns:
+        Dictionary with parsed components
+    """
+    parts = scenario_id.split("|")
+
+    result = {
+        "room": parts[0] if len(parts) > 0 else "",
+        "time_bucket": parts[1] if len(parts) > 1 else "",
+        "day_type": parts[2] if len(parts) > 2 else "",
+        "optional_flags": parts[3].split("+") if len(parts) > 3 and parts[3] else [],
+        "interaction_type": parts[4] if len(parts) > 4 else ""
+    }
+
+    return result
+
+
+def validate_scenario_id(scenario_id: str) -> Dict[str, Any]:
+    """
+    Validate a scenario ID format.
+
+    Accepts the rule syntax of compile_scenario_rules: "*" in any
+    component, time ranges, day masks and flag subsets.
+
+    Args:
+        scenario_id: Scenario ID to validate
+
+    Returns:
+        Dictionary with validation result and errors
+    """
+    if not scenario_id:
+        return {"valid": False, "errors": ["Scenario ID cannot be empty"]}
+
+    try:
+        compile_scenario_rules(scenario_id)
+    except ValueError as e:
+        return {"valid": False, "errors": [str(e)], "components": None}
+
+    return {
+        "valid": True,
+        "errors": [],
+        "components": parse_scenario_id(scenario_id)
+    }
+
+
+def validate_service_call(action: Dict[str, Any]) -> bool:
+    """
+    Validate a Home Assistant service call.
+
+    Args:
+        action: Action dictionary
+
+    Returns:
+        True if valid, False otherwise
+    """
+    if not isinstance(action, dict):
+        return False
+
+    # Check for required fields
+    service = action.get(
+        "service") or f"{action.get('domain', '')}.{action.get('action', '')}"
+
+    if not service or "." not in service:
+        return False
+
+    domain, service_name = service.split(".", 1)
+
+    # Validate domain format
+    if not _DOMAIN_RE.match(domain):
+        return False
+
+    # Validate service name format
+    if not _DOMAIN_RE.match(service_name):
+        return False
+
+    return True
+
+
+def sanitize_entity_id(entity_id: str) -> str:
+    """
+    Sanitize entity ID to prevent injection attacks.
+
+    Args:
+        entity_id: Entity ID to sanitize
+
+    Returns:
+        Sanitized entity ID
+    """
+    if not entity_id:
+        return ""
+
+    # Remove any characters that aren't alphanumeric, underscore, or dot
+    sanitized = _ENTITY_CHARS_RE.sub('', entity_id)
+
+    # Ensure it has the correct format (domain.entity)
+    if "." not in sanitized:
+        return ""
+
+    domain, entity = sanitized.split(".", 1)
+
+    # Validate domain and entity parts
+    if not _DOMAIN_RE.match(domain):
+        return ""
+
+    if not _OBJECT_ID_RE.match(entity):
+        return ""
+
+    return f"{domain}.{entity}"
+
+
+def evaluate_conditions(conditions: List[Dict[str, Any]], hass_instance) -> bool:
+    """
+    Evaluate a list of conditions.
+
+    Args:
+        conditions: List of condition dictionaries
+        hass_instance: Home Assistant instance for state checking
+
+    Returns:
+        True if all conditions pass, False otherwise
+    """
+    if not conditions:
+        return True
+
+    for condition in conditions:
+        try:
+            condition_type = condition.get("condition", "state")
+
+            if condition_type == "state":
+                entity_id = condition.get("entity_id")
+                expected_state = condition.get("state")
+
+                if not entity_id or expected_state is None:
+                    return False
+
+                current_state = hass_instance.get_state(entity_id)
+                if current_state != expected_state:
+                    return False
+
+            elif condition_type == "numeric_state":
+                entity_id = condition.get("entity_id")
+                above = condition.get("above")
+                below = condition.get("below")
+
+                if not entity_id:
+                    return False
+
+                try:
+                    current_value = float(hass_instance.get_state(entity_id))
+
+                    if above is not None and current_value <= above:
+                        return False
+
+                    if below is not None and current_value >= below:
+                        return False
+
+                except (ValueError, TypeError):
+                    return False
+
+            elif condition_type == "time":
+                after = condition.get("after")
+                before = condition.get("before")
+                current_time = datetime.now().time()
+
+                if after and current_time < time.fromisoformat(after):
+                    return False
+
+                if before and current_time > time.fromisoformat(before):
+                    return False
+
+            # Add more condition types as needed
+
+        except Exception as e:
+            # Log error in production
+            return False
+
+    return True
+
+
+def generate_time_buckets(bucket_minutes: int = 60) -> List[str]:
+    """
+    Generate all possible time buckets for a given bucket size.
+
+    Args:
+        bucket_minutes: Minutes per bucket
+
+    Returns:
+        List of time bucket strings
+    """
+    buckets = []
+
+    if bucket_minutes == 60:
+        # Hour-based buckets
+        for hour in range(24):
+            next_hour = (hour + 1) % 24
+            buckets.append(f"{hour:02d}-{next_hour:02d}")
+
+    elif bucket_minutes == 30:
+        # 30-minute buckets
+        for hour in range(24):
+            buckets.append(f"{hour:02d}:00-{hour:02d}:30")
+            next_hour = (hour + 1) % 24
+            buckets.append(f"{hour:02d}:30-{next_hour:02d}:00")
+
+    elif bucket_minutes == 15:
+        # 15-minute buckets
+        for hour in range(24):
+            for quarter in range(4):
+                start_min = quarter * 15
+                end_min = start_min + 15
+                end_hour = hour
+
+                if end_min == 60:
+                    end_min = 0
+                    end_hour = (hour + 1) % 24
+
+                buckets.append(
+                    f"{hour:02d}:{start_min:02d}-{end_hour:02d}:{end_min:02d}")
+
+    elif bucket_minutes > 0:
+        # Custom bucket size (same format as get_time_bucket)
+        for start_minutes in range(0, 24 * 60, bucket_minutes):
+            end_minutes = start_minutes + bucket_minutes
+            buckets.append(
+                f"{start_minutes // 60:02d}:{start_minutes % 60:02d}-"
+                f"{end_minutes // 60:02d}:{end_minutes % 60:02d}")
+
+    return buckets
+
+
+def get_scenario_suggestions(unmatched_log_file: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Get scenario suggestions from unmatched log entries.
+
+    Args:
+        unmatched_log_file: Path to unmatched scenarios log
+        limit: Maximum number of suggestions
+
+    Returns:
+        List of scenario suggestions
+    """
+    suggestions = {}
+
+    try:
+        with open(unmatched_log_file, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line.strip())
+                    scenario_id = entry.get("scenario_id", "")
+
+                    if scenario_id in suggestions:
+                        suggestions[scenario_id]["count"] += 1
+                        suggestions[scenario_id]["last_seen"] = entry.get(
+                            "timestamp", "")
+                    else:
+                        suggestions[scenario_id] = {
+                            "scenario_id": scenario_id,
+                            "count": 1,
+                            "first_seen": entry.get("timestamp", ""),
+                            "last_seen": entry.get("timestamp", ""),
+                            "context": entry.get("context", {})
+                        }
+
+                except json.JSONDecodeError:
+                    continue
+
+    except FileNotFoundError:
+        return []
+
+    # Sort by frequency and recency
+    sorted_suggestions = sorted(
+        suggestions.values(),
+        key=lambda x: (x["count"], x["last_seen"]),
+        reverse=True
+    )
+
+    return sorted_suggestions[:limit]
+
+
+def export_scenarios_to_csv(scenarios: Dict[str, List[Dict[str, Any]]], output_file: str):
+    """
+    Export scenarios to CSV format for analysis.
+
+    Args:
+        scenarios: Scenarios dictionary
+        output_file: Output CSV file path
+    """
+    import csv
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+        fieldnames = [
+            'scenario_id', 'room', 'time_bucket', 'day_type',
+            'optional_flags', 'interaction_type', 'action_count', 'actions'
+        ]
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+
+        for scenario_id, actions in scenarios.items():
+            components = parse_scenario_id(scenario_id)
+
+            writer.writerow({
+                'scenario_id': scenario_id,
+                'room': components['room'],
+                'time_bucket': components['time_bucket'],
+                'day_type': components['day_type'],
+                'optional_flags': '+'.join(components['optional_flags']),
+                'interaction_type': components['interaction_type'],
+                'action_count': len(actions),
+                'actions': json.dumps(actions)
+            })
+
+
+def create_default_scenarios() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Create a set of default scenarios for common use cases.
+
+    Returns:
+        Dictionary of default scenarios
+    """
+    return {
+        # Living room presence detection during evening
+        "living_room|18-19|weekday|presence_detected": [
+            {
+                "service": "light.turn_on",
+                "entity_id": "light.living_room",
+                "data": {"brightness": 180, "color_temp": 300}
+            }
+        ],
+
+        # Kitchen morning routine
+        "kitchen|07-08|weekday|single_press": [
+            {
+                "service": "scene.turn_on",
+                "entity_id": "scene.kitchen_morning"
+            },
+            {
+                "service": "media_player.play_media",
+                "entity_id": "media_player.kitchen_speaker",
+                "data": {
+                    "media_content_id": "morning_playlist",
+                    "media_content_type": "playlist"
+                }
+            }
+        ],
+
+        # Bedroom night mode
+        "bedroom|22-23|night_mode|presence_detected": [
+            {
+                "service": "light.turn_on",
+                "entity_id": "light.bedroom_nightlight",
+                "data": {"brightness": 20, "rgb_color": [255, 100, 100]}
+            }
+        ],
+
+        # Office focus mode
+        "office|focus_mode|single_press": [
+            {
+                "service": "light.turn_on",
+                "entity_id": "light.office_desk",
+                "data": {"brightness": 255, "color_temp": 250}
+            },
+            {
+                "service": "switch.turn_off",
+                "entity_id": "switch.office_music"
+            }
+        ]
+    }
+
+
+def validate_scenarios_file(scenarios: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Validate an entire scenarios file.
+
+    Args:
+        scenarios: Scenarios dictionary to validate
+
+    Returns:
+        Validation result with errors and warnings
+    """
+    errors = []
+    warnings = []
+
+    for scenario_id, actions in scenarios.items():
+        # Validate scenario ID
+        id_validation = validate_scenario_id(scenario_id)
+        if not id_validation["valid"]:
+            errors.extend(
+                [f"Scenario '{scenario_id}': {error}" for error in id_validation["errors"]])
+
+        # Validate actions
+        if not isinstance(actions, list):
+            errors.append(f"Scenario '{scenario_id}': Actions must be a list")
+            continue
+
+        if not actions:
+            warnings.append(f"Scenario '{scenario_id}': No actions defined")
+            continue
+
+        for i, action in enumerate(actions):
+            if not validate_service_call(action):
+                errors.append(
+                    f"Scenario '{scenario_id}': Invalid action {i}: {action}")
+
+    # Check for duplicate scenarios (might indicate mistakes)
+    action_signatures = {}
+    for scenario_id, actions in scenarios.items():
+        signature = json.dumps(actions, sort_keys=True)
+        if signature in action_signatures:
+            warnings.append(
+                f"Scenarios '{scenario_id}' and '{action_signatures[signature]}' have identical actions")
+        else:
+            action_signatures[signature] = scenario_id
+
+    return {
+        "valid": len(errors) == 0,
+        "errors": errors,
+        "warnings": warnings,
+        "total_scenarios": len(scenarios),
+        "total_actions": sum(len(actions) for actions in scenarios.values())
+    }
+
+
+class FlagRegistry:
+    """
+    Canonical bitmask encoding of optional flag sets.
+
+    Each flag name gets one bit the first time it is seen, so a flag set is
+    a plain int: order-independent, hashable and cheap to compare. The
+    registry holds at most max_flags names; once that bit width is used up,
+    new names are rejected instead of growing masks without bound.
+    """
+
+    MAX_FLAGS = 64
+    MAX_NAMES_CACHE_SIZE = 4096
+
+    def __init__(self, max_flags: int = MAX_FLAGS):
+        self.max_flags = max_flags
+        self.bits: Dict[str, int] = {}
+        self._names: Dict[int, Tuple[str, ...]] = {0: ()}
+
+    def bit(self, flag: str) -> int:
+        """
+        Get the bit of a flag, registering it if needed.
+
+        Raises:
+            ValueError: If the flag is new and all max_flags bits are taken
+        """
+        bit = self.bits.get(flag)
+        if bit is None:
+            if len(self.bits) >= self.max_flags:
+                raise ValueError(f"Flag registry is full ({self.max_flags} flags), "
+                                 f"cannot register '{flag}'")
+            bit = self.bits[flag] = 1 << len(self.bits)
+        return bit
+
+    def mask(self, flags: Optional[List[str]]) -> int:
+        """Encode a collection of flag names."""
+        mask = 0
+        if flags:
+            for flag in flags:
+                mask |= self.bits.get(flag) or self.bit(flag)
+        return mask
+
+    def names(self, mask: int) -> Tuple[str, ...]:
+        """Decode a mask into sorted flag names (cached per mask)."""
+        names = self._names.get(mask)
+        if names is None:
+            if len(self._names) >= self.MAX_NAMES_CACHE_SIZE:
+                self._names = {0: ()}
+            names = self._names[mask] = tuple(sorted(
+                flag for flag, bit in self.bits.items() if mask & bit))
+        return names
+
+
+# Process-wide flag registry shared by all scenario keys (bounded, see FlagRegistry)
+FLAGS = FlagRegistry()
+
+
+class ScenarioKey:
+    """
+    Interned scenario key: (room, time_bucket, day_type, flag_mask, interaction_type).
+
+    Keys describe trigger contexts. They are created through ScenarioKey.of()
+    and interned, so equal keys are usually the same object: hashing uses a
+    precomputed hash and equality short-circuits on identity. The intern
+    table is dropped once it holds MAX_INTERNED keys; keys created before
+    that still compare equal by their components. The string scenario ID is
+    only built (once) for display and JSON via the scenario_id property.
+    """
+
+    __slots__ = ("room", "time_bucket", "day_type", "flag_mask", "interaction_type",
+                 "_parts", "_hash", "_scenario_id")
+
+    MAX_INTERNED = 50000
+
+    _interned: Dict[Tuple[str, str, str, int, str], "ScenarioKey"] = {}
+
+    @classmethod
+    def of(cls, room: str, time_bucket: str = "", day_type: str = "",
+           flag_mask: int = 0, interaction_type: str = "") -> "ScenarioKey":
+        """Get the interned key for the given components."""
+        parts = (room, time_bucket, day_type, flag_mask, interaction_type)
+        return cls._interned.get(parts) or cls._intern(parts)
+
+    @classmethod
+    def from_context(cls, room: str, time_bucket: str, day_type: str = "",
+                     optional_flags: Optional[List[str]] = None,
+                     interaction_type: str = "") -> "ScenarioKey":
+        """Get the key of a trigger context with flags given by name."""
+        mask = 0
+        if optional_flags:
+            bits = FLAGS.bits
+            for flag in optional_flags:
+                mask |= bits.get(flag) or FLAGS.bit(flag)
+        parts = (room, time_bucket, day_type, mask, interaction_type)
+        return cls._interned.get(parts) or cls._intern(parts)
+
+    @classmethod
+    def _intern(cls, parts: Tuple[str, str, str, int, str]) -> "ScenarioKey":
+        key = object.__new__(cls)
+        key.room, key.time_bucket, key.day_type, key.flag_mask, key.interaction_type = parts
+        key._parts = parts
+        key._hash = hash(parts)
+        key._scenario_id = None
+        if len(cls._interned) >= cls.MAX_INTERNED:
+            cls._interned.clear()
+        return cls._interned.setdefault(parts, key)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, ScenarioKey):
+            return NotImplemented
+        return self._parts == other._parts
+
+    def __repr__(self) -> str:
+        return f"ScenarioKey({self.scenario_id!r})"
+
+    def __reduce__(self):
+        return (ScenarioKey.from_context, (self.room, self.time_bucket, self.day_type,
+                                           list(self.optional_flags), self.interaction_type))
+
+    @property
+    def optional_flags(self) -> Tuple[str, ...]:
+        """Sorted optional flag names."""
+        return FLAGS.names(self.flag_mask)
+
+    @property
+    def scenario_id(self) -> str:
+        """External string form, e.g. "kitchen|08-09|weekday|christmas_mode|single_press"."""
+        scenario_id = self._scenario_id
+        if scenario_id is None:
+            if not self.time_bucket:
+                scenario_id = self.room
+            else:
+                scenario_id = build_scenario_id(self.room, self.time_bucket, self.day_type,
+                                                self.optional_flags, self.interaction_type)
+            self._scenario_id = scenario_id
+        return scenario_id
+
+
+# Fallback levels in resolution order (index == fallback level)
+FALLBACK_LEVELS = ["exact", "no_interaction", "no_flags", "no_day_type", "room_only"]
+
+
+def get_scenario_actions(scenario: Any) -> List[Dict[str, Any]]:
+    """
+    Get the action list of a scenario entry.
+
+    Args:
+        scenario: Scenario value (a list of actions or a dict with "actions")
+
+    Returns:
+        List of action dictionaries
+    """
+    if isinstance(scenario, list):
+        return scenario
+    if isinstance(scenario, dict):
+        return scenario.get("actions", [])
+    return []
+
+
+DAY_NAMES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+ALL_DAYS = 0b1111111
+
+# Day masks (bit 0 = Monday) for the day component of scenario IDs
+DAY_MASKS = {
+    "*": ALL_DAYS,
+    "weekday": 0b0011111,
+    "weekend": 0b1100000,
+    **{name: 1 << day for day, name in enumerate(DAY_NAMES)}
+}
+
+MINUTES_PER_DAY = 24 * 60
+
+WILDCARD = "*"
+
+# Flag component modes
+FLAGS_ANY, FLAGS_SUBSET, FLAGS_EXACT = 0, 1, 2
+
+
+def parse_time_range(value: str) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse the time component of a scenario ID into minute intervals.
+
+    Accepts "*", "HH-HH" and "HH:MM-HH:MM". Ranges ending at or before
+    their start wrap past midnight ("22-02" covers 22:00-02:00).
+
+    Args:
+        value: Time component
+
+    Returns:
+        List of [start, end) minute-of-day intervals, or None if invalid
+    """
+    if value == WILDCARD:
+        return [(0, MINUTES_PER_DAY)]
+    if not _TIME_BUCKET_RE.match(value):
+        return None
+
+    bounds = []
+    for part in value.replace(":", ".").split("-"):
+        hour, _, minute = part.partition(".")
+        hour, minute = int(hour), int(minute or 0)
+        if hour > 24 or minute > 59:
+            return None
+        bounds.append(hour * 60 + minute)
+    if len(bounds) != 2:
+        return None
+    start, end = bounds
+    if start >= MINUTES_PER_DAY:
+        return None
+    if end > start:
+        return [(start, min(end, MINUTES_PER_DAY))]
+    if end == 0:
+        return [(start, MINUTES_PER_DAY)]
+    return [(start, MINUTES_PER_DAY), (0, end)]
+
+
+def parse_day_mask(value: str) -> Optional[int]:
+    """
+    Parse the day component of a scenario ID into a weekday bitmask.
+
+    Accepts "*", "weekday", "weekend", day names and "+"-joined lists of
+    them ("mon+wed+fri", "weekend+fri").
+
+    Returns:
+        Bitmask with bit 0 = Monday, or None if invalid
+    """
+    mask = 0
+    for part in value.split("+"):
+        day_mask = DAY_MASKS.get(part)
+        if day_mask is None:
+            return None
+        mask |= day_mask
+    return mask
+
+
+class ScenarioRule:
+    """
+    One compiled matching rule of a scenario ID.
+
+    IDs may use "*" in any component, time ranges, day masks and flag
+    subsets ("a+b+*" = at least a and b). Legacy IDs compile to the rules
+    equivalent to the old fallback chain: omitted trailing components are
+    wildcards, except that flags given without an interaction must match
+    exactly.
+    """
+
+    __slots__ = ("scenario_id", "intervals", "time_span", "day_mask", "flag_mode",
+                 "flag_mask", "interaction_type", "level", "rank")
+
+    def __init__(self, scenario_id: str, intervals: List[Tuple[int, int]], day_mask: int,
+                 flag_mode: int, flag_mask: int, interaction_type: Optional[str], order: int):
+        self.scenario_id = scenario_id
+        self.intervals = intervals
+        self.time_span = sum(end - start for start, end in intervals)
+        self.day_mask = day_mask
+        self.flag_mode = flag_mode
+        self.flag_mask = flag_mask
+        self.interaction_type = interaction_type
+
+        # Fallback level: the most general wildcard component
+        if self.time_span == MINUTES_PER_DAY:
+            self.level = 4
+        elif day_mask == ALL_DAYS:
+            self.level = 3
+        elif flag_mode != FLAGS_EXACT:
+            self.level = 2
+        elif interaction_type is None:
+            self.level = 1
+        else:
+            self.level = 0
+
+        # Specificity, compared lexicographically by (time, day, flags,
+        # interaction); lower ranks win
+        self.rank = (
+            self.time_span,
+            bin(day_mask).count("1"),
+            -flag_mode,
+            -bin(flag_mask).count("1"),
+            interaction_type is None,
+            order
+        )
+
+    def level_for(self, flag_mask: int, interaction_type: str) -> int:
+        """
+        Get the fallback level of this rule for a context.
+
+        Like the old fallback chain, ignoring flags is no fallback step when
+        the context has none, and ignoring the interaction none when it is
+        empty.
+        """
+        level = self.level
+        if level == 2 and not flag_mask:
+            level = 1
+        if level == 1 and not interaction_type:
+            level = 0
+        return level
+
+    def matches(self, days: int, flag_mask: int, interaction_type: str) -> bool:
+        """Check the day, flag and interaction components against a context."""
+        if days & ~self.day_mask:
+            return False
+        if self.flag_mode == FLAGS_EXACT:
+            if flag_mask != self.flag_mask:
+                return False
+        elif self.flag_mode == FLAGS_SUBSET and flag_mask & self.flag_mask != self.flag_mask:
+            return False
+        return self.interaction_type is None or self.interaction_type == interaction_type
+
+
+def _parse_flags(value: str) -> Optional[Tuple[int, int]]:
+    """Parse a flag component into (mode, mask); None if invalid."""
+    if value == WILDCARD:
+        return FLAGS_ANY, 0
+    names = value.split("+")
+    mode = FLAGS_EXACT
+    if names[-1] == WILDCARD:
+        mode = FLAGS_SUBSET
+        names.pop()
+    if not all(_IDENTIFIER_RE.match(name) for name in names):
+        return None
+    return mode, FLAGS.mask(names)
+
+
+def compile_scenario_rules(scenario_id: str, order: int = 0) -> List[ScenarioRule]:
+    """
+    Compile a scenario ID into matching rules.
+
+    Args:
+        scenario_id: "room|time|day|flags|interaction"; trailing components
+            may be omitted, a 4-part ID is read both as flags (any
+            interaction) and as interaction (no flags), like before
+        order: Tie-breaker between equally specific rules
+
+    Returns:
+        List of rules
+
+    Raises:
+        ValueError: If a component is invalid
+    """
+    parts = scenario_id.split("|")
+    if len(parts) > 5:
+        raise ValueError("Scenario ID has more than 5 components")
+    room = parts[0]
+    if room != WILDCARD and not _IDENTIFIER_RE.match(room):
+        raise ValueError("Room must be a valid identifier or '*'")
+
+    intervals = parse_time_range(parts[1]) if len(parts) > 1 else [(0, MINUTES_PER_DAY)]
+    if intervals is None:
+        raise ValueError(f"Invalid time range: {parts[1]}")
+    day_mask = parse_day_mask(parts[2]) if len(parts) > 2 else ALL_DAYS
+    if day_mask is None:
+        raise ValueError(f"Invalid day: {parts[2]}")
+
+    readings = []
+    if len(parts) < 4:
+        readings.append((WILDCARD, WILDCARD))
+    elif len(parts) == 4:
+        readings.append((parts[3], WILDCARD))
+        if "+" not in parts[3] and parts[3] != WILDCARD:
+            readings.append(("", parts[3]))
+    else:
+        readings.append((parts[3], parts[4]))
+
+    rules = []
+    for flags, interaction_type in readings:
+        parsed = _parse_flags(flags) if flags else (FLAGS_EXACT, 0)
+        if parsed is None:
+            raise ValueError(f"Invalid flags: {flags}")
+        if interaction_type != WILDCARD and not _IDENTIFIER_RE.match(interaction_type):
+            raise ValueError(f"Invalid interaction type: {interaction_type}")
+        rules.append(ScenarioRule(
+            scenario_id, intervals, day_mask, parsed[0], parsed[1],
+            None if interaction_type == WILDCARD else interaction_type, order))
+    return rules
+
+
+def _merge_sorted(lists: List[List[Any]]) -> List[Any]:
+    merged = [item for items in lists for item in items]
+    merged.sort(key=lambda item: item[0].rank)
+    return merged
+
+
+class _RoomRules:
+    """Interval index of the rules of one room over the minutes of a day."""
+
+    __slots__ = ("bounds", "segments")
+
+    def __init__(self, rules: List[ScenarioRule]):
+        bounds = {0, MINUTES_PER_DAY}
+        for rule in rules:
+            for start, end in rule.intervals:
+                bounds.update((start, end))
+        self.bounds = sorted(bounds)[:-1]
+
+        # Per elementary segment: rules covering it (with the end of the
+        # covering interval), split by interaction type, most specific first
+        self.segments = []
+        for start in self.bounds:
+            by_interaction: Dict[Optional[str], List[Tuple[ScenarioRule, int]]] = {}
+            for rule in rules:
+                for interval_start, interval_end in rule.intervals:
+                    if interval_start <= start < interval_end:
+                        by_interaction.setdefault(rule.interaction_type, []).append(
+                            (rule, interval_end))
+            for candidates in by_interaction.values():
+                candidates.sort(key=lambda item: item[0].rank)
+            self.segments.append(by_interaction)
+
+    def best(self, start: int, end: int, days: int, flag_mask: int, interaction_type: str,
+             max_level: int) -> Optional[ScenarioRule]:
+        """Get the most specific rule covering [start, end) that matches the context."""
+        segment = self.segments[bisect_right(self.bounds, start) - 1]
+        best = None
+        for candidates in (segment.get(interaction_type), segment.get(None)):
+            if not candidates:
+                continue
+            for rule, rule_end in candidates:
+                if best is not None and rule.rank >= best.rank:
+                    break
+                if rule_end >= end and rule.matches(days, flag_mask, interaction_type) and \
+                        rule.level_for(flag_mask, interaction_type) <= max_level:
+                    best = rule
+                    break
+        return best
+
+
+class ScenarioIndex:
+    """
+    Compiled, read-only lookup structure for scenario resolution.
+
+    Scenario IDs are compiled into rules (see compile_scenario_rules) and
+    indexed per room by time interval; a lookup bisects to the time segment
+    and returns the first matching rule of its specificity-ordered
+    candidates. Resolution is pure: it only depends on the context passed
+    in and the scenarios the index was built from. Results are memoized
+    per context key and weekday.
+    """
+
+    MAX_CACHE_SIZE = 50000
+
+    def __init__(self, scenarios: Dict[str, Any]):
+        self.entries = {
+            scenario_id: get_scenario_actions(scenario)
+            for scenario_id, scenario in scenarios.items()
+            if not scenario_id.startswith("_")
+        }
+        self.errors: Dict[str, str] = {}
+        rules_by_room: Dict[str, List[ScenarioRule]] = {}
+        for order, scenario_id in enumerate(self.entries):
+            try:
+                rules = compile_scenario_rules(scenario_id, order)
+            except ValueError as e:
+                self.errors[scenario_id] = str(e)
+                continue
+            rules_by_room.setdefault(scenario_id.split("|", 1)[0], []).extend(rules)
+
+        self.rules = [rule for rules in rules_by_room.values() for rule in rules]
+        self.rooms = sorted(room for room in rules_by_room if room != WILDCARD)
+        self.interaction_types = sorted({rule.interaction_type for rule in self.rules
+                                         if rule.interaction_type is not None})
+
+        # Wildcard-room rules take part in every room's index
+        wildcard_rules = rules_by_room.pop(WILDCARD, [])
+        self._rooms = {room: _RoomRules(rules + wildcard_rules)
+                       for room, rules in rules_by_room.items()}
+        self._any_room = _RoomRules(wildcard_rules)
+
+        # Caches by [fallback_enabled][weekday or 7 when only day_type is known]
+        self._caches = [[{} for _ in range(8)], [{} for _ in range(8)]]
+        self._bucket_intervals: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, scenario_id: str) -> bool:
+        return scenario_id in self.entries
+
+    def actions(self, scenario_id: str) -> List[Dict[str, Any]]:
+        """Get the actions for a resolved scenario ID."""
+        return self.entries.get(scenario_id, [])
+
+    def resolve_key(self, key: ScenarioKey, fallback_enabled: bool = True,
+                    weekday: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """
+        Resolve a context key to the most specific matching scenario.
+
+        Args:
+            key: Context key (see ScenarioKey.from_context)
+            fallback_enabled: Whether rules with wildcards (fallback level
+                above 0) may match
+            weekday: Day of week (Monday = 0); when None the context covers
+                every day of its day_type
+
+        Returns:
+            (scenario_id, fallback_level) tuple or None if nothing matches
+        """
+        cache = self._caches[fallback_enabled][7 if weekday is None else weekday]
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+        result = None
+        interval = self._bucket_interval(key.time_bucket)
+        if interval is not None:
+            if weekday is not None:
+                days = 1 << weekday
+            else:
+                days = DAY_MASKS.get(key.day_type, ALL_DAYS)
+            room_rules = self._rooms.get(key.room, self._any_room)
+            rule = room_rules.best(interval[0], interval[1], days, key.flag_mask,
+                                   key.interaction_type, 4 if fallback_enabled else 0)
+            if rule is not None:
+                result = (rule.scenario_id, rule.level_for(key.flag_mask, key.interaction_type))
+
+        if len(cache) >= self.MAX_CACHE_SIZE:
+            cache.clear()
+        cache[key] = result
+        return result
+
+    def resolve(
+        self,
+        room: str,
+        time_bucket: str,
+        day_type: str = "",
+        optional_flags: Optional[List[str]] = None,
+        interaction_type: str = "",
+        fallback_enabled: bool = True,
+        weekday: Optional[int] = None
+    ) -> Optional[Tuple[str, int]]:
+        """
+        Resolve a context to the most specific matching scenario.
+
+        Args:
+            room: Room name
+            time_bucket: Time bucket string
+            day_type: Day type (weekday/weekend)
+            optional_flags: List of active optional flags
+            interaction_type: Type of interaction
+            fallback_enabled: Whether rules with wildcards may match
+            weekday: Day of week (Monday = 0), if known
+
+        Returns:
+            (scenario_id, fallback_level) tuple or None if nothing matches
+        """
+        return self.resolve_key(
+            ScenarioKey.from_context(room, time_bucket, day_type, optional_flags, interaction_type),
+            fallback_enabled, weekday)
+
+    def candidate_rules(self, room: str, time_bucket: str) -> List[ScenarioRule]:
+        """Get the rules of a room whose time range covers a bucket, most specific first."""
+        interval = self._bucket_interval(time_bucket)
+        if interval is None:
+            return []
+        room_rules = self._rooms.get(room, self._any_room)
+        segment = room_rules.segments[bisect_right(room_rules.bounds, interval[0]) - 1]
+        return [rule for rule, rule_end in _merge_sorted(list(segment.values()))
+                if rule_end >= interval[1]]
+
+    def _bucket_interval(self, time_bucket: str) -> Optional[Tuple[int, int]]:
+        try:
+            return self._bucket_intervals[time_bucket]
+        except KeyError:
+            pass
+        intervals = parse_time_range(time_bucket) if time_bucket else None
+        interval = intervals[0] if intervals and len(intervals) == 1 else None
+        self._bucket_intervals[time_bucket] = interval
+        return interval
+
+
+def simulate_batch(
+    index: ScenarioIndex,
+    contexts: List[Dict[str, Any]],
+    bucket_minutes: int = 60,
+    fallback_enabled: bool = True
+) -> Dict[str, Any]:
+    """
+    Evaluate a batch of trigger contexts against a scenario index.
+
+    Nothing is executed; each context is resolved to the scenario and
+    fallback level the engine would use.
+
+    Args:
+        index: Compiled scenario index
+        contexts: List of dicts with room, interaction_type, timestamp and
+            optional_flags (time_bucket/day_type/weekday override the
+            timestamp; weekday is a day name or 0-6, Monday = 0)
+        bucket_minutes: Minutes per time bucket
+        fallback_enabled: Whether fallback levels above 0 may match
+
+    Returns:
+        Dictionary with per-context results and a summary
+    """
+    results = []
+    level_counts = [0] * len(FALLBACK_LEVELS)
+    unmatched = 0
+    timestamp_cache = {}
+
+    for context in contexts:
+        room = context.get("room", "")
+        interaction_type = context.get("interaction_type", "")
+        time_bucket = context.get("time_bucket")
+        day_type = context.get("day_type")
+        weekday = context.get("weekday")
+        if isinstance(weekday, str):
+            weekday = DAY_NAMES.index(weekday) if weekday in DAY_NAMES else None
+        if day_type is None and weekday is not None:
+            day_type = "weekend" if weekday >= 5 else "weekday"
+
+        if time_bucket is None or day_type is None:
+            timestamp = context.get("timestamp") or datetime.now()
+            derived = timestamp_cache.get(timestamp)
+            if derived is None:
+                current_time = (datetime.fromisoformat(timestamp)
+                                if isinstance(timestamp, str) else timestamp)
+                derived = (get_time_bucket(current_time, bucket_minutes),
+                           get_day_type(current_time), current_time.weekday())
+                timestamp_cache[timestamp] = derived
+            time_bucket = derived[0] if time_bucket is None else time_bucket
+            if day_type is None:
+                day_type, weekday = derived[1], derived[2]
+
+        key = ScenarioKey.from_context(room, time_bucket, day_type,
+                                       context.get("optional_flags"), interaction_type)
+        match = index.resolve_key(key, fallback_enabled, weekday)
+
+        result = {
+            "room": room,
+            "interaction_type": interaction_type,
+            "time_bucket": time_bucket,
+            "day_type": day_type,
+            "weekday": DAY_NAMES[weekday] if weekday is not None else None,
+            "optional_flags": list(key.optional_flags),
+            "scenario_id": key.scenario_id,
+            "matched_scenario_id": None,
+            "fallback_level": None,
+            "fallback": None,
+            "action_count": 0
+        }
+
+        if match:
+            matched_id, level = match
+            level_counts[level] += 1
+            result.update({
+                "matched_scenario_id": matched_id,
+                "fallback_level": level,
+                "fallback": FALLBACK_LEVELS[level],
+                "action_count": len(index.actions(matched_id))
+            })
+        else:
+            unmatched += 1
+
+        results.append(result)
+
+    return {
+        "results": results,
+        "summary": {
+            "total": len(results),
+            "matched": len(results) - unmatched,
+            "unmatched": unmatched,
+            "fallback_levels": dict(zip(FALLBACK_LEVELS, level_counts))
+        }
+    }
+
+
+def analyze_coverage(
+    index: ScenarioIndex,
+    rooms: List[str],
+    optional_flags: List[str],
+    interaction_types: List[str],
+    bucket_minutes: int = 60,
+    fallback_enabled: bool = True
+) -> Dict[str, Any]:
+    """
+    Compute how every context in the context space resolves.
+
+    The space is rooms x time buckets x weekdays x every subset of the
+    optional flags x interaction types. Contexts are not resolved one by
+    one: within a cell only the flags mentioned by the cell's candidate
+    rules are enumerated, and all subsets that differ only in other flags
+    are counted together.
+
+    Args:
+        index: Compiled scenario index
+        rooms: Room names
+        optional_flags: All known optional flags
+        interaction_types: Interaction types to enumerate
+        bucket_minutes: Minutes per time bucket
+        fallback_enabled: Whether fallback levels above 0 may match
+
+    Returns:
+        Dictionary with dimensions, per-cell level counts and totals
+    """
+    time_buckets = generate_time_buckets(bucket_minutes)
+    known_flags = sorted(set(optional_flags))
+    known_mask = FLAGS.mask(known_flags)
+    interactions = list(dict.fromkeys(interaction_types))
+    levels = FALLBACK_LEVELS + ["unmatched"]
+    unmatched_level = len(FALLBACK_LEVELS)
+    max_level = 4 if fallback_enabled else 0
+
+    contexts_per_cell = 2 ** len(known_flags) * len(interactions)
+    totals = [0] * len(levels)
+    matrix = {}
+    cell_cache: Dict[Tuple[ScenarioRule, ...], List[int]] = {}
+
+    def count_cell(candidates: Tuple[ScenarioRule, ...], day: int) -> List[int]:
+        counts = [0] * len(levels)
+        mentioned = 0
+        for rule in candidates:
+            mentioned |= rule.flag_mask
+        mentioned &= known_mask
+        other_mask = known_mask & ~mentioned
+        # Subsets with at least one unmentioned flag behave alike
+        other_bit = other_mask & -other_mask
+        other_subsets = 2 ** bin(other_mask).count("1") - 1
+
+        submask = mentioned
+        while True:
+            for interaction in interactions:
+                for flag_mask, weight in ((submask, 1), (submask | other_bit, other_subsets)):
+                    if not weight:
+                        continue
+                    level = unmatched_level
+                    for rule in candidates:
+                        if rule.matches(day, flag_mask, interaction):
+                            rule_level = rule.level_for(flag_mask, interaction)
+                            if rule_level <= max_level:
+                                level = rule_level
+                                break
+                    counts[level] += weight
+            if not submask:
+                break
+            submask = (submask - 1) & mentioned
+        return counts
+
+    for room in rooms:
+        room_matrix = {name: [] for name in DAY_NAMES}
+        for time_bucket in time_buckets:
+            rules = index.candidate_rules(room, time_bucket)
+            for weekday, name in enumerate(DAY_NAMES):
+                day = 1 << weekday
+                candidates = tuple(rule for rule in rules if rule.day_mask & day)
+                counts = cell_cache.get(candidates)
+                if counts is None:
+                    counts = cell_cache[candidates] = count_cell(candidates, day)
+                for level, count in enumerate(counts):
+                    totals[level] += count
+                room_matrix[name].append(counts)
+        matrix[room] = room_matrix
+
+    total_contexts = sum(totals)
+    return {
+        "dimensions": {
+            "rooms": list(rooms),
+            "time_buckets": time_buckets,
+            "days": DAY_NAMES,
+            "optional_flags": known_flags,
+            "interaction_types": interactions
+        },
+        "levels": levels,
+        "contexts_per_cell": contexts_per_cell,
+        "total_contexts": total_contexts,
+        "totals": dict(zip(levels, totals)),
+        "coverage": (total_contexts - totals[unmatched_level]) / total_contexts
+                    if total_contexts else 0.0,
+        "matrix": matrix
+    }
@@ -0,0 +1,244 @@
+"""
+Nodalink Shared State
+In-memory state shared by the AppDaemon engine and the FastAPI backend
+(scenarios, config, engine status, logs and WebSocket notifications).
+Has no FastAPI/pydantic dependency so the engine can import it cheaply.
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Any
+
+from .log_pipeline import LogPipeline
+from .scenario_utils import ScenarioIndex
+
+
+class SharedState:
+    """Shared state container for AppDaemon and FastAPI communication"""
+    def __init__(self):
+        self.scenarios = {}
+        self.config = {}
+        self.engine_instance = None
+        self.lock = threading.RLock()
+        self.stats = {
+            "total_scenarios": 0,
+            "total_actions": 0,
+            "rooms": [],
+            "time_buckets": [],
+            "interaction_types": []
+        }
+        self.engine_status = {
+            "running": False,
+            "scenarios_loaded": 0,
+            "last_execution": None,
+            "last_config_update": None
+        }
+        self.logs = []
+        self.unmatched_scenarios = []
+        self.websocket_connections = set()
+        self.scenario_index = None
+        self.loop = None
+        self.log_pipeline = LogPipeline(self._append_log_batch)
+
+    def attach_event_loop(self, loop):
+        """Remember the server event loop so other threads can notify clients"""
+        self.loop = loop
+    
+    def set_engine_instance(self, engine):
+        """Set reference to AppDaemon engine instance for direct access"""
+        with self.lock:
+            self.engine_instance = engine
+            self.engine_status["running"] = True
+            self.engine_status["scenarios_loaded"] = len(getattr(engine, 'scenarios', {}))
+    
+    def update_scenarios(self, scenarios):
+        """Update scenarios and notify WebSocket clients"""
+        with self.lock:
+            self.scenarios = scenarios
+            self.scenario_index = None
+            self._update_stats()
+            self._notify_websocket_clients("scenarios_update", scenarios)
+    
+    def update_config(self, config):
+        """Update configuration and notify WebSocket clients"""
+        with self.lock:
+            self.config = config
+            self.engine_status["last_config_update"] = datetime.now().isoformat()
+            self._notify_websocket_clients("config_update", config)
+    
+    def update_engine_status(self, status):
+        """Update engine status"""
+        with self.lock:
+            self.engine_status.update(status)
+            self._notify_websocket_clients("status_update", self.engine_status)
+    
+    def add_log_entry(self, level, message, data=None, source=None):
+        """Queue log entry; the log pipeline flushes it in the background"""
+        self.log_pipeline.submit(level, message, data, source)
+
+    def _append_log_batch(self, log_entries):
+        """Store a flushed batch of log entries and notify WebSocket clients"""
+        with self.lock:
+            self.logs.extend(log_entries)
+            # Keep only last 1000 entries
+            if len(self.logs) > 1000:
+                self.logs = self.logs[-1000:]
+        for log_entry in log_entries:
+            self._notify_websocket_clients("log_update", log_entry)
+    
+    def add_unmatched_scenario(self, scenario_data):
+        """Add unmatched scenario and notify WebSocket clients"""
+        with self.lock:
+            self.unmatched_scenarios.append(scenario_data)
+            # Keep only last 500 entries
+            if len(self.unmatched_scenarios) > 500:
+                self.unmatched_scenarios = self.unmatched_scenarios[-500:]
+            self._notify_websocket_clients("unmatched_scenario", scenario_data)
+    
+    def reload_engine_data(self):
+        """Reload data from engine instance if available"""
+        if self.engine_instance:
+            with self.lock:
+                try:
+                    # Force reload from engine
+                    self.engine_instance.reload_scenarios()
+                    self.engine_instance.reload_config()
+                    
+                    # Update shared state
+                    self.scenarios = getattr(self.engine_instance, 'scenarios', {})
+                    self.scenario_index = None
+                    self.config = getattr(self.engine_instance, 'config', {})
+                    self._update_stats()
+                    
+                    # Notify clients
+                    self._notify_websocket_clients("engine_reload", {
+                        "scenarios": self.scenarios,
+                        "config": self.config,
+                        "timestamp": datetime.now().isoformat()
+                    })
+                    return True
+                except Exception as e:
+                    logging.error(f"Failed to reload engine data: {e}")
+                    return False
+        return False
+    
+    def get_scenario_index(self):
+        """Get the compiled scenario index, rebuilding it after scenario updates"""
+        with self.lock:
+            if self.scenario_index is None:
+                self.scenario_index = ScenarioIndex(self.scenarios)
+            return self.scenario_index
+
+    def execute_scenario_test(self, room: str, interaction_type: str = "manual"):
+        """Execute a test scenario through the engine"""
+        if self.engine_instance and hasattr(self.engine_instance, 'simulate_scenario'):
+            try:
+                result = self.engine_instance.simulate_scenario(room, interaction_type)
+                self._notify_websocket_clients("scenario_test", result)
+                return result
+            except Exception as e:
+                logging.error(f"Failed to execute scenario test: {e}")
+                return {"error": str(e)}
+        return {"error": "Engine not available"}
+    
+    def add_websocket_connection(self, websocket):
+        """Add WebSocket connection"""
+        self.websocket_connections.add(websocket)
+    
+    def remove_websocket_connection(self, websocket):
+        """Remove WebSocket connection"""
+        self.websocket_connections.discard(websocket)
+    
+    def _notify_websocket_clients(self, event_type: str, data: Any):
+        """Notify all connected WebSocket clients"""
+        if not self.websocket_connections:
+            return
+        
+        message = {
+            "type": event_type,
+            "data": data,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        # Logs are flushed on the log pipeline thread, which has no event loop;
+        # sends always go through the server loop attached by the API process
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+
+        # asyncio is only needed once WebSocket clients exist (API process)
+        import asyncio
+
+        # Send to all connected clients (in background to avoid blocking)
+        in_loop = self._in_event_loop()
+        for websocket in self.websocket_connections.copy():
+            coro = self._send_to_client(websocket, message)
+            if in_loop:
+                loop.create_task(coro)
+            else:
+                try:
+                    asyncio.run_coroutine_threadsafe(coro, loop)
+                except RuntimeError:
+                    # Loop shut down between the check and the call
+                    coro.close()
+                    return
+
+    async def _send_to_client(self, websocket, message):
+        """Send one message, dropping the client if the send fails"""
+        try:
+            await websocket.send_json(message)
+        except Exception:
+            self.websocket_connections.discard(websocket)
+    
+    def _in_event_loop(self):
+        """Check whether the caller runs inside the attached event loop"""
+        import asyncio
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _update_stats(self):
+        """Update statistics based on current scenarios"""
+        rooms = set()
+        time_buckets = set()
+        interaction_types = set()
+        total_actions = 0
+        
+        for scenario_group in self.scenarios.values():
+            for scenario in scenario_group:
+                if isinstance(scenario, dict):
+                    scenario_id = scenario.get("scenario_id", "")
+                    parts = scenario_id.split("|")
+                    if len(parts) > 0 and parts[0]:
+                        rooms.add(parts[0])
+                    if len(parts) > 1 and parts[1]:
+                        time_buckets.add(parts[1])
+                    if len(parts) > 4 and parts[4]:
+                        interaction_types.add(parts[4])
+                    
+                    actions = scenario.get("actions", [])
+                    total_actions += len(actions)
+        
+        self.stats.update({
+            "total_scenarios": sum(len(group) for group in self.scenarios.values()),
+            "total_actions": total_actions,
+            "rooms": sorted(list(rooms)),
+            "time_buckets": sorted(list(time_buckets)),
+            "interaction_types": sorted(list(interaction_types))
+        })
+
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """Get the process-wide shared state instance."""
+    global _shared_state
+    if _shared_state is None:
+        with _shared_state_lock:
+            if _shared_state is None:
+                _shared_state = SharedState()
+    return _shared_state
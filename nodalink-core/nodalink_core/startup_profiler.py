@@ -0,0 +1,56 @@
+"""
+Nodalink Startup Profiler
+Import-time breakdown and phase timings for app startup, reported through
+the engine status (/engine/status).
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+class StartupProfiler:
+    """Collects import and startup phase timings in milliseconds."""
+
+    def __init__(self, imports: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, Dict[str, Any]] = dict(imports or {})
+        self.phases: Dict[str, float] = {}
+        self.total_ms: Optional[float] = None
+
+    @contextmanager
+    def measure_import(self, name: str):
+        """Time an import block and count the modules it loaded."""
+        modules_before = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.imports[name] = {
+                "ms": round((time.perf_counter() - started) * 1000, 3),
+                "new_modules": len(sys.modules) - modules_before
+            }
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a startup phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 3)
+
+    def finish(self):
+        """Mark startup as complete."""
+        self.total_ms = round((time.perf_counter() - self.started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the profile as a JSON-serializable dict."""
+        return {
+            "complete": self.total_ms is not None,
+            "total_ms": self.total_ms,
+            "import_ms": round(sum(item["ms"] for item in self.imports.values()), 3),
+            "imports": self.imports,
+            "phases": self.phases
+        }
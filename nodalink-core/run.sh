@@ -106,11 +106,12 @@ export TZ="${TIME_ZONE:-UTC}"
 export SCENARIO_FILE="${SCENARIO_FILE:-/config/appdaemon/apps/Nodalink/scenarios.json}"
 export CONFIG_FILE="${CONFIG_FILE:-/config/appdaemon/apps/Nodalink/config.json}"
 export LOG_FILE="${LOG_FILE:-/config/appdaemon/apps/Nodalink/logs/unmatched_scenarios.log}"
+export JOURNAL_FILE="${JOURNAL_FILE:-/config/appdaemon/apps/Nodalink/logs/executions.db}"
 export TEST_MODE="${TEST_MODE:-false}"
 export API_PORT="${API_PORT:-8002}"
 export API_HOST="${API_HOST:-0.0.0.0}"
 export CORS_ORIGINS="${CORS_ORIGINS:-*}"
-export PYTHONPATH="/usr/share/nodalink-core/api:/usr/share/nodalink-core/apps:${PYTHONPATH:-}"
+export PYTHONPATH="/usr/share/nodalink-core:/usr/share/nodalink-core/api:/usr/share/nodalink-core/apps:${PYTHONPATH:-}"
 
 log_info "Starting Nodalink Core (Merged AppDaemon + FastAPI)..."
 log_info "Time zone: ${TIME_ZONE}"
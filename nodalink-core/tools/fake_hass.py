@@ -0,0 +1,453 @@
+"""
+Fake Hass
+In-process stand-in for the AppDaemon hass.Hass API surface used by
+NodalinkEngine and the other AppDaemon apps of the repository, so they can
+be driven and measured without AppDaemon or Home Assistant. It is the core
+of the trigger replay tool (tools/replay_triggers.py) and of the app
+benchmarks (benchmarks/run_benchmarks.py at the repository root).
+
+- Time is virtual: get_now() returns the fake clock, timers fire when the
+  clock is advanced past them (advance / advance_to).
+- Coroutine callbacks (async execution mode) run as tasks on a private
+  event loop, which is drained after every callback; a task blocked on
+  another (e.g. a queued execution) resumes once a later callback
+  releases it.
+- Every API call is counted, every service call is recorded, and the CPU
+  time of every callback is measured per callback name.
+- Service calls change the fake states (turn_on/turn_off/toggle, scene.apply,
+  volume_mute, light groups fan out to their members), optionally after a
+  virtual service_latency; api_latency adds real wall-clock latency to
+  every state-store round trip (get_state, call_service).
+
+Usage:
+    from fake_hass import load_app
+
+    app = load_app("../AppdaemonApps", "lightning", "Lightning", args, states)
+    app.initialize()
+    app.set_state("binary_sensor.presence_detector", "on")
+    app.advance(60)
+    print(app.get_stats())
+"""
+
+import asyncio
+import heapq
+import importlib
+import inspect
+import itertools
+import os
+import sys
+import time
+import types
+from collections import Counter
+from datetime import datetime, time as dt_time, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+# Domains whose turn_on/turn_off/toggle services the fake applies to states
+SWITCHABLE_DOMAINS = ("light", "switch", "fan", "input_boolean", "media_player")
+
+# Service data that is not stored as an attribute
+NON_ATTRIBUTE_DATA = ("entity_id", "transition")
+
+
+def install_hassapi():
+    """Make `appdaemon.plugins.hass.hassapi` importable when AppDaemon is not installed."""
+    try:
+        import appdaemon.plugins.hass.hassapi  # noqa: F401
+    except ImportError:
+        names = ["appdaemon", "appdaemon.plugins", "appdaemon.plugins.hass",
+                 "appdaemon.plugins.hass.hassapi"]
+        modules = [types.ModuleType(name) for name in names]
+        modules[-1].Hass = type("Hass", (), {})
+        for parent, child, name in zip(modules, modules[1:], names[1:]):
+            setattr(parent, name.rsplit(".", 1)[1], child)
+        for name, module in zip(names, modules):
+            sys.modules.setdefault(name, module)
+
+
+def _full_state(value: Any) -> Dict[str, Any]:
+    """Turn a bare state value or a state dict into a {"state", "attributes"} dict."""
+    if isinstance(value, dict) and "state" in value:
+        return {"state": value["state"], "attributes": dict(value.get("attributes") or {})}
+    return {"state": value, "attributes": {}}
+
+
+class FakeHass:
+    """
+    Fake hass.Hass API with a virtual clock and call recording.
+
+    Args:
+        args: App args (self.args)
+        states: Initial states, entity ID to a bare state or a state dict
+        start_time: Initial virtual time (default: now)
+        service_latency: Virtual seconds before a service call changes states
+        api_latency: Real seconds added to every get_state/call_service
+        apply_services: Whether service calls change the fake states
+        verbose: Print log lines to stderr
+    """
+
+    def __init__(self, args: Optional[Dict[str, Any]] = None,
+                 states: Optional[Dict[str, Any]] = None,
+                 start_time: Optional[datetime] = None,
+                 service_latency: float = 0.0, api_latency: float = 0.0,
+                 apply_services: bool = True, verbose: bool = False):
+        self.args = dict(args or {})
+        self.name = self.__class__.__name__
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.load_states(states or {})
+        self.now = start_time or datetime.now()
+        self.service_latency = service_latency
+        self.api_latency = api_latency
+        self.apply_services = apply_services
+        self.verbose = verbose
+
+        self.state_listeners: Dict[int, tuple] = {}
+        self.event_listeners: Dict[int, tuple] = {}
+        self.timers: List[tuple] = []
+        self.cancelled_timers = set()
+        self.repeating: Dict[int, float] = {}
+        self.service_calls: List[Dict[str, Any]] = []
+        self.log_lines: List[str] = []
+        self.errors: List[str] = []
+        self.api_calls: Counter = Counter()
+        self.callback_stats: Dict[str, Dict[str, float]] = {}
+        self.timer_stats = {"scheduled": 0, "cancelled": 0, "fired": 0}
+        self._handles = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Dict[asyncio.Task, str] = {}  # Pending tasks and their callback names
+
+    # Internals
+
+    def _count(self, method: str, round_trip: bool = False):
+        self.api_calls[method] += 1
+        if round_trip and self.api_latency > 0:
+            time.sleep(self.api_latency)
+
+    def _invoke(self, callback: Callable, *args):
+        """Run an app callback, timing its CPU use; errors are logged like AppDaemon does."""
+        name = getattr(callback, "__name__", repr(callback))
+        started = time.process_time()
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                if self._loop is None:
+                    self._loop = asyncio.new_event_loop()
+                self._tasks[self._loop.create_task(result)] = name
+        except Exception as e:
+            self._callback_failed(name, e)
+        if self._tasks:
+            self._drain()
+        stats = self.callback_stats.setdefault(name, {"calls": 0, "cpu_ms": 0.0})
+        stats["calls"] += 1
+        stats["cpu_ms"] += (time.process_time() - started) * 1000
+
+    def _callback_failed(self, name: str, error: BaseException):
+        self.errors.append(f"{name}: {error!r}")
+        self.log(f"Callback {name} failed: {error!r}", level="ERROR")
+
+    def _drain(self, max_iterations: int = 100):
+        """Run the private loop until its tasks are done or blocked."""
+        for _ in range(max_iterations):
+            self._loop.run_until_complete(asyncio.sleep(0))
+            for task in [task for task in self._tasks if task.done()]:
+                name = self._tasks.pop(task)
+                if not task.cancelled() and task.exception() is not None:
+                    self._callback_failed(name, task.exception())
+            if not self._tasks:
+                break
+
+    def _schedule(self, due: datetime, callback: Callable, kwargs: Dict[str, Any],
+                  interval: Optional[float] = None, internal: bool = False) -> int:
+        handle = next(self._handles)
+        heapq.heappush(self.timers, (due, handle, callback, kwargs, internal))
+        if interval is not None:
+            self.repeating[handle] = interval
+        if not internal:
+            self.timer_stats["scheduled"] += 1
+        return handle
+
+    def _start_time(self, start: Any) -> datetime:
+        """Resolve a run_every/run_daily start ("now", "now+N", datetime or time)."""
+        if start is None or start == "now":
+            return self.now
+        if isinstance(start, str) and start.startswith("now+"):
+            return self.now + timedelta(seconds=float(start[4:]))
+        if isinstance(start, str):
+            start = dt_time.fromisoformat(start)
+        if isinstance(start, dt_time):
+            first = datetime.combine(self.now.date(), start, self.now.tzinfo)
+            return first if first > self.now else first + timedelta(days=1)
+        return max(start, self.now)
+
+    # Hass API surface
+
+    def log(self, msg: str, level: str = "INFO", **kwargs):
+        self._count("log")
+        self.log_lines.append(f"{level} {msg}")
+        if self.verbose:
+            print(f"[{self.now.isoformat()}] {level} {msg}", file=sys.stderr)
+
+    def get_now(self) -> datetime:
+        self._count("get_now")
+        return self.now
+
+    def datetime(self) -> datetime:
+        self._count("datetime")
+        return self.now
+
+    def get_state(self, entity_id: Optional[str] = None, attribute: Optional[str] = None,
+                  default: Any = None, **kwargs) -> Any:
+        self._count("get_state", round_trip=True)
+        if entity_id is None:
+            return {entity: {"entity_id": entity, **state} for entity, state in self.states.items()}
+        state = self.states.get(entity_id)
+        if state is None:
+            return default
+        if attribute == "all":
+            return {"entity_id": entity_id, "state": state["state"],
+                    "attributes": dict(state["attributes"])}
+        if attribute is not None:
+            return state["attributes"].get(attribute, default)
+        return state["state"]
+
+    def listen_state(self, callback: Callable, entity_id: Optional[str] = None, **kwargs) -> int:
+        self._count("listen_state")
+        handle = next(self._handles)
+        self.state_listeners[handle] = (entity_id, callback, kwargs)
+        return handle
+
+    def listen_event(self, callback: Callable, event: Optional[str] = None, **kwargs) -> int:
+        self._count("listen_event")
+        handle = next(self._handles)
+        self.event_listeners[handle] = (event, callback, kwargs)
+        return handle
+
+    def cancel_listen_state(self, handle: int):
+        self._count("cancel_listen_state")
+        self.state_listeners.pop(handle, None)
+
+    def cancel_listen_event(self, handle: int):
+        self._count("cancel_listen_event")
+        self.event_listeners.pop(handle, None)
+
+    def call_service(self, service: str, **kwargs) -> None:
+        self._count("call_service", round_trip=True)
+        self.service_calls.append({
+            "time": self.now.isoformat(),
+            "service": service.replace("/", "."),
+            "data": kwargs
+        })
+        if not self.apply_services:
+            return
+        if self.service_latency > 0:
+            self._schedule(self.now + timedelta(seconds=self.service_latency),
+                           self._apply_service, {"service": service, "data": kwargs},
+                           internal=True)
+        else:
+            self._apply_service({"service": service, "data": kwargs})
+
+    def turn_on(self, entity_id: str, **kwargs):
+        self._count("turn_on")
+        self.call_service(f"{entity_id.split('.', 1)[0]}/turn_on", entity_id=entity_id, **kwargs)
+
+    def turn_off(self, entity_id: str, **kwargs):
+        self._count("turn_off")
+        self.call_service(f"{entity_id.split('.', 1)[0]}/turn_off", entity_id=entity_id, **kwargs)
+
+    def run_in(self, callback: Callable, delay: float, **kwargs) -> int:
+        self._count("run_in")
+        return self._schedule(self.now + timedelta(seconds=delay), callback, kwargs)
+
+    def run_every(self, callback: Callable, start: Any, interval: float, **kwargs) -> int:
+        self._count("run_every")
+        return self._schedule(self._start_time(start), callback, kwargs, interval)
+
+    def run_daily(self, callback: Callable, start: Any, **kwargs) -> int:
+        self._count("run_daily")
+        return self._schedule(self._start_time(start), callback, kwargs, 86400)
+
+    def cancel_timer(self, handle: int):
+        self._count("cancel_timer")
+        if handle not in self.cancelled_timers:
+            self.cancelled_timers.add(handle)
+            self.timer_stats["cancelled"] += 1
+        self.repeating.pop(handle, None)
+
+    def timer_running(self, handle: int) -> bool:
+        self._count("timer_running")
+        return handle not in self.cancelled_timers and any(
+            timer[1] == handle for timer in self.timers)
+
+    # Service effects
+
+    def _apply_service(self, kwargs: Dict[str, Any]):
+        domain, service = kwargs["service"].replace(".", "/").split("/", 1)
+        data = kwargs["data"]
+
+        if domain == "scene" and service == "apply":
+            for entity_id, value in (data.get("entities") or {}).items():
+                value = _full_state(value)
+                self._set_light(entity_id, value["state"], value["attributes"])
+            return
+
+        entity_ids = data.get("entity_id") or []
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+
+        if service == "volume_mute":
+            for entity_id in entity_ids:
+                self.set_state(entity_id, attributes={"is_volume_muted": data.get("is_volume_muted")})
+            return
+        if domain not in SWITCHABLE_DOMAINS and domain != "homeassistant":
+            return
+
+        attributes = {key: value for key, value in data.items() if key not in NON_ATTRIBUTE_DATA}
+        for entity_id in entity_ids:
+            if service == "toggle":
+                current = self.states.get(entity_id, {}).get("state")
+                self._set_light(entity_id, "off" if current == "on" else "on", attributes)
+            elif service in ("turn_on", "turn_off"):
+                self._set_light(entity_id, service[5:], attributes)
+
+    def _set_light(self, entity_id: str, state: str, attributes: Dict[str, Any]):
+        """Set a switchable entity; groups (entity_id attribute) fan out to their members."""
+        if "rgb_color" in attributes:
+            attributes = {**attributes, "color_mode": "rgb"}
+        elif "color_temp" in attributes:
+            attributes = {**attributes, "color_mode": "color_temp"}
+        members = self.states.get(entity_id, {}).get("attributes", {}).get("entity_id")
+        if isinstance(members, (list, tuple)):
+            for member in members:
+                self.set_state(member, state, attributes if state == "on" else None)
+        self.set_state(entity_id, state, attributes if state == "on" else None)
+
+    # Driving
+
+    def load_states(self, states: Dict[str, Any]):
+        """Set states (bare values or state dicts) without running any listeners."""
+        for entity_id, value in states.items():
+            self.states[entity_id] = _full_state(value)
+
+    def set_state(self, entity_id: str, state: Any = None,
+                  attributes: Optional[Dict[str, Any]] = None,
+                  replace_attributes: bool = False):
+        """
+        Change an entity's state and run the listeners as AppDaemon would.
+
+        Args:
+            entity_id: Entity to change
+            state: New state (None keeps the current state)
+            attributes: Attributes to merge in (or replace with)
+            replace_attributes: Replace the attributes instead of merging
+        """
+        old = self.states.get(entity_id) or {"state": None, "attributes": {}}
+        new_attributes = {} if replace_attributes else dict(old["attributes"])
+        new_attributes.update(attributes or {})
+        new = {"state": old["state"] if state is None else state, "attributes": new_attributes}
+        self.states[entity_id] = new
+
+        for entity, callback, kwargs in list(self.state_listeners.values()):
+            if entity is not None and entity != entity_id and (
+                    "." in entity or not entity_id.startswith(entity + ".")):
+                continue
+            attribute = kwargs.get("attribute")
+            if attribute == "all":
+                old_value = {"entity_id": entity_id, **old}
+                new_value = {"entity_id": entity_id, **new}
+                if old_value == new_value:
+                    continue
+            elif attribute is not None:
+                old_value = old["attributes"].get(attribute)
+                new_value = new_attributes.get(attribute)
+                if old_value == new_value:
+                    continue
+            else:
+                old_value, new_value = old["state"], new["state"]
+                if old_value == new_value:
+                    continue
+            if "new" in kwargs and kwargs["new"] != new_value:
+                continue
+            if "old" in kwargs and kwargs["old"] != old_value:
+                continue
+            self._invoke(callback, entity_id, attribute or "state", old_value, new_value, kwargs)
+
+    def fire_event(self, event_name: str, data: Optional[Dict[str, Any]] = None):
+        """Fire an event to the matching event listeners."""
+        for event, callback, kwargs in list(self.event_listeners.values()):
+            if event is None or event == event_name:
+                self._invoke(callback, event_name, dict(data or {}), kwargs)
+
+    def advance_to(self, when: datetime):
+        """Move the virtual clock forward, firing timers that fall due."""
+        while self.timers and self.timers[0][0] <= when:
+            due, handle, callback, kwargs, internal = heapq.heappop(self.timers)
+            if handle in self.cancelled_timers:
+                if handle not in self.repeating:
+                    self.cancelled_timers.discard(handle)
+                continue
+            self.now = max(self.now, due)
+            if handle in self.repeating:
+                heapq.heappush(self.timers, (due + timedelta(seconds=self.repeating[handle]),
+                                             handle, callback, kwargs, internal))
+            if internal:
+                callback(kwargs)
+            else:
+                self.timer_stats["fired"] += 1
+                self._invoke(callback, kwargs)
+        self.now = max(self.now, when)
+
+    def advance(self, seconds: float):
+        """Move the virtual clock forward by a number of seconds."""
+        self.advance_to(self.now + timedelta(seconds=seconds))
+
+    def pending_timers(self) -> int:
+        """Number of app timers still scheduled."""
+        return sum(1 for timer in self.timers
+                   if not timer[4] and timer[1] not in self.cancelled_timers)
+
+    def reset_stats(self):
+        """Clear the recorded calls and counters (e.g. after initialize)."""
+        self.service_calls = []
+        self.log_lines = []
+        self.errors = []
+        self.api_calls = Counter()
+        self.callback_stats = {}
+        self.timer_stats = {"scheduled": 0, "cancelled": 0, "fired": 0}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get service call, API call, timer and callback CPU counters."""
+        services = Counter(call["service"] for call in self.service_calls)
+        return {
+            "service_calls": len(self.service_calls),
+            "service_calls_by_service": dict(services),
+            "api_calls": dict(self.api_calls),
+            "timers": {**self.timer_stats, "pending": self.pending_timers()},
+            "callbacks": {name: dict(stats) for name, stats in self.callback_stats.items()},
+            "callback_cpu_ms": sum(stats["cpu_ms"] for stats in self.callback_stats.values()),
+            "errors": len(self.errors)
+        }
+
+
+def load_app(path: str, module: str, class_name: str, args: Optional[Dict[str, Any]] = None,
+             states: Optional[Dict[str, Any]] = None, **options: Any) -> Any:
+    """
+    Create an app bound to a FakeHass instead of AppDaemon.
+
+    Args:
+        path: App directory (AppDaemon's app_dir), added to sys.path
+        module: Top-level module name as in apps.yaml, e.g. "lightning" or
+            "scenario_engine"
+        class_name: App class in the module
+        args: App args
+        states: Initial states
+        options: FakeHass options (start_time, service_latency, ...)
+
+    Returns:
+        App instance (initialize() not called yet)
+    """
+    install_hassapi()
+    path = os.path.abspath(path)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    app_class = getattr(importlib.import_module(module), class_name)
+    fake_class = type(f"Fake{class_name}", (FakeHass, app_class), {})
+    return fake_class(args, states, **options)
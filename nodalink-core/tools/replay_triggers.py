@@ -0,0 +1,261 @@
+"""
+Nodalink Trigger Replay
+Replays a trigger recording (see apps/trigger_recorder.py) against a
+NodalinkEngine running on FakeHass (tools/fake_hass.py) instead of AppDaemon,
+and reports per-event latency, match results and the service calls issued.
+
+Usage:
+    python tools/replay_triggers.py recording.ndjson \\
+        --scenarios apps/scenarios.json --config apps/Nodalink/config.json \\
+        --speed 0 --report report.json
+"""
+
+import argparse
+import inspect
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fake_hass import FakeHass, install_hassapi
+
+CORE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ReplayHass(FakeHass):
+    """
+    FakeHass for trigger replays.
+
+    Service calls are recorded but leave the states alone (the recording
+    holds the states that matter), and recorded state changes are delivered
+    with their recorded old value.
+    """
+
+    def __init__(self, args: Dict[str, Any], states: Optional[Dict[str, Any]] = None,
+                 start_time: Optional[datetime] = None, verbose: bool = False):
+        super().__init__(args, states, start_time, apply_services=False, verbose=verbose)
+
+    def fire_state(self, entity_id: str, new: Any, old: Any = None):
+        """Deliver a recorded state change to the state listeners."""
+        if old is not None:
+            self.load_states({entity_id: old})
+        self.set_state(entity_id, new)
+
+
+def load_recording(path: str) -> List[Dict[str, Any]]:
+    """Load an NDJSON trigger recording."""
+    records = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    records.sort(key=lambda record: record.get("t", 0))
+    return records
+
+
+def build_engine(args: Dict[str, Any], states: Dict[str, Any], start_time: datetime,
+                 shared_state: bool = False, verbose: bool = False):
+    """Create a NodalinkEngine bound to a ReplayHass instead of AppDaemon."""
+    install_hassapi()
+    # Like the add-on: the add-on root on PYTHONPATH, apps/ as AppDaemon's app_dir
+    for path in (CORE_DIR, os.path.join(CORE_DIR, "apps")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import scenario_engine
+
+    if not shared_state:
+        scenario_engine.SHARED_STATE_AVAILABLE = False
+
+    class ReplayEngine(ReplayHass, scenario_engine.NodalinkEngine):
+        pass
+
+    engine = ReplayEngine(args, states=states, start_time=start_time, verbose=verbose)
+    engine.initialize()
+    return engine
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": statistics.fmean(ordered),
+        "p50_ms": ordered[len(ordered) // 2],
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max_ms": ordered[-1]
+    }
+
+
+def replay(engine: ReplayHass, records: List[Dict[str, Any]], speed: float = 0.0,
+           time_zone=None) -> Dict[str, Any]:
+    """
+    Feed recorded triggers to the engine.
+
+    Args:
+        engine: Engine built by build_engine
+        records: Records from load_recording
+        speed: 0 replays as fast as possible, 1 in real time, N at N x speed
+        time_zone: tzinfo used to turn recorded timestamps into engine time
+
+    Returns:
+        Report with per-event results and a summary
+    """
+    matches: List[Dict[str, Any]] = []
+    pipeline = engine.pipeline
+    if engine.execution_mode == "async":
+        match_context = pipeline.async_stages.get("match") or pipeline.stages["match"]
+    else:
+        match_context = pipeline.stages["match"]
+
+    def recording_match_context(context):
+        match = match_context(context)
+        if inspect.isawaitable(match):
+            return record_match_async(context, match)
+        return record_match(context, match)
+
+    async def record_match_async(context, pending):
+        return record_match(context, await pending)
+
+    def record_match(context, match):
+        trigger = context.trigger
+        matches.append({
+            "context": [trigger.room, context.time_bucket, context.day_type,
+                        list(context.optional_flags), trigger.interaction_type],
+            "matched": match is not None,
+            "scenario_id": match.scenario_id if match else None,
+            "fallback_level": match.fallback_level if match else None
+        })
+        return match
+
+    engine.pipeline.replace_stage("match", recording_match_context)
+
+    results = []
+    latencies = []
+    error_count = 0
+    wall_start = time.perf_counter()
+    first_t = None
+
+    for record in records:
+        kind = record.get("k")
+        t = record.get("t", 0)
+        if first_t is None:
+            first_t = t
+
+        if speed > 0:
+            delay = (t - first_t) / speed - (time.perf_counter() - wall_start)
+            if delay > 0:
+                time.sleep(delay)
+
+        engine.advance_to(datetime.fromtimestamp(t, time_zone))
+
+        if kind == "snapshot":
+            engine.load_states(record.get("states", {}))
+            continue
+
+        calls_before = len(engine.service_calls)
+        matches_before = len(matches)
+        logs_before = len(engine.log_lines)
+        callback_errors_before = len(engine.errors)
+
+        started = time.perf_counter()
+        if kind == "event":
+            engine.fire_event(record["n"], record.get("d", {}))
+        elif kind == "state":
+            engine.fire_state(record["e"], record.get("s"), record.get("o"))
+        else:
+            continue
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        latencies.append(latency_ms)
+        errors = [line for line in engine.log_lines[logs_before:] if "❌" in line]
+        errors += engine.errors[callback_errors_before:]
+        error_count += len(errors)
+        results.append({
+            "t": t,
+            "kind": kind,
+            "trigger": record.get("n") or record.get("e"),
+            "latency_ms": latency_ms,
+            "matches": matches[matches_before:],
+            "service_calls": engine.service_calls[calls_before:],
+            "errors": errors
+        })
+
+    # Let pending timers run out
+    if engine.timers:
+        engine.advance_to(max(timer[0] for timer in engine.timers))
+
+    service_counts: Dict[str, int] = {}
+    for call in engine.service_calls:
+        service_counts[call["service"]] = service_counts.get(call["service"], 0) + 1
+
+    return {
+        "results": results,
+        "summary": {
+            "events": len(results),
+            "matched": sum(1 for match in matches if match["matched"]),
+            "unmatched": sum(1 for match in matches if not match["matched"]),
+            "errors": error_count,
+            "service_calls": len(engine.service_calls),
+            "service_calls_by_service": service_counts,
+            "latency": _latency_summary(latencies),
+            "wall_time_s": time.perf_counter() - wall_start
+        }
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded Nodalink triggers offline")
+    parser.add_argument("recording", help="NDJSON file written by the trigger recorder")
+    parser.add_argument("--scenarios", default=os.path.join(CORE_DIR, "apps", "scenarios.json"))
+    parser.add_argument("--config", default=os.path.join(CORE_DIR, "apps", "Nodalink", "config.json"))
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="0 = as fast as possible, 1 = real time, N = N x speed")
+    parser.add_argument("--time-zone", default=None, help="IANA zone for engine time, e.g. Europe/Stockholm")
+    parser.add_argument("--report", help="Write the full JSON report to this file")
+    parser.add_argument("--journal", help="Write an execution journal (SQLite) to this file")
+    parser.add_argument("--shared-state", action="store_true",
+                        help="Attach the engine to the FastAPI shared state")
+    parser.add_argument("--verbose", action="store_true", help="Print engine log lines")
+    options = parser.parse_args(argv)
+
+    time_zone = None
+    if options.time_zone:
+        from zoneinfo import ZoneInfo
+        time_zone = ZoneInfo(options.time_zone)
+
+    records = load_recording(options.recording)
+    if not records:
+        print("Recording is empty", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        args = {
+            "scenario_file": options.scenarios,
+            "config_file": options.config,
+            "log_file": os.path.join(work_dir, "unmatched_scenarios.log"),
+            "journal_file": options.journal
+        }
+        engine = build_engine(args, {}, datetime.fromtimestamp(records[0]["t"], time_zone),
+                              options.shared_state, options.verbose)
+        report = replay(engine, records, options.speed, time_zone)
+        if engine.journal:
+            engine.journal.stop()
+
+    if options.report:
+        with open(options.report, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    print(json.dumps(report["summary"], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())